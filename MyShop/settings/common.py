@@ -147,6 +147,12 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# The default handlers, hashing uploads while they stream in (store.uploads)
+FILE_UPLOAD_HANDLERS = [
+    'store.uploads.HashingMemoryFileUploadHandler',
+    'store.uploads.HashingTemporaryFileUploadHandler',
+]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -190,7 +196,27 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'InternetShop.tasks.notify_customers',
         'schedule': 5,
         'args': ['Hello World'],
-    }
+    },
+    'release_expired_reservations': {
+        'task': 'store.tasks.release_expired_reservations',
+        'schedule': 60,
+    },
+    'update_related_products': {
+        'task': 'store.tasks.update_related_products',
+        'schedule': 60 * 60,
+    },
+    'update_bestsellers': {
+        'task': 'store.tasks.update_bestsellers',
+        'schedule': 10 * 60,
+    },
+    'collect_garbage': {
+        'task': 'store.tasks.collect_garbage',
+        'schedule': 60 * 60,
+    },
+    'flush_like_counts': {
+        'task': 'likes.tasks.flush_like_counts',
+        'schedule': 10,
+    },
 }
 
 CACHES = {
@@ -204,6 +230,78 @@ CACHES = {
     }
 }
 
+# Cached /store/products/ responses are invalidated by catalog version
+# counters, the timeout only bounds how long unused entries are kept.
+STORE_CATALOG_CACHE_TIMEOUT = 60 * 60
+# Cached cart summaries (/store/carts/<id>/summary/) follow cart versions,
+# the timeout bounds how long those of abandoned carts are kept
+STORE_CART_SUMMARY_TIMEOUT = 60 * 60
+
+# 'redis' keeps new carts in Redis hashes (needs the django_redis cache)
+# until checkout or login, expiring N seconds after their last change;
+# 'database' stores every cart as rows
+STORE_CART_BACKEND = 'database'
+STORE_CART_TTL = 7 * 24 * 60 * 60
+
+# store.tasks.collect_garbage deletes carts without a customer this many
+# seconds after their last change, and fails orders still pending this
+# long after checkout (guest carts are left behind by checkouts)
+STORE_ANONYMOUS_CART_TTL = 30 * 24 * 60 * 60
+STORE_CHECKOUT_WINDOW = 24 * 60 * 60
+
+# Text search configuration of the PostgreSQL product search index
+STORE_SEARCH_CONFIG = 'simple'
+
+# Serve product list filtering/sorting from an in-memory snapshot (needs
+# NumPy), polling the database for changes at most every N seconds
+STORE_CATALOG_SNAPSHOT = False
+STORE_CATALOG_SNAPSHOT_INTERVAL = 5
+
+# Product title suggestions (store.suggest): poll for changed products at
+# most every N seconds, reload order counts every M seconds
+STORE_SUGGEST_INTERVAL = 5
+STORE_SUGGEST_REBUILD_INTERVAL = 10 * 60
+
+# Read product, collection and cart endpoints through QuerySet.values()
+# serializers (store.values) instead of the DRF ModelSerializers
+STORE_VALUES_SERIALIZATION = True
+
+# Products upserted per statement by catalog imports (store.imports)
+STORE_IMPORT_BATCH_SIZE = 2000
+
+# Rows fetched per server-side cursor round trip by exports (store.exports)
+STORE_EXPORT_CHUNK_SIZE = 2000
+
+# Default price histogram edges of /store/products/facets/
+STORE_FACET_PRICE_EDGES = ['10', '25', '50', '100', '250']
+
+# Derivatives rendered for every product image (store.images), as WebP and
+# JPEG; sizes are bounding boxes, cropped ones are filled exactly. Without
+# async they are rendered in the request saving the image.
+STORE_IMAGE_VARIANTS = {
+    'thumb': {'size': (150, 150), 'crop': True},
+    'card': {'size': (400, 400)},
+    'detail': {'size': (1200, 1200)},
+}
+STORE_IMAGE_VARIANTS_ASYNC = True
+# Seconds a pending order holds its items before they return to stock
+STORE_RESERVATION_TTL = 30 * 60
+# Frequently bought together (store.recommendations): neighbours kept per
+# product, and how many /store/products/<id>/related/ returns
+STORE_RELATED_PRODUCTS_KEEP = 50
+STORE_RELATED_PRODUCTS_LIMIT = 10
+# Trending products count sales with this half-life, in seconds (changing
+# it needs `manage.py update_bestsellers --rebuild`)
+STORE_TRENDING_HALF_LIFE = 7 * 24 * 60 * 60
+# Seconds before the ranking jobs count a completed order, so payments
+# still committing when a job runs are not skipped past
+STORE_RANKINGS_DELAY = 60
+
+# Like counts are split over this many rows per object, written by
+# likes.tasks.flush_like_counts from the Redis buffer, or by each like to a
+# random shard when there is no Redis (see likes.counters)
+LIKES_COUNTER_SHARDS = 8
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
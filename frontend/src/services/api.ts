@@ -3,9 +3,15 @@ import {
   User,
   Customer,
   Product,
+  ProductFacets,
+  ProductSuggestion,
+  ProductLikes,
+  CursorPage,
   Collection,
   Review,
   Cart,
+  CartSummary,
+  CartOperation,
   CartItem,
   Order,
   Address,
@@ -81,12 +87,65 @@ class ApiService {
     page?: number;
     search?: string;
     collection_id?: number;
+    tag?: string;
     ordering?: string;
   }): Promise<{ results: Product[]; count: number }> {
     const response: AxiosResponse<{ results: Product[]; count: number }> = await this.api.get('/store/products/', { params });
     return response.data;
   }
 
+  async getProductFacets(params?: {
+    search?: string;
+    collection_id?: number;
+    tag?: string;
+    unit_price__lt?: number;
+    unit_price__gt?: number;
+    price_buckets?: string;
+  }): Promise<ProductFacets> {
+    const response: AxiosResponse<ProductFacets> = await this.api.get('/store/products/facets/', { params });
+    return response.data;
+  }
+
+  async getRelatedProducts(productId: number): Promise<Product[]> {
+    const response: AxiosResponse<Product[]> = await this.api.get(`/store/products/${productId}/related/`);
+    return response.data;
+  }
+
+  async getBestsellers(params?: {
+    collection_id?: number;
+    ranking?: 'units' | 'trending';
+    limit?: number;
+  }): Promise<Product[]> {
+    const { collection_id, ...query } = params || {};
+    const url = collection_id ? `/store/collections/${collection_id}/bestsellers/` : '/store/products/bestsellers/';
+    const response: AxiosResponse<Product[]> = await this.api.get(url, { params: query });
+    return response.data;
+  }
+
+  async getProductSuggestions(q: string, limit?: number): Promise<ProductSuggestion[]> {
+    const response: AxiosResponse<ProductSuggestion[]> = await this.api.get('/store/products/suggest/', {
+      params: { q, limit },
+    });
+    return response.data;
+  }
+
+  async getProductLikes(productIds: number[]): Promise<ProductLikes[]> {
+    const response: AxiosResponse<ProductLikes[]> = await this.api.get('/store/products/likes/', {
+      params: { ids: productIds.join(',') },
+    });
+    return response.data;
+  }
+
+  async likeProduct(productId: number): Promise<Omit<ProductLikes, 'id'>> {
+    const response: AxiosResponse<Omit<ProductLikes, 'id'>> = await this.api.post(`/store/products/${productId}/like/`);
+    return response.data;
+  }
+
+  async unlikeProduct(productId: number): Promise<Omit<ProductLikes, 'id'>> {
+    const response: AxiosResponse<Omit<ProductLikes, 'id'>> = await this.api.delete(`/store/products/${productId}/like/`);
+    return response.data;
+  }
+
   async getAllProducts(): Promise<Product[]> {
     const response: AxiosResponse<{ results: Product[]; count: number } | Product[]> = await this.api.get('/store/products/', { 
       params: { page_size: 1000 } // Get all products
@@ -99,8 +158,11 @@ class ApiService {
     return response.data;
   }
 
-  async getProductReviews(productId: number): Promise<Review[]> {
-    const response: AxiosResponse<Review[]> = await this.api.get(`/store/products/${productId}/reviews/`);
+  // Newest first; pass the `next` link of the previous page to continue
+  async getProductReviews(productId: number, next?: string): Promise<CursorPage<Review>> {
+    const response: AxiosResponse<CursorPage<Review>> = await this.api.get(
+      next || `/store/products/${productId}/reviews/`
+    );
     return response.data;
   }
 
@@ -131,6 +193,11 @@ class ApiService {
     return response.data;
   }
 
+  async getCartSummary(cartId: string): Promise<CartSummary> {
+    const response: AxiosResponse<CartSummary> = await this.api.get(`/store/carts/${cartId}/summary/`);
+    return response.data;
+  }
+
   async addToCart(productId: number, quantity: number): Promise<CartItem> {
     // First get or create cart
     let cartId = localStorage.getItem('cart_id');
@@ -158,6 +225,13 @@ class ApiService {
     await this.api.delete(`/store/carts/${cartId}/items/${itemId}/`);
   }
 
+  async updateCartItems(cartId: string, operations: CartOperation[]): Promise<Cart> {
+    const response: AxiosResponse<Cart> = await this.api.post(`/store/carts/${cartId}/items/batch/`, {
+      operations,
+    });
+    return response.data;
+  }
+
   async deleteCart(cartId: string): Promise<void> {
     await this.api.delete(`/store/carts/${cartId}/`);
   }
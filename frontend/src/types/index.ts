@@ -40,6 +40,8 @@ export interface Collection {
 export interface ProductImage {
   id: number;
   image: string;
+  // thumb, card and detail derivatives; empty until they are rendered
+  variants: Record<string, { webp: string; jpeg: string }>;
 }
 
 export interface Product {
@@ -47,13 +49,42 @@ export interface Product {
   title: string;
   description?: string;
   unit_price: number;
+  effective_price: number;
   inventory: number;
   price_with_tax: number;
   collection: string;
+  reviews_count: number;
+  last_review_at: string | null;
+  tags: string[];
   images: ProductImage[];
   last_update: string;
 }
 
+export interface ProductFacets {
+  count: number;
+  collections: { id: number; title: string; count: number }[];
+  price: { min: string | null; max: string | null; count: number }[];
+  in_stock: number;
+}
+
+export interface CursorPage<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
+export interface ProductSuggestion {
+  id: number;
+  title: string;
+  slug: string;
+}
+
+export interface ProductLikes {
+  id: number;
+  likes_count: number;
+  liked: boolean;
+}
+
 export interface Review {
   id: number;
   product: number;
@@ -81,6 +112,15 @@ export interface Cart {
   total_price: number;
 }
 
+export interface CartSummary {
+  items_count: number;
+  total_price: number;
+}
+
+export type CartOperation =
+  | { op: 'add' | 'set'; product_id: number; quantity: number }
+  | { op: 'remove'; product_id: number };
+
 export interface OrderItem {
   id: number;
   product: {
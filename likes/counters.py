@@ -0,0 +1,190 @@
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Sum
+from rest_framework.exceptions import ValidationError
+
+from .models import LikeCounter, LinkedItem
+
+# Like counts without a COUNT(*) per read or an UPDATE of one hot row per
+# like. LinkedItem rows stay the source of truth (one per user and object),
+# like() and unlike() add +1/-1 to a LikeCounter shard.
+#
+# With the django-redis cache the deltas go to a Redis hash shared by all
+# processes once their row change commits, and the flush_like_counts task
+# adds them to LikeCounter in bulk, one shard per run; counts read through
+# get_counts() include the pending deltas. Failed flushes put their deltas
+# back, those of a worker killed mid-flush are lost, and `manage.py
+# recount_likes` rebuilds the counters from LinkedItem. Without Redis the
+# delta is written to a random shard in the transaction of the row change.
+PENDING_KEY = 'likes:pending'
+MAX_IDS = 100
+
+
+def _field(content_type_id, object_id):
+    return f'{content_type_id}:{object_id}'
+
+
+class RedisBuffer:
+    def __init__(self, client):
+        self.client = client
+
+    def add(self, content_type_id, object_id, delta):
+        self.client.hincrby(PENDING_KEY, _field(content_type_id, object_id), delta)
+
+    def get_many(self, content_type_id, object_ids):
+        values = self.client.hmget(PENDING_KEY, [_field(content_type_id, id) for id in object_ids])
+        return {id: int(value) for id, value in zip(object_ids, values) if value}
+
+    def drain(self):
+        # Read and clear in one MULTI/EXEC, likes added meanwhile wait for the next run
+        pipeline = self.client.pipeline()
+        pipeline.hgetall(PENDING_KEY)
+        pipeline.delete(PENDING_KEY)
+        pending, _ = pipeline.execute()
+        deltas = {}
+        for field, value in pending.items():
+            content_type_id, object_id = field.decode().split(':')
+            if int(value):
+                deltas[int(content_type_id), int(object_id)] = int(value)
+        return deltas
+
+    def restore(self, deltas):
+        pipeline = self.client.pipeline()
+        for (content_type_id, object_id), delta in deltas.items():
+            pipeline.hincrby(PENDING_KEY, _field(content_type_id, object_id), delta)
+        pipeline.execute()
+
+
+def get_buffer():
+    """The Redis buffer of pending deltas, None without the django-redis cache."""
+    if settings.CACHES['default']['BACKEND'] == 'django_redis.cache.RedisCache':
+        from django_redis import get_redis_connection
+        return RedisBuffer(get_redis_connection('default'))
+    return None
+
+
+def _count(content_type_id, object_id, delta):
+    # Called in the transaction changing the LinkedItem row
+    buffer = get_buffer()
+    if buffer is None:
+        add_counts({(content_type_id, object_id): delta}, random.randrange(settings.LIKES_COUNTER_SHARDS))
+    else:
+        transaction.on_commit(lambda: buffer.add(content_type_id, object_id, delta))
+
+
+def like(user, obj):
+    """Like `obj` as `user`, returns False if it was liked already."""
+    content_type = ContentType.objects.get_for_model(obj)
+    try:
+        with transaction.atomic():
+            LinkedItem.objects.create(user=user, content_type=content_type, object_id=obj.pk)
+            _count(content_type.pk, obj.pk, 1)
+    except IntegrityError:
+        return False
+    return True
+
+
+def unlike(user, obj):
+    """Remove the like of `user` from `obj`, returns False if there was none."""
+    content_type = ContentType.objects.get_for_model(obj)
+    with transaction.atomic():
+        deleted, _ = LinkedItem.objects.filter(user=user, content_type=content_type, object_id=obj.pk).delete()
+        if deleted:
+            _count(content_type.pk, obj.pk, -1)
+    return bool(deleted)
+
+
+def parse_ids(value):
+    """Distinct object ids of a comma separated ?ids= parameter, in order."""
+    parts = [part.strip() for part in (value or '').split(',') if part.strip()]
+    if not all(part.isdigit() for part in parts) or not 1 <= len(parts) <= MAX_IDS:
+        raise ValidationError({'ids': f'Expected 1 to {MAX_IDS} comma separated ids.'})
+    return list(dict.fromkeys(int(part) for part in parts))
+
+
+def get_counts(model, object_ids):
+    """Like counts by object id (including unflushed likes), one query."""
+    content_type = ContentType.objects.get_for_model(model)
+    object_ids = list(object_ids)
+    counts = dict.fromkeys(object_ids, 0)
+    for object_id, count in LikeCounter.objects \
+            .filter(content_type=content_type, object_id__in=object_ids) \
+            .values('object_id') \
+            .annotate(total=Sum('count')) \
+            .values_list('object_id', 'total'):
+        counts[object_id] = count
+    buffer = get_buffer()
+    if buffer is not None:
+        for object_id, delta in buffer.get_many(content_type.pk, object_ids).items():
+            counts[object_id] += delta
+    return counts
+
+
+def get_liked(user, model, object_ids):
+    """Ids among `object_ids` liked by `user`, one query on the unique index."""
+    if not user.is_authenticated:
+        return set()
+    content_type = ContentType.objects.get_for_model(model)
+    return set(LinkedItem.objects
+               .filter(user=user, content_type=content_type, object_id__in=list(object_ids))
+               .values_list('object_id', flat=True))
+
+
+def add_counts(deltas, shard):
+    by_type = defaultdict(dict)
+    for (content_type_id, object_id), delta in deltas.items():
+        by_type[content_type_id][object_id] = delta
+    with transaction.atomic():
+        for content_type_id, objects in by_type.items():
+            # Create the missing rows first, then lock them all in id order
+            LikeCounter.objects.bulk_create(
+                (LikeCounter(content_type_id=content_type_id, object_id=object_id, shard=shard)
+                 for object_id in objects),
+                ignore_conflicts=True)
+            rows = list(LikeCounter.objects
+                        .select_for_update()
+                        .filter(content_type_id=content_type_id, shard=shard, object_id__in=list(objects))
+                        .order_by('object_id'))
+            for row in rows:
+                row.count += objects[row.object_id]
+            LikeCounter.objects.bulk_update(rows, ['count'], batch_size=1000)
+
+
+def flush(shard=None):
+    """Add the buffered deltas to LikeCounter, returns the number of objects updated."""
+    buffer = get_buffer()
+    if buffer is None:
+        return 0
+    deltas = buffer.drain()
+    if not deltas:
+        return 0
+    if shard is None:
+        shard = random.randrange(settings.LIKES_COUNTER_SHARDS)
+    try:
+        add_counts(deltas, shard)
+    except Exception:
+        buffer.restore(deltas)
+        raise
+    return len(deltas)
+
+
+def recount():
+    """Rebuild LikeCounter from LinkedItem, dropping the pending deltas.
+
+    Likes committed while it runs may be counted twice, run it when idle.
+    """
+    buffer = get_buffer()
+    with transaction.atomic():
+        if buffer is not None:
+            buffer.drain()
+        LikeCounter.objects.all().delete()
+        rows = LinkedItem.objects.values('content_type', 'object_id').annotate(total=Count('id'))
+        LikeCounter.objects.bulk_create(
+            (LikeCounter(content_type_id=row['content_type'], object_id=row['object_id'], shard=0,
+                         count=row['total'])
+             for row in rows.iterator()),
+            batch_size=5000)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from likes.counters import recount
+from likes.models import LikeCounter
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the like counters from the likes themselves'
+
+    def handle(self, *args, **options):
+        recount()
+        self.stdout.write(self.style.SUCCESS(f'Recounted likes of {LikeCounter.objects.count()} objects'))
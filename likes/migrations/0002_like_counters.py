@@ -0,0 +1,65 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def deduplicate_likes(apps, schema_editor):
+    # Keep the first like of each user and object
+    LinkedItem = apps.get_model('likes', 'LinkedItem')
+    duplicates = LinkedItem.objects \
+        .values('user', 'content_type', 'object_id') \
+        .annotate(count=Count('id'), first=Min('id')) \
+        .filter(count__gt=1)
+    for row in duplicates.iterator():
+        LinkedItem.objects \
+            .filter(user=row['user'], content_type=row['content_type'], object_id=row['object_id']) \
+            .exclude(id=row['first']) \
+            .delete()
+
+
+def count_likes(apps, schema_editor):
+    LinkedItem = apps.get_model('likes', 'LinkedItem')
+    LikeCounter = apps.get_model('likes', 'LikeCounter')
+    LikeCounter.objects.bulk_create(
+        (LikeCounter(content_type_id=row['content_type'], object_id=row['object_id'], shard=0, count=row['count'])
+         for row in LinkedItem.objects.values('content_type', 'object_id').annotate(count=Count('id')).iterator()),
+        batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('likes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_likes, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='LikeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='linkeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'content_type', 'object_id'), name='likes_unique_user_object'),
+        ),
+        migrations.AddField(
+            model_name='likecounter',
+            name='content_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype'),
+        ),
+        migrations.AddConstraint(
+            model_name='likecounter',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id', 'shard'), name='likes_unique_counter_shard'),
+        ),
+        migrations.RunPython(count_likes, migrations.RunPython.noop),
+    ]
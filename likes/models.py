@@ -1,4 +1,3 @@
-
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
@@ -12,4 +11,28 @@ class LinkedItem(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
 
+    class Meta:
+        constraints = [
+            # One like per user and object, also serves the "liked" flags of a page
+            models.UniqueConstraint(fields=['user', 'content_type', 'object_id'], name='likes_unique_user_object'),
+        ]
+
+
+class LikeCounter(models.Model):
+    """Like count of an object, split over LIKES_COUNTER_SHARDS rows.
+
+    Written by likes.counters.add_counts() only: flush() adds the Redis
+    buffer's deltas to one shard per run, and without Redis each like is
+    written through by _count() to a random shard, so concurrent writers
+    rarely wait on the same rows. The count of an object is the sum of its
+    shards (which may be negative on their own).
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id', 'shard'], name='likes_unique_counter_shard'),
+        ]
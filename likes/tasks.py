@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from likes import counters
+
+
+@shared_task
+def flush_like_counts():
+    return counters.flush()
@@ -1,5 +0,0 @@
-
-from django.test import TestCase
-
-# Create your tests here.
-
@@ -0,0 +1,95 @@
+from core.models import User
+from likes import counters
+from likes.models import LikeCounter
+from store.models import Product
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+@pytest.mark.django_db
+class TestProductLikes:
+    def login(self, api_client):
+        user = baker.make(User)
+        api_client.force_authenticate(user=user)
+        return user
+
+    def test_like_and_unlike(self, api_client):
+        product = baker.make(Product, unit_price=10)
+        url = f'/store/products/{product.id}/like/'
+        assert api_client.post(url).status_code == status.HTTP_401_UNAUTHORIZED
+        self.login(api_client)
+
+        api_client.post(url)
+        response = api_client.post(url)
+
+        assert response.data == {'liked': True, 'likes_count': 1}
+        api_client.delete(url)
+        response = api_client.get('/store/products/likes/', {'ids': product.id})
+        assert response.data == [{'id': product.id, 'likes_count': 0, 'liked': False}]
+        assert api_client.post('/store/products/0/like/').status_code == status.HTTP_404_NOT_FOUND
+
+    def test_page_counts_and_flags_in_two_queries(self, api_client, django_assert_num_queries):
+        products = baker.make(Product, unit_price=10, _quantity=3)
+        for user in baker.make(User, _quantity=2):
+            counters.like(user, products[0])
+        counters.like(self.login(api_client), products[1])
+        ids = ','.join(str(product.id) for product in products)
+
+        # counters and liked flags
+        with django_assert_num_queries(2):
+            response = api_client.get('/store/products/likes/', {'ids': ids})
+
+        assert response.data == [
+            {'id': products[0].id, 'likes_count': 2, 'liked': False},
+            {'id': products[1].id, 'likes_count': 1, 'liked': True},
+            {'id': products[2].id, 'likes_count': 0, 'liked': False},
+        ]
+        assert api_client.get('/store/products/likes/', {'ids': 'x'}).status_code \
+            == status.HTTP_400_BAD_REQUEST
+
+    def test_without_redis_likes_are_written_through_to_shards(self, settings):
+        settings.LIKES_COUNTER_SHARDS = 2
+        product = baker.make(Product, unit_price=10)
+        users = baker.make(User, _quantity=5)
+        for user in users:
+            counters.like(user, product)
+        counters.like(users[0], product)
+        counters.unlike(users[1], product)
+
+        assert counters.flush() == 0
+        assert set(LikeCounter.objects.values_list('shard', flat=True)) <= {0, 1}
+        assert sum(LikeCounter.objects.values_list('count', flat=True)) == 4
+        assert counters.get_counts(Product, [product.id]) == {product.id: 4}
+
+
+@pytest.mark.django_db
+class TestRedisLikeBuffer:
+    @pytest.fixture(autouse=True)
+    def redis_buffer(self, monkeypatch):
+        fakeredis = pytest.importorskip('fakeredis')
+        buffer = counters.RedisBuffer(fakeredis.FakeRedis())
+        monkeypatch.setattr(counters, 'get_buffer', lambda: buffer)
+
+    def test_flush_adds_buffered_deltas_to_shards(self, django_capture_on_commit_callbacks):
+        product = baker.make(Product, unit_price=10)
+        users = baker.make(User, _quantity=3)
+        with django_capture_on_commit_callbacks(execute=True):
+            for user in users:
+                counters.like(user, product)
+        assert counters.get_counts(Product, [product.id]) == {product.id: 3}
+        assert counters.flush(shard=0) == 1
+
+        with django_capture_on_commit_callbacks(execute=True):
+            counters.unlike(users[0], product)
+        counters.flush(shard=1)
+
+        assert sorted(LikeCounter.objects.values_list('shard', 'count')) == [(0, 3), (1, -1)]
+        assert counters.get_counts(Product, [product.id]) == {product.id: 2}
+        assert counters.flush() == 0
+
+    def test_deltas_wait_for_the_commit(self):
+        product = baker.make(Product, unit_price=10)
+        counters.like(baker.make(User), product)
+
+        assert counters.get_counts(Product, [product.id]) == {product.id: 0}
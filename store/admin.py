@@ -2,6 +2,7 @@
 from django.contrib import admin
 from django.db.models.aggregates import Count
 from . import models
+from .images import variant_urls
 from .models import Customer, Product, Order, Collection, OrderItem
 from django.utils.html import format_html, urlencode
 from django.urls import reverse
@@ -25,7 +26,9 @@ class ProductImageInline(admin.TabularInline):
 
     def thumbnail(self, instance):
         if instance.image.name != '':
-            return format_html(f'<img src="{instance.image.url}" class="thumbnail"/>" />')
+            # The full-size image until the thumbnail is rendered
+            url = variant_urls(instance.variants).get('thumb', {}).get('jpeg', instance.image.url)
+            return format_html('<img src="{}" class="thumbnail"/>', url)
         return ''
 
 
@@ -108,7 +111,8 @@ class AdminCollection(admin.ModelAdmin):
     search_fields=['title']
     list_display = ['title', 'product_count']
 
-    @admin.display(ordering='product_count')
+    # products_count is maintained on the collection, no Count() needed
+    @admin.display(ordering='products_count')
     def product_count(self, collection):
         url = (
                 reverse('admin:store_product_changelist')
@@ -116,10 +120,5 @@ class AdminCollection(admin.ModelAdmin):
                 + urlencode({'collection__id': str(collection.id)})
         )
         return format_html(
-            '<a href="{}">{}</a>', url, collection.product_count
-        )
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            product_count=Count('products')
-
+            '<a href="{}">{}</a>', url, collection.products_count
         )
\ No newline at end of file
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cache import bump_ranking_version
+from .models import JobCheckpoint, Order, OrderItem, ProductSales
+
+# Best sellers and trending products, per collection and overall, from
+# the ProductSales summary table (indexed per ranking). update_sales()
+# adds the orders completed since its last run, by Order.completed_at, so
+# orders paid long after they were placed are counted too.
+#
+# Trending is a time-decayed unit count with a STORE_TRENDING_HALF_LIFE.
+# Rather than decaying every row as time passes, a sale at time t adds
+# 2 ** ((t - EPOCH) / half-life): every score grows by the same factor,
+# so the order is that of the decayed counts and rows only change when
+# they sell. Scores stay finite for ~1000 half-lives after EPOCH; changing
+# the half-life needs `manage.py update_bestsellers --rebuild`.
+CHECKPOINT = 'bestsellers'
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+RANKINGS = {'units': '-units', 'trending': '-trending'}
+MAX_LIMIT = 50
+
+
+def trending_weight(placed_at):
+    return 2 ** ((placed_at - EPOCH).total_seconds() / settings.STORE_TRENDING_HALF_LIFE)
+
+
+def parse_params(params):
+    """(ordering, limit) of ?ranking=units|trending&limit=."""
+    ranking = params.get('ranking') or 'units'
+    if ranking not in RANKINGS:
+        raise ValidationError({'ranking': f'Expected one of {", ".join(RANKINGS)}.'})
+    try:
+        limit = int(params.get('limit') or 10)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValidationError({'limit': f'Expected a number from 1 to {MAX_LIMIT}.'})
+    return RANKINGS[ranking], limit
+
+
+def top_product_ids(ordering, limit, collection_id=None):
+    # Reads the top of the (collection, ranking) index
+    sales = ProductSales.objects.all()
+    if collection_id is not None:
+        sales = sales.filter(collection_id=collection_id)
+    return list(sales.order_by(ordering, 'product_id').values_list('product_id', flat=True)[:limit])
+
+
+def add_batch(batch_size, until):
+    """Count the next `batch_size` orders completed before `until`, returns how many were read.
+
+    The checkpoint row is locked while the batch is counted, so
+    overlapping runs take turns rather than counting orders twice.
+    """
+    with transaction.atomic():
+        checkpoint = JobCheckpoint.objects.select_for_update().get(name=CHECKPOINT)
+        batch = list(Order.objects
+                     .filter(completed_at__lt=until)
+                     .completed_after(checkpoint.timestamp, checkpoint.position)
+                     .values_list('completed_at', 'id')[:batch_size])
+        order_ids = [order_id for _, order_id in batch]
+        sales = {}
+        for product_id, collection_id, quantity, placed_at in OrderItem.objects \
+                .filter(order_id__in=order_ids) \
+                .values_list('product_id', 'product__collection_id', 'quantity', 'order__placed_at'):
+            units, trending, _ = sales.get(product_id, (0, 0.0, None))
+            sales[product_id] = (units + quantity, trending + quantity * trending_weight(placed_at), collection_id)
+
+        existing = ProductSales.objects.in_bulk(list(sales))
+        rows = []
+        for product_id, (units, trending, collection_id) in sales.items():
+            row = existing.get(product_id) or ProductSales(product_id=product_id, units=0, trending=0)
+            row.units += units
+            row.trending += trending
+            row.collection_id = collection_id
+            rows.append(row)
+        ProductSales.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['product'],
+            update_fields=['units', 'trending', 'collection'])
+
+        if batch:
+            checkpoint.timestamp, checkpoint.position = batch[-1]
+            checkpoint.save(update_fields=['timestamp', 'position', 'updated_at'])
+    return len(order_ids)
+
+
+def update_sales(batch_size=5000):
+    """Add the orders completed since the last run to ProductSales.
+
+    Orders completed in the last STORE_RANKINGS_DELAY seconds wait for
+    the next run. Returns the number of orders counted.
+    """
+    JobCheckpoint.objects.get_or_create(name=CHECKPOINT)
+    until = timezone.now() - timedelta(seconds=settings.STORE_RANKINGS_DELAY)
+    counted = 0
+    while True:
+        added = add_batch(batch_size, until)
+        counted += added
+        if added < batch_size:
+            break
+    if counted:
+        bump_ranking_version(CHECKPOINT)
+    return counted
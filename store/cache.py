@@ -0,0 +1,249 @@
+import hashlib
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, urlencode
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = 'store:catalog:version'
+COLLECTION_VERSION_KEY = 'store:catalog:collection:{}:version'
+CART_VERSION_KEY = 'store:cart:{}:version'
+CART_SUMMARY_KEY = 'store:cart:{}:summary:{}'
+REVIEWS_VERSION_KEY = 'store:product:{}:reviews:version'
+RANKING_VERSION_KEY = 'store:ranking:{}:version'
+CACHE_HITS_KEY = 'store:catalog:cache:hits'
+CACHE_MISSES_KEY = 'store:catalog:cache:misses'
+
+
+def _incr(key, initial=0):
+    # incr() raises ValueError for missing keys, so seed the counter first
+    cache.add(key, initial, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, initial + 1, timeout=None)
+        return initial + 1
+
+
+def _version_seed():
+    # Versions lost from the cache restart from the clock rather than 0, so
+    # they never repeat a value an old cache entry or ETag was built from
+    return int(time() * 1000)
+
+
+def get_version(key):
+    return cache.get_or_set(key, _version_seed, timeout=None)
+
+
+def bump_version(key):
+    return _incr(key, initial=_version_seed())
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def get_collection_version(collection_id):
+    return get_version(COLLECTION_VERSION_KEY.format(collection_id))
+
+
+def bump_catalog_version(*collection_ids):
+    """Invalidate cached catalog responses.
+
+    The global version is always bumped, collection versions only for
+    the given (non-empty) collection ids.
+    """
+    bump_version(CATALOG_VERSION_KEY)
+    for collection_id in set(collection_ids):
+        if collection_id is not None:
+            bump_version(COLLECTION_VERSION_KEY.format(collection_id))
+
+
+def touch_products(products):
+    """Mark products as changed without saving them (no signals).
+
+    Their collections' cached responses are invalidated, and the new
+    last_update moves their Last-Modified and the catalog snapshot.
+    """
+    bump_catalog_version(*products.values_list('collection_id', flat=True).distinct())
+    products.update(last_update=timezone.now())
+
+
+def get_cart_version(cart_id):
+    return get_version(CART_VERSION_KEY.format(cart_id))
+
+
+def bump_cart_version(cart_id):
+    bump_version(CART_VERSION_KEY.format(cart_id))
+
+
+def bump_cart_versions(cart_ids):
+    """Invalidate many carts in one cache round trip.
+
+    Their versions are dropped rather than incremented, and restart from
+    the clock when next read.
+    """
+    cache.delete_many([CART_VERSION_KEY.format(cart_id) for cart_id in cart_ids])
+
+
+def get_cart_summary(cart_id, load):
+    """The cart's cached summary, from `load()` on a miss (None is not cached).
+
+    Entries are keyed by the cart version, which CartItem changes and price
+    changes of the products in the cart bump.
+    """
+    key = CART_SUMMARY_KEY.format(cart_id, get_cart_version(cart_id))
+    summary = cache.get(key)
+    if summary is None:
+        summary = load()
+        if summary is not None:
+            cache.set(key, summary, settings.STORE_CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+def get_reviews_version(product_id):
+    return get_version(REVIEWS_VERSION_KEY.format(product_id))
+
+
+def bump_reviews_version(product_id):
+    bump_version(REVIEWS_VERSION_KEY.format(product_id))
+
+
+def get_ranking_version(name):
+    return get_version(RANKING_VERSION_KEY.format(name))
+
+
+def bump_ranking_version(name):
+    """Invalidate cached responses of a ranking recounted by its job, such as 'bestsellers'."""
+    bump_version(RANKING_VERSION_KEY.format(name))
+
+
+def get_cache_stats():
+    hits = cache.get(CACHE_HITS_KEY, 0)
+    misses = cache.get(CACHE_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def reset_cache_stats():
+    cache.delete_many([CACHE_HITS_KEY, CACHE_MISSES_KEY])
+
+
+class CatalogCacheMixin:
+    """Cache list/retrieve responses until the catalog version changes.
+
+    Lists filtered by `collection_id` are keyed by that collection's
+    version only, everything else by the global catalog version.
+    """
+    cache_prefix = 'store:catalog'
+    cache_query_params = ['collection_id', 'unit_price__lt', 'unit_price__gt',
+                          'search', 'ordering', 'page', 'pagination', 'cursor', 'fields', 'omit',
+                          'price_buckets', 'ranking', 'limit', 'tag']
+
+    def get_cache_version(self):
+        collection_id = self.request.query_params.get('collection_id')
+        if self.action == 'list' and collection_id:
+            return f'c{collection_id}:{get_collection_version(collection_id)}'
+        return f'g{get_catalog_version()}'
+
+    def get_cache_key(self):
+        params = sorted(
+            (name, value)
+            for name in self.cache_query_params
+            for value in self.request.query_params.getlist(name)
+            if value != ''
+        )
+        # Pagination links are absolute, so the host is part of the response
+        raw = '|'.join([
+            self.request.get_host(),
+            self.action,
+            str(self.kwargs.get(self.lookup_url_kwarg or self.lookup_field, '')),
+            urlencode(params),
+            self.request.accepted_renderer.format,
+        ])
+        digest = hashlib.md5(raw.encode()).hexdigest()
+        return f'{self.cache_prefix}:{self.basename}:{self.get_cache_version()}:{digest}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_cache_key()
+        data = cache.get(key)
+        if data is not None:
+            _incr(CACHE_HITS_KEY)
+            return Response(data)
+        _incr(CACHE_MISSES_KEY)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.STORE_CATALOG_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+
+class NotModified(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """Answer If-None-Match / If-Modified-Since on list and retrieve.
+
+    `get_conditional_state()` returns what the response depends on, such
+    as version counters, plus an optional last-modified datetime. It runs
+    after authentication and content negotiation, and before the handler,
+    so a 304 costs no queryset or serializer work.
+    """
+    conditional_actions = ('list', 'retrieve')
+
+    def get_conditional_state(self):
+        return None, None
+
+    def get_etag(self, source):
+        request = self.request
+        raw = '|'.join([
+            request.get_host(),
+            request.accepted_renderer.format,
+            self.action,
+            urlencode(sorted(self.kwargs.items())),
+            urlencode(sorted(request.query_params.lists()), doseq=True),
+            str(source),
+        ])
+        return '"%s"' % hashlib.md5(raw.encode()).hexdigest()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = self.last_modified = None
+        if request.method not in ('GET', 'HEAD') or self.action not in self.conditional_actions:
+            return
+        source, last_modified = self.get_conditional_state()
+        if source is not None:
+            self.etag = self.get_etag(source)
+        if last_modified is not None:
+            self.last_modified = int(last_modified.timestamp())
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified)
+        if response is not None:
+            raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) and response.status_code in (200, 304):
+            response.headers['ETag'] = self.etag
+        if getattr(self, 'last_modified', None) and response.status_code in (200, 304):
+            response.headers['Last-Modified'] = http_date(self.last_modified)
+        return response
@@ -0,0 +1,215 @@
+from time import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from rest_framework import serializers
+
+from store.cache import bump_cart_version
+from store.models import Cart, CartItem, Product
+
+# Cart storage. With STORE_CART_BACKEND = 'redis' new carts are kept in a
+# Redis hash (product id -> quantity) expiring STORE_CART_TTL seconds after
+# their last change, so anonymous cart traffic never writes to the
+# database. The /store/carts/ API serves them the same way, their items
+# are identified by product id. A cart is materialized into Cart and
+# CartItem rows (same id) at checkout or when a customer logs in with it,
+# from then on it is a database cart. With 'database' every cart is a row.
+CART_KEY = 'store:cart:{}'
+# Keeps the hash of an empty cart alive
+CREATED_FIELD = 'created_at'
+
+
+def get_client():
+    if settings.CACHES['default']['BACKEND'] != 'django_redis.cache.RedisCache':
+        raise ImproperlyConfigured("STORE_CART_BACKEND = 'redis' needs the django_redis cache backend")
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def redis_enabled():
+    return settings.STORE_CART_BACKEND == 'redis'
+
+
+class RedisCart:
+    def __init__(self, client, cart_id):
+        self.client = client
+        self.id = str(cart_id)
+        self.key = CART_KEY.format(self.id)
+
+    @classmethod
+    def create(cls, cart_id):
+        cart = cls(get_client(), cart_id)
+        pipeline = cart.client.pipeline()
+        pipeline.hset(cart.key, CREATED_FIELD, int(time()))
+        pipeline.expire(cart.key, settings.STORE_CART_TTL)
+        pipeline.execute()
+        return cart
+
+    def changed(self, pipeline):
+        pipeline.expire(self.key, settings.STORE_CART_TTL)
+        result = pipeline.execute()
+        bump_cart_version(self.id)
+        return result
+
+    def quantities(self):
+        return {int(field): int(value) for field, value in self.client.hgetall(self.key).items()
+                if field != CREATED_FIELD.encode()}
+
+    def add(self, product_id, quantity):
+        """Add to the product's quantity, returns the new quantity."""
+        inventory = Product.objects.filter(pk=product_id).values_list('inventory', flat=True).first()
+        if inventory is None:
+            raise serializers.ValidationError({'product_id': ['Product does not exist']})
+        pipeline = self.client.pipeline()
+        pipeline.hincrby(self.key, product_id, quantity)
+        total = self.changed(pipeline)[0]
+        if total > inventory:
+            self.client.hincrby(self.key, product_id, -quantity)
+            raise serializers.ValidationError('Not enough items in stock.')
+        return total
+
+    def set(self, product_id, quantity):
+        """Set the quantity of a product in the cart, False if it is not there."""
+        if not self.client.hexists(self.key, product_id):
+            return False
+        pipeline = self.client.pipeline()
+        pipeline.hset(self.key, product_id, quantity)
+        self.changed(pipeline)
+        return True
+
+    def remove(self, product_id):
+        pipeline = self.client.pipeline()
+        pipeline.hdel(self.key, product_id)
+        return bool(self.changed(pipeline)[0])
+
+    def apply(self, operations):
+        """Apply add/set/remove operations at once (see apply_operations())."""
+        def update(pipeline):
+            # Retried by transaction() when the cart changes meanwhile
+            quantities = {int(field): int(value) for field, value in pipeline.hgetall(self.key).items()
+                          if field != CREATED_FIELD.encode()}
+            changed = apply_operations(quantities, operations)
+            pipeline.multi()
+            for product_id, quantity in changed.items():
+                if quantity:
+                    pipeline.hset(self.key, product_id, quantity)
+                else:
+                    pipeline.hdel(self.key, product_id)
+            pipeline.expire(self.key, settings.STORE_CART_TTL)
+        self.client.transaction(update, self.key)
+        bump_cart_version(self.id)
+
+    def delete(self):
+        self.client.delete(self.key)
+        bump_cart_version(self.id)
+
+    def get_items(self, product_id=None):
+        """Items rendered as by CartItemSerializer, ids are product ids."""
+        from store.serializers import SimpleProductSerializer
+        quantities = self.quantities()
+        if product_id is not None:
+            quantities = {product_id: quantities[product_id]} if product_id in quantities else {}
+        products = Product.objects.with_prices().filter(pk__in=list(quantities)).order_by('id')
+        # Products deleted meanwhile drop out of the cart
+        return [{
+            'id': product.pk,
+            'product': SimpleProductSerializer(product).data,
+            'quantity': quantities[product.pk],
+            'total_price': quantities[product.pk] * product.effective_price,
+        } for product in products.only('id', 'title', 'unit_price', 'inventory')]
+
+    def render(self):
+        items = self.get_items()
+        return {'id': self.id, 'items': items, 'total_price': sum(item['total_price'] for item in items)}
+
+    def summary(self):
+        items = self.get_items()
+        return {'items_count': sum(item['quantity'] for item in items),
+                'total_price': sum(item['total_price'] for item in items)}
+
+
+def apply_operations(quantities, operations):
+    """Quantities by product id after the operations, in order, 0 for removed ones.
+
+    Only the products the operations name are returned. Unknown products
+    and quantities over the stock raise a ValidationError keyed by
+    operation index, checked in one query.
+    """
+    changed = {}
+    for operation in operations:
+        product_id = operation['product_id']
+        if operation['op'] == 'add':
+            changed[product_id] = changed.get(product_id, quantities.get(product_id, 0)) + operation['quantity']
+        elif operation['op'] == 'set':
+            changed[product_id] = operation['quantity']
+        else:
+            changed[product_id] = 0
+    stock = dict(Product.objects.filter(pk__in=list(changed)).values_list('id', 'inventory'))
+    errors = {}
+    for index, operation in enumerate(operations):
+        product_id = operation['product_id']
+        if product_id not in stock:
+            errors[index] = {'product_id': ['Product does not exist']}
+        elif changed[product_id] > stock[product_id]:
+            errors[index] = {'quantity': ['Not enough items in stock.']}
+    if errors:
+        raise serializers.ValidationError({'operations': errors})
+    return changed
+
+
+def apply_to_cart(cart_id, operations):
+    """Apply operations to a database cart in one transaction, False if there is no such cart."""
+    with transaction.atomic():
+        # Concurrent batches on the cart take turns
+        if not Cart.objects.select_for_update().filter(pk=cart_id).exists():
+            return False
+        product_ids = {operation['product_id'] for operation in operations}
+        quantities = dict(CartItem.objects
+                          .filter(cart_id=cart_id, product_id__in=product_ids)
+                          .values_list('product_id', 'quantity'))
+        changed = apply_operations(quantities, operations)
+        CartItem.objects.bulk_create(
+            [CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+             for product_id, quantity in changed.items() if quantity],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'])
+        removed = [product_id for product_id, quantity in changed.items() if not quantity]
+        if removed:
+            CartItem.objects.filter(cart_id=cart_id, product_id__in=removed).delete()
+        # bulk_create() sends no signals
+        Cart.objects.filter(pk=cart_id).touch()
+    bump_cart_version(cart_id)
+    return True
+
+
+def get_redis_cart(cart_id):
+    """The cart if it is held in Redis, None for database carts (and unknown ids)."""
+    if not redis_enabled():
+        return None
+    cart = RedisCart(get_client(), cart_id)
+    return cart if cart.client.exists(cart.key) else None
+
+
+def materialize(cart_id, customer=None):
+    """Move a Redis cart into Cart and CartItem rows, returns False if there was none.
+
+    Items are added to an existing cart row with the same id.
+    """
+    cart = get_redis_cart(cart_id)
+    if cart is None:
+        return False
+    quantities = cart.quantities()
+    existing = set(Product.objects.filter(pk__in=list(quantities)).values_list('id', flat=True))
+    with transaction.atomic():
+        _, created = Cart.objects.get_or_create(pk=cart.id, defaults={'customer': customer})
+        CartItem.objects.bulk_create(
+            [CartItem(cart_id=cart.id, product_id=product_id, quantity=quantity)
+             for product_id, quantity in quantities.items() if product_id in existing],
+            update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'])
+        if not created:
+            Cart.objects.filter(pk=cart.id).touch()
+        # Deleted once the rows commit (with the caller's transaction, if
+        # any). Checkouts materialize while validating, before the order's
+        # transaction, so a failed checkout leaves the cart as rows
+        transaction.on_commit(cart.delete)
+    return True
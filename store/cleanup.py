@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_cart_versions
+from .models import Cart, CartItem, Order
+
+# Garbage collection of abandoned carts and checkouts, run by the
+# store.tasks.collect_garbage task. Rows are handled in chunks of
+# `chunk_size`, each read from the head of its index and changed in its
+# own short transaction, so the cart and order tables are never locked
+# for long and a run can stop anywhere.
+
+
+def chunks(queryset, chunk_size):
+    """Ids of the rows still matching `queryset`, `chunk_size` at a time.
+
+    Callers delete or change each chunk so it stops matching.
+    """
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+        if ids:
+            yield ids
+        if len(ids) < chunk_size:
+            return
+
+
+def delete_abandoned_carts(chunk_size=1000):
+    """Delete carts without a customer unused for STORE_ANONYMOUS_CART_TTL, returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=settings.STORE_ANONYMOUS_CART_TTL)
+    abandoned = Cart.objects.filter(customer__isnull=True, updated_at__lt=cutoff).order_by('updated_at')
+    deleted = 0
+    for ids in chunks(abandoned, chunk_size):
+        with transaction.atomic():
+            # Locked, carts adopted or used meanwhile are kept
+            ids = list(abandoned.filter(pk__in=ids).select_for_update().values_list('id', flat=True))
+            # Raw deletes skip the collector and its per-row signals, the
+            # cart versions are dropped once per chunk below
+            CartItem.objects.filter(cart_id__in=ids)._raw_delete(CartItem.objects.db)
+            deleted += Cart.objects.filter(pk__in=ids)._raw_delete(Cart.objects.db)
+        bump_cart_versions(ids)
+    return deleted
+
+
+def expire_stale_orders(chunk_size=1000):
+    """Fail pending orders placed more than STORE_CHECKOUT_WINDOW ago, returns how many.
+
+    Orders still holding stock are left to inventory.release_expired(),
+    which returns their items first.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.STORE_CHECKOUT_WINDOW)
+    stale = Order.objects \
+        .filter(payment_status=Order.PAYMENT_STATUS_PENDING, placed_at__lt=cutoff, reserved_until__isnull=True) \
+        .order_by('placed_at')
+    expired = 0
+    for ids in chunks(stale, chunk_size):
+        expired += stale.filter(pk__in=ids).update(payment_status=Order.PAYMENT_STATUS_FAILED)
+    return expired
+
+
+def collect_garbage(chunk_size=1000):
+    return {
+        'carts': delete_abandoned_carts(chunk_size),
+        'orders': expire_stale_orders(chunk_size),
+    }
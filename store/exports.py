@@ -0,0 +1,98 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+from store.models import Order, Product
+
+# Catalog and order exports for back-office systems. Rows are read with
+# QuerySet.iterator(), which uses server-side cursors on PostgreSQL, and
+# encoded one line at a time, so memory stays flat however large the
+# tables are. Orders are exported one line per order item, orders without
+# items as a single line with empty item columns.
+PRODUCT_COLUMNS = {
+    'id': 'id',
+    'slug': 'slug',
+    'title': 'title',
+    'description': 'description',
+    'unit_price': 'unit_price',
+    'inventory': 'inventory',
+    'collection': 'collection__title',
+    'last_update': 'last_update',
+}
+ORDER_COLUMNS = {
+    'order_id': 'id',
+    'placed_at': 'placed_at',
+    'payment_status': 'payment_status',
+    'total_price': 'total_price',
+    'customer_id': 'customer_id',
+    'guest_email': 'guest_email',
+    'item_id': 'items__id',
+    'product_id': 'items__product_id',
+    'product_slug': 'items__product__slug',
+    'unit_price': 'items__unit_price',
+    'quantity': 'items__quantity',
+}
+EXPORTS = {
+    'products': (Product.objects.order_by('id'), PRODUCT_COLUMNS),
+    'orders': (Order.objects.order_by('id', 'items__id'), ORDER_COLUMNS),
+}
+
+
+class CSVRenderer(BaseRenderer):
+    """Lets `?format=csv` / `Accept: text/csv` select the export format.
+
+    Exports are streamed past the renderer, it only renders error
+    responses (as JSON).
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class NDJSONRenderer(CSVRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes."""
+    def write(self, value):
+        return value
+
+
+def export_rows(name):
+    queryset, columns = EXPORTS[name]
+    for row in queryset.values_list(*columns.values()).iterator(chunk_size=settings.STORE_EXPORT_CHUNK_SIZE):
+        yield dict(zip(columns, row))
+
+
+def encode_lines(name, format):
+    """Yield the export as encoded lines, csv with a header line."""
+    rows = export_rows(name)
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORTS[name][1])
+        for row in rows:
+            yield writer.writerow(row.values())
+    else:
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        for row in rows:
+            yield encoder.encode(row) + '\n'
+
+
+def export_response(name, format):
+    response = StreamingHttpResponse(
+        encode_lines(name, format),
+        content_type='text/csv' if format == 'csv' else 'application/x-ndjson')
+    filename = f'{name}-{timezone.now():%Y%m%d%H%M%S}.{format}'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,63 @@
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+
+
+def parse_price_edges(value):
+    """Ascending bucket edges from `10,50,100`, the default edges when empty."""
+    if not value:
+        return [Decimal(edge) for edge in settings.STORE_FACET_PRICE_EDGES]
+    try:
+        edges = [Decimal(edge) for edge in value.split(',') if edge.strip()]
+    except InvalidOperation:
+        edges = None
+    # NaN and Infinity parse, but make no bucket bounds
+    if edges is None or not all(edge.is_finite() for edge in edges):
+        raise ValidationError({'price_buckets': 'Expected comma separated prices.'})
+    edges = sorted(set(edges))
+    if not edges or len(edges) > 20:
+        raise ValidationError({'price_buckets': 'Expected 1 to 20 bucket edges.'})
+    return edges
+
+
+def price_buckets(edges):
+    """(min, max) ranges, min inclusive, open-ended at both ends."""
+    bounds = [None, *edges, None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def product_facets(queryset, edges):
+    """Collection counts, price histogram and in-stock count of the products.
+
+    A single query grouped by collection; the histogram and in-stock
+    counts are conditional aggregates summed over the groups. Prices are
+    effective prices, as used by the price filters.
+    """
+    buckets = price_buckets(edges)
+    aggregates = {'count': Count('id'), 'in_stock': Count('id', filter=Q(inventory__gt=0))}
+    for index, (low, high) in enumerate(buckets):
+        condition = Q()
+        if low is not None:
+            condition &= Q(effective_price__gte=low)
+        if high is not None:
+            condition &= Q(effective_price__lt=high)
+        aggregates[f'price_{index}'] = Count('id', filter=condition)
+    groups = list(queryset
+                  .order_by()
+                  .values('collection_id', 'collection__title')
+                  .annotate(**aggregates))
+
+    return {
+        'count': sum(group['count'] for group in groups),
+        'collections': [
+            {'id': group['collection_id'], 'title': group['collection__title'], 'count': group['count']}
+            for group in sorted(groups, key=lambda group: (-group['count'], group['collection__title']))
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': sum(group[f'price_{index}'] for group in groups)}
+            for index, (low, high) in enumerate(buckets)
+        ],
+        'in_stock': sum(group['in_stock'] for group in groups),
+    }
@@ -0,0 +1,88 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+
+
+def split_param(params, name):
+    return {value.strip() for param in params.getlist(name) for value in param.split(',') if value.strip()}
+
+
+class SparseFieldsetMixin:
+    """Serializer output limited to `?fields=a,b` and without `?omit=c`.
+
+    Only serializers given the request in their context are narrowed, so
+    nested serializers always render in full. `sparse_columns` maps output
+    fields to the model columns they read (by default the field itself when
+    it is a concrete model field), `sparse_select_related` and
+    `sparse_prefetch_related` to the relations they need.
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    sparse_columns = {}
+    sparse_select_related = {}
+    sparse_prefetch_related = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.get_sparse_fields(self.context.get('request'))
+        if selected is not None:
+            for name in set(self.fields) - set(selected):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_sparse_fields(cls, request):
+        """Selected `Meta.fields` in their declared order, None for all of them.
+
+        Names that are not in `Meta.fields` raise a ValidationError (400).
+        """
+        if request is None:
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        fields = split_param(params, cls.fields_query_param)
+        omit = split_param(params, cls.omit_query_param)
+        if not fields and not omit:
+            return None
+        errors = {}
+        for param, names in [(cls.fields_query_param, fields), (cls.omit_query_param, omit)]:
+            unknown = names - set(cls.Meta.fields)
+            if unknown:
+                errors[param] = f'Unknown fields: {", ".join(sorted(unknown))}.'
+        if errors:
+            raise ValidationError(errors)
+        return [name for name in cls.Meta.fields
+                if (not fields or name in fields) and name not in omit]
+
+    @classmethod
+    def get_sparse_columns(cls, name):
+        if name in cls.sparse_columns:
+            return cls.sparse_columns[name]
+        try:
+            field = cls.Meta.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return []
+        return [name] if field.concrete else []
+
+    @classmethod
+    def narrow_queryset(cls, queryset, request):
+        """Load only what the selected fields render."""
+        selected = cls.get_sparse_fields(request)
+        for name in cls.Meta.fields if selected is None else selected:
+            queryset = queryset.select_related(*cls.sparse_select_related.get(name, []))
+            queryset = queryset.prefetch_related(*cls.sparse_prefetch_related.get(name, []))
+        # Instances loaded for writes are saved back, keep them complete
+        if selected is not None and request.method in permissions.SAFE_METHODS:
+            columns = [queryset.model._meta.pk.name]
+            for name in selected:
+                columns += [column for column in cls.get_sparse_columns(name) if column not in columns]
+            queryset = queryset.only(*columns)
+        return queryset
+
+
+class SparseFieldsetViewMixin:
+    """Narrow the queryset to the fields the serializer will render."""
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if self.request is not None and hasattr(serializer_class, 'narrow_queryset'):
+            return serializer_class.narrow_queryset(queryset, self.request)
+        return queryset
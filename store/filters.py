@@ -1,11 +1,39 @@
-from django_filters.rest_framework import FilterSet
+from django.contrib.contenttypes.models import ContentType
+from django_filters.rest_framework import CharFilter, FilterSet, NumberFilter
+from rest_framework.filters import SearchFilter
+from . import search
 from .models import Product
+from tags.models import TaggedItem
 
 class ProductFilter(FilterSet):
+    # Price bounds apply to the promotion-aware price, so the queryset
+    # must come from Product.objects.with_prices()
+    unit_price__lt = NumberFilter(field_name='effective_price', lookup_expr='lt')
+    unit_price__gt = NumberFilter(field_name='effective_price', lookup_expr='gt')
+    tag = CharFilter(method='filter_tag')
+
     class Meta:
         model = Product
         fields = {
             'collection_id': ['exact'],
-            'unit_price': ['lt', 'gt']
+        }
+
+    def filter_tag(self, queryset, name, value):
+        # A semi-join over the (tag, content_type, object_id) index
+        tagged = TaggedItem.objects \
+            .filter(content_type=ContentType.objects.get_for_model(Product), tag__label=value) \
+            .values('object_id')
+        return queryset.filter(id__in=tagged)
+
+
+class ProductSearchFilter(SearchFilter):
+    """`?search=` over the full-text product index, ordered by relevance.
 
-        }
\ No newline at end of file
+    An explicit `?ordering=` still wins since OrderingFilter runs later.
+    Databases without a search index use the plain SearchFilter.
+    """
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not search.is_supported(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        return search.search_products(queryset, terms).order_by('-search_rank', 'pk')
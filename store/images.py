@@ -0,0 +1,73 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from store.uploads import content_hash
+
+# Fixed-size derivatives of product images, rendered by the
+# store.tasks.generate_image_variants task after an image is saved.
+# Files are named after the SHA-256 of the source bytes, so regenerating
+# an image rewrites nothing and identical uploads share their files.
+VARIANTS_DIR = 'store/images/variants'
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+def render(source, size, crop=False):
+    image = ImageOps.exif_transpose(source)
+    if crop:
+        # Square thumbnails are cropped to fill the box
+        return ImageOps.fit(image, size, Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    return image
+
+
+def render_variants(name, storage=default_storage):
+    """Write every derivative of the stored image `name`.
+
+    Returns the content hash and the stored names of the derivatives by
+    variant and format. Only touches storage, so it can run in worker
+    processes.
+    """
+    with storage.open(name) as file:
+        digest = content_hash(file)
+        file.seek(0)
+        source = Image.open(file)
+        source.load()
+    if source.mode not in ('RGB', 'L'):
+        # JPEG has no alpha channel, flatten on white
+        background = Image.new('RGB', source.size, 'white')
+        background.paste(source, mask=source.convert('RGBA').getchannel('A'))
+        source = background
+
+    variants = {}
+    for variant, options in settings.STORE_IMAGE_VARIANTS.items():
+        image = None
+        variants[variant] = {}
+        for extension, format in FORMATS.items():
+            path = f'{VARIANTS_DIR}/{digest[:2]}/{digest}-{variant}.{extension}'
+            if not storage.exists(path):
+                image = image or render(source, options['size'], options.get('crop', False))
+                buffer = BytesIO()
+                image.convert('RGB').save(buffer, format, quality=options.get('quality', 82), optimize=True)
+                path = storage.save(path, ContentFile(buffer.getvalue()))
+            variants[variant][extension] = path
+    return digest, variants
+
+
+def variant_urls(variants, request=None, storage=default_storage):
+    """URLs of stored derivatives, absolute when a request is given."""
+    urls = {}
+    for variant, paths in (variants or {}).items():
+        urls[variant] = {}
+        for extension, path in paths.items():
+            url = storage.url(path)
+            urls[variant][extension] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+def variant_paths(variants):
+    return [path for paths in (variants or {}).values() for path in paths.values()]
@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from time import perf_counter
+
+from django.conf import settings
+from django.db import transaction
+
+from store import search
+from store.cache import bump_cart_versions, bump_catalog_version
+from store.models import CartItem, Collection, Product, ProductSales
+
+# Streaming product feed import. Rows are read one at a time from CSV
+# (with a header line) or JSON Lines and upserted by slug in batches with
+# bulk_create(update_conflicts=True), which sends no model signals; the
+# search index, collection product counts and catalog versions are updated
+# once per batch instead.
+# Columns: slug, title, description, unit_price, inventory, collection
+# (the collection title, created when missing).
+FORMATS = ('csv', 'jsonl')
+UPDATE_FIELDS = ['title', 'description', 'unit_price', 'inventory', 'collection', 'last_update']
+MAX_ERRORS = 20
+SLUG_LENGTH = Product._meta.get_field('slug').max_length
+
+
+class FeedError(Exception):
+    pass
+
+
+def get_format(name):
+    extension = name.rsplit('.', 1)[-1].lower()
+    return 'jsonl' if extension in ('jsonl', 'ndjson') else extension
+
+
+def read_rows(file, format):
+    """Yield (line number, row dict) from a text file, without reading it whole."""
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_num, line in enumerate(file, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_num, row if isinstance(row, dict) else None
+    else:
+        raise FeedError(f'Unsupported format {format!r}, use one of {", ".join(FORMATS)}')
+
+
+class CollectionMap:
+    """Collection ids by title, loaded once; unknown titles are created."""
+    def __init__(self):
+        self.ids = dict(Collection.objects.values_list('title', 'id'))
+
+    def get(self, title):
+        if title not in self.ids:
+            self.ids[title] = Collection.objects.create(title=title).pk
+        return self.ids[title]
+
+
+def build_product(row, collections):
+    if row is None:
+        raise ValueError('not a JSON object')
+    slug = str(row.get('slug') or '').strip()
+    title = str(row.get('title') or '').strip()
+    collection = str(row.get('collection') or '').strip()
+    if not slug or not title or not collection:
+        raise ValueError('slug, title and collection are required')
+    if len(slug) > SLUG_LENGTH:
+        # Truncating could upsert over another product's slug
+        raise ValueError(f'slug longer than {SLUG_LENGTH} characters')
+    try:
+        unit_price = Decimal(str(row.get('unit_price'))).quantize(Decimal('0.01'))
+        inventory = int(row.get('inventory') or 0)
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError('invalid unit_price or inventory')
+    if not Decimal(1) <= unit_price < Decimal(10000):
+        raise ValueError('unit_price out of range')
+    return Product(
+        slug=slug,
+        title=title[:255],
+        description=row.get('description') or None,
+        unit_price=unit_price,
+        inventory=inventory,
+        collection_id=collections.get(collection[:255]),
+    )
+
+
+def upsert_products(products):
+    # A slug repeated in one statement cannot be upserted twice, keep the last row
+    products = list({product.slug: product for product in products}.values())
+    collection_ids = {product.collection_id for product in products}
+    with transaction.atomic():
+        existing = Product.objects \
+            .filter(slug__in=[product.slug for product in products]) \
+            .values_list('slug', 'id', 'collection_id', 'unit_price')
+        repriced = []
+        moved = defaultdict(list)
+        rows = {product.slug: product for product in products}
+        for slug, id, collection_id, unit_price in existing:
+            # Products moving to another collection change the old one's count too
+            collection_ids.add(collection_id)
+            if rows[slug].collection_id != collection_id:
+                moved[rows[slug].collection_id].append(id)
+            if rows[slug].unit_price != unit_price:
+                repriced.append(id)
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['slug'],
+            update_fields=UPDATE_FIELDS,
+        )
+        ids = [product.pk for product in products if product.pk is not None]
+        if len(ids) < len(products):
+            # Backends not returning ids from upserts
+            ids = list(Product.objects
+                       .filter(slug__in=[product.slug for product in products])
+                       .values_list('id', flat=True))
+        search.index_products(ids)
+        # As move_product_sales does for saved products
+        for collection_id, product_ids in moved.items():
+            ProductSales.objects.filter(product_id__in=product_ids).update(collection_id=collection_id)
+        Collection.objects.filter(pk__in=collection_ids).recount()
+        cart_ids = set(CartItem.objects.filter(product_id__in=repriced).values_list('cart_id', flat=True))
+    bump_catalog_version(*collection_ids)
+    bump_cart_versions(cart_ids)
+
+
+def import_products(file, format, batch_size=None, progress=None):
+    """Upsert the products of a feed, returns the import report.
+
+    `progress` is called with the report after every batch.
+    """
+    batch_size = batch_size or settings.STORE_IMPORT_BATCH_SIZE
+    collections = CollectionMap()
+    rows = read_rows(file, format)
+    report = {'rows': 0, 'imported': 0, 'skipped': 0, 'errors': [], 'seconds': 0, 'rows_per_second': 0}
+    started = perf_counter()
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+        batch = []
+        for line_num, row in chunk:
+            try:
+                batch.append(build_product(row, collections))
+            except ValueError as error:
+                report['skipped'] += 1
+                if len(report['errors']) < MAX_ERRORS:
+                    report['errors'].append(f'line {line_num}: {error}')
+        if batch:
+            upsert_products(batch)
+        report['rows'] += len(chunk)
+        report['imported'] = report['rows'] - report['skipped']
+        report['seconds'] = round(perf_counter() - started, 3)
+        report['rows_per_second'] = round(report['rows'] / report['seconds']) if report['seconds'] else 0
+        if progress is not None:
+            progress(report)
+    return report
+
+
+def open_text(file):
+    """Text stream over an uploaded (binary) file."""
+    return io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
@@ -0,0 +1,117 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import serializers
+
+from store.cache import bump_catalog_version
+from store.models import Order, Product
+
+# Stock is taken when an order is placed and held for
+# STORE_RESERVATION_TTL seconds (Order.reserved_until). Paying commits the
+# hold, expired holds are returned to stock by the
+# store.tasks.release_expired_reservations task.
+#
+# Inventory only changes through conditional UPDATEs, which lock the
+# product rows until commit; rows are always updated in product id order
+# and an existing order's row is locked before its products, so concurrent
+# checkouts neither oversell nor deadlock.
+logger = logging.getLogger(__name__)
+
+
+class OutOfStock(serializers.ValidationError):
+    def __init__(self, product_id):
+        self.product_id = product_id
+        super().__init__(f'Not enough items in stock (product {product_id}).')
+
+
+def get_quantities(order):
+    quantities = defaultdict(int)
+    for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+        quantities[product_id] += quantity
+    return quantities
+
+
+def change_stock(quantities, sign):
+    now = timezone.now()
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        products = Product.objects.filter(pk=product_id)
+        if sign < 0:
+            products = products.filter(inventory__gte=quantity)
+        # last_update moves the product's Last-Modified and the catalog snapshot
+        if not products.update(inventory=F('inventory') + sign * quantity, last_update=now):
+            raise OutOfStock(product_id)
+    collection_ids = list(Product.objects
+                          .filter(pk__in=list(quantities))
+                          .values_list('collection_id', flat=True)
+                          .distinct())
+    transaction.on_commit(lambda: bump_catalog_version(*collection_ids))
+
+
+def take(order):
+    """Take the order's items out of stock, all or none (raises OutOfStock)."""
+    with transaction.atomic():
+        change_stock(get_quantities(order), -1)
+
+
+def reserve(order):
+    """Take the items of a new order out of stock and hold them."""
+    with transaction.atomic():
+        take(order)
+        order.reserved_until = timezone.now() + timedelta(seconds=settings.STORE_RESERVATION_TTL)
+        Order.objects.filter(pk=order.pk).update(reserved_until=order.reserved_until)
+
+
+def release(order_id, status=Order.PAYMENT_STATUS_FAILED):
+    """Return the held items of a pending order to stock.
+
+    The order gets `status`. Returns False when it holds nothing (paid,
+    already released or never reserved).
+    """
+    with transaction.atomic():
+        order = Order.objects \
+            .select_for_update() \
+            .filter(pk=order_id, payment_status=Order.PAYMENT_STATUS_PENDING, reserved_until__isnull=False) \
+            .first()
+        if order is None:
+            return False
+        change_stock(get_quantities(order), 1)
+        Order.objects.filter(pk=order_id).update(payment_status=status, reserved_until=None)
+    return True
+
+
+def commit(order_id):
+    """Mark a paid order complete, keeping its items out of stock.
+
+    Orders whose hold was released meanwhile (or that never had one) take
+    their items again; they are paid, so running out of stock then is only
+    logged.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        if order.payment_status == Order.PAYMENT_STATUS_COMPLETE:
+            return order
+        if order.reserved_until is None:
+            try:
+                take(order)
+            except OutOfStock as error:
+                logger.warning('Paid order %s oversold product %s', order_id, error.product_id)
+        order.payment_status = Order.PAYMENT_STATUS_COMPLETE
+        order.reserved_until = None
+        order.completed_at = timezone.now()
+        order.save(update_fields=['payment_status', 'reserved_until', 'completed_at'])
+    return order
+
+
+def release_expired(limit=1000):
+    """Release holds past their `reserved_until`, returns how many."""
+    order_ids = list(Order.objects
+                     .filter(payment_status=Order.PAYMENT_STATUS_PENDING, reserved_until__lt=timezone.now())
+                     .order_by('reserved_until')
+                     .values_list('id', flat=True)[:limit])
+    return sum(release(order_id) for order_id in order_ids)
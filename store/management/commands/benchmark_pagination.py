@@ -0,0 +1,76 @@
+from decimal import Decimal
+from random import randint
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.models import Collection, Product
+from store.pagination import DefaultPagination, KeysetPagination
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares page-number and cursor pagination latency on deep product pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--ordering', default='unit_price')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--products', type=int, default=0,
+                            help='Synthetic products to insert for the run (rolled back afterwards)')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['products']:
+                    self.create_products(options['products'])
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_products(self, count):
+        collection = Collection.objects.create(title='benchmark')
+        Product.objects.bulk_create(
+            (Product(title=f'Product {i}', slug=f'product-{i}', inventory=10,
+                     unit_price=Decimal(randint(100, 99999)) / 100, collection=collection)
+             for i in range(count)),
+            batch_size=5000)
+
+    def run(self, options):
+        page, ordering, repeat = options['page'], options['ordering'], options['repeat']
+        factory = APIRequestFactory()
+        queryset = Product.objects.order_by(ordering)
+        offset = (page - 1) * DefaultPagination.page_size
+        if queryset.count() <= offset:
+            self.stderr.write(f'Not enough products for page {page}, use --products')
+            return
+
+        # Cursor of the requested page, as a client following next links would get it
+        paginator = KeysetPagination()
+        paginator.field, paginator.descending = paginator.get_ordering(queryset, None)
+        deep_cursor = paginator.encode_cursor(queryset[offset - 1]) if offset else ''
+
+        self.stdout.write(f'{queryset.count()} products, ordering={ordering}, {repeat} runs')
+        for label, paginator_class, params in [
+            ('page-number  page 1', DefaultPagination, {'page': 1}),
+            (f'page-number  page {page}', DefaultPagination, {'page': page}),
+            ('cursor       page 1', KeysetPagination, {'pagination': 'cursor'}),
+            (f'cursor       page {page}', KeysetPagination, {'cursor': deep_cursor}),
+        ]:
+            timings = []
+            for _ in range(repeat):
+                request = Request(factory.get('/store/products/', {'ordering': ordering, **params}))
+                started = perf_counter()
+                list(paginator_class().paginate_queryset(queryset, request))
+                timings.append(perf_counter() - started)
+            timings.sort()
+            self.stdout.write(
+                f'{label:<28} median {timings[len(timings) // 2] * 1000:8.2f} ms'
+                f'   p95 {timings[int(len(timings) * 0.95) - 1] * 1000:8.2f} ms')
@@ -0,0 +1,72 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+
+from store import inventory
+from store.models import Collection, Order, OrderItem, Product
+
+
+class Command(BaseCommand):
+    help = 'Places concurrent orders for one product and checks reservations neither oversell nor deadlock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=100)
+        parser.add_argument('--inventory', type=int, default=50)
+        parser.add_argument('--quantity', type=int, default=1)
+
+    def handle(self, *args, **options):
+        threads, quantity = options['threads'], options['quantity']
+        # Threads use their own connections, so the data is committed and removed afterwards
+        collection = Collection.objects.create(title='benchmark')
+        product = Product.objects.create(title='Benchmark product', slug='benchmark-reservations',
+                                         inventory=options['inventory'], unit_price=10, collection=collection)
+        barrier = Barrier(threads)
+
+        def place_order(number):
+            barrier.wait()
+            started = perf_counter()
+            try:
+                with transaction.atomic():
+                    order = Order.objects.create(guest_email=f'benchmark-{number}@example.com')
+                    OrderItem.objects.create(order=order, product=product, quantity=quantity,
+                                             unit_price=product.unit_price)
+                    inventory.reserve(order)
+                return 'reserved', perf_counter() - started
+            except inventory.OutOfStock:
+                return 'out of stock', perf_counter() - started
+            except DatabaseError as error:
+                # Deadlocks and lock timeouts
+                return type(error).__name__, perf_counter() - started
+            finally:
+                connection.close()
+
+        try:
+            started = perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                results = list(pool.map(place_order, range(threads)))
+            elapsed = perf_counter() - started
+
+            outcomes = Counter(outcome for outcome, _ in results)
+            timings = sorted(timing for _, timing in results)
+            product.refresh_from_db()
+            reserved = outcomes['reserved'] * quantity
+            for outcome, count in outcomes.most_common():
+                self.stdout.write(f'{outcome:<16} {count}')
+            self.stdout.write(
+                f'{threads} orders in {elapsed:.2f}s, median {timings[len(timings) // 2] * 1000:.1f} ms'
+                f', p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.1f} ms')
+            if product.inventory < 0 or reserved + product.inventory != options['inventory']:
+                self.stderr.write(self.style.ERROR(
+                    f'Oversold: {reserved} reserved, {product.inventory} left of {options["inventory"]}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{reserved} reserved, {product.inventory} left of {options["inventory"]}'))
+        finally:
+            OrderItem.objects.filter(product=product).delete()
+            Order.objects.filter(guest_email__startswith='benchmark-', items__isnull=True).delete()
+            product.delete()
+            collection.delete()
@@ -0,0 +1,65 @@
+from decimal import Decimal
+from random import randint
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.renderers import JSONRenderer
+
+from store.models import Collection, Product
+from store.serializers import ProductSerializer
+from store.values import ProductValuesSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares ProductSerializer and ProductValuesSerializer on the same products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000,
+                            help='Synthetic products to insert for the run (rolled back afterwards)')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.create_products(options['products'])
+                self.run(options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_products(self, count):
+        collections = [Collection.objects.create(title=f'benchmark {i}') for i in range(10)]
+        Product.objects.bulk_create(
+            (Product(title=f'Product {i}', slug=f'product-{i}', inventory=10,
+                     unit_price=Decimal(randint(100, 99999)) / 100, collection=collections[i % 10])
+             for i in range(count)),
+            batch_size=5000)
+
+    def run(self, repeat):
+        queryset = Product.objects.order_by('id')
+        renderer = JSONRenderer()
+        results = {}
+        for label, serialize in [
+            ('ProductSerializer', lambda: ProductSerializer(
+                queryset.prefetch_related('images'), many=True).data),
+            ('ProductValuesSerializer', lambda: ProductValuesSerializer(
+                ProductValuesSerializer.values(queryset), many=True).data),
+        ]:
+            timings = []
+            for _ in range(repeat):
+                queries = []
+                with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+                    started = perf_counter()
+                    content = renderer.render(serialize())
+                    timings.append(perf_counter() - started)
+            results[label] = content
+            self.stdout.write(
+                f'{label:<24} {min(timings) * 1000:9.1f} ms  {len(queries):6} queries  {len(content)} bytes')
+
+        identical = len(set(results.values())) == 1
+        self.stdout.write(f'Identical JSON: {identical}')
@@ -0,0 +1,77 @@
+from random import sample
+from time import perf_counter
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.filters import ProductFilter
+from store.models import Collection, Product
+from tags.models import Tag, TaggedItem
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compares per-product and bulk tag loading, and ?tag= filtering, on tagged products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000,
+                            help='Synthetic tagged products to insert for the run (rolled back afterwards)')
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--per-product', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.create_products(options)
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_products(self, options):
+        collection = Collection.objects.create(title='benchmark')
+        products = Product.objects.bulk_create(
+            Product(title=f'Tagged {i}', slug=f'benchmark-tagged-{i}', inventory=10, unit_price=10,
+                    collection=collection)
+            for i in range(options['products']))
+        tags = Tag.objects.bulk_create(Tag(label=f'tag-{i}') for i in range(options['tags']))
+        content_type = ContentType.objects.get_for_model(Product)
+        TaggedItem.objects.bulk_create(
+            (TaggedItem(tag=tag, content_type=content_type, object_id=product.pk)
+             for product in products for tag in sample(tags, options['per_product'])),
+            batch_size=5000)
+        self.product_ids = [product.pk for product in products]
+
+    def measure(self, label, run, repeat):
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        count = len(queries)
+        for _ in range(repeat):
+            started = perf_counter()
+            run()
+            timings.append(perf_counter() - started)
+        timings.sort()
+        self.stdout.write(f'{label:<36} {count:5} queries   median {timings[len(timings) // 2] * 1000:8.2f} ms')
+
+    def run(self, options):
+        ids, repeat = self.product_ids, options['repeat']
+        self.stdout.write(f'{len(ids)} products, {options["per_product"]} of {options["tags"]} tags each')
+        self.measure('get_tags_for, one product at a time',
+                     lambda: [list(TaggedItem.objects.get_tags_for(Product, id)) for id in ids], max(repeat // 10, 1))
+        self.measure('get_tags_for_many', lambda: TaggedItem.objects.get_tags_for_many(Product, ids), repeat)
+
+        factory = APIRequestFactory()
+        request = Request(factory.get('/store/products/', {'tag': 'tag-0'}))
+        self.measure('?tag= filter',
+                     lambda: list(ProductFilter(request.query_params, queryset=Product.objects.all(),
+                                                request=request).qs.values_list('id', flat=True)),
+                     repeat)
@@ -0,0 +1,30 @@
+import sys
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from store.exports import EXPORTS, encode_lines
+
+
+class Command(BaseCommand):
+    help = 'Streams products or orders as NDJSON or CSV to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--output', help='File to write, stdout by default')
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        lines = 0
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for line in encode_lines(options['name'], options['format']):
+                output.write(line)
+                lines += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        elapsed = perf_counter() - started
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {lines} lines in {elapsed:.1f}s ({lines / elapsed if elapsed else 0:.0f} lines/s)'))
@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from store.cache import touch_products
+from store.images import render_variants
+from store.models import Product, ProductImage
+
+
+def render(name):
+    # Runs in the worker processes, which only touch storage
+    try:
+        return render_variants(name), None
+    except Exception as error:
+        return None, f'{type(error).__name__}: {error}'
+
+
+class Command(BaseCommand):
+    help = 'Renders missing product image derivatives in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--all', action='store_true', help='Also re-render images that have derivatives')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image='').order_by('id')
+        if not options['all']:
+            images = images.filter(variants={})
+        started = perf_counter()
+        rendered = failed = 0
+        last_id = 0
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(options['workers']) as pool:
+            while True:
+                batch = list(images.filter(id__gt=last_id).values_list('id', 'image', 'product_id')
+                             [:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                updated = []
+                for (id, name, product_id), (result, error) in zip(
+                        batch, pool.map(render, [name for _, name, _ in batch])):
+                    if error:
+                        failed += 1
+                        self.stderr.write(f'Image #{id} ({name}): {error}')
+                        continue
+                    digest, variants = result
+                    if ProductImage.objects \
+                            .filter(pk=id, image=name) \
+                            .update(content_hash=digest, variants=variants):
+                        updated.append(product_id)
+                touch_products(Product.objects.filter(pk__in=updated))
+                rendered += len(updated)
+                self.stdout.write(f'Rendered {rendered} images...')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} images, {failed} failed, in {perf_counter() - started:.1f}s'))
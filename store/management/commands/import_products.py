@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.imports import FORMATS, FeedError, get_format, import_products
+
+
+class Command(BaseCommand):
+    help = 'Upserts products by slug from a CSV or JSON Lines feed, streaming it in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Feed format, guessed from the file extension by default')
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or get_format(path)
+
+        def progress(report):
+            self.stdout.write(f"Imported {report['imported']} of {report['rows']} rows "
+                              f"({report['rows_per_second']} rows/s)...")
+
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as file:
+                report = import_products(file, format, options['batch_size'], progress)
+        except (OSError, FeedError) as error:
+            raise CommandError(error)
+
+        for error in report['errors']:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['imported']} products, skipped {report['skipped']} rows "
+            f"in {report['seconds']:.1f}s ({report['rows_per_second']} rows/s)"))
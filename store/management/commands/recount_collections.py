@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+
+from store.cache import bump_catalog_version
+from store.models import Collection
+
+
+class Command(BaseCommand):
+    help = 'Corrects Collection.products_count where it drifted from the actual product count'
+
+    def handle(self, *args, **options):
+        # Counts drift when products are changed with QuerySet.update() or raw SQL
+        drifted = list(Collection.objects
+                       .annotate(actual=Count('products'))
+                       .exclude(products_count=F('actual'))
+                       .values_list('id', 'title', 'products_count', 'actual'))
+        for id, title, stored, actual in drifted:
+            self.stdout.write(f'{title} (#{id}): {stored} -> {actual}')
+        ids = [row[0] for row in drifted]
+        if ids:
+            Collection.objects.filter(pk__in=ids).recount()
+            bump_catalog_version(*ids)
+        self.stdout.write(self.style.SUCCESS(f'Recounted {len(ids)} collections'))
@@ -0,0 +1,23 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from store.bestsellers import CHECKPOINT, update_sales
+from store.models import JobCheckpoint, ProductSales
+
+
+class Command(BaseCommand):
+    help = 'Adds the orders completed since the last run to the best seller and trending rankings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Orders counted per transaction')
+        parser.add_argument('--rebuild', action='store_true', help='Recount every order from scratch')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            ProductSales.objects.all().delete()
+            JobCheckpoint.objects.filter(name=CHECKPOINT).delete()
+        started = perf_counter()
+        counted = update_sales(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Counted {counted} orders in {perf_counter() - started:.1f}s'))
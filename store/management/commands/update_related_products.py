@@ -0,0 +1,25 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from store.models import JobCheckpoint, RelatedProduct
+from store.recommendations import CHECKPOINT, update_related_products
+
+
+class Command(BaseCommand):
+    help = 'Counts products bought together in the orders completed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Orders read per query')
+        parser.add_argument('--flush-pairs', type=int, default=2_000_000,
+                            help='Distinct pairs held in memory before saving')
+        parser.add_argument('--rebuild', action='store_true', help='Recount every order from scratch')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            RelatedProduct.objects.all().delete()
+            JobCheckpoint.objects.filter(name=CHECKPOINT).delete()
+        started = perf_counter()
+        counted = update_related_products(options['batch_size'], options['flush_pairs'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Counted {counted} orders in {perf_counter() - started:.1f}s'))
@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import Max, Min
+
+from store import search
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE store_product ADD COLUMN search_vector tsvector')
+        schema_editor.execute(
+            'CREATE INDEX store_product_search_vector_idx ON store_product USING GIN (search_vector)')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {search.FTS_TABLE} USING fts5(title, description)')
+    else:
+        return
+    Product = apps.get_model('store', 'Product')
+    bounds = Product.objects.using(connection.alias).aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is not None:
+        search.index_product_range(bounds['first'], bounds['last'], using=connection.alias)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE store_product DROP COLUMN search_vector')
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE {search.FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
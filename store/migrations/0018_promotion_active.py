@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-16 22:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promotion',
+            name='active',
+            field=models.BooleanField(default=True),
+        ),
+    ]
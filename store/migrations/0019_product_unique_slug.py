@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-16 22:42
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils.text import slugify
+
+
+def deduplicate_slugs(apps, schema_editor):
+    # The seed data used '-' for every product, suffix duplicates with the id
+    Product = apps.get_model('store', 'Product')
+    duplicates = Product.objects \
+        .values('slug') \
+        .annotate(count=Count('id')) \
+        .filter(count__gt=1) \
+        .values_list('slug', flat=True)
+    products = Product.objects.filter(slug__in=list(duplicates)) | Product.objects.filter(slug='')
+    for product in products.only('id', 'title').iterator():
+        product.slug = f'{slugify(product.title)[:40]}-{product.id}'
+        product.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_promotion_active'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(unique=True),
+        ),
+    ]
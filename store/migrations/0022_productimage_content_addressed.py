@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-16 22:50
+
+import store.uploads
+import store.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_productimage_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=store.uploads.ContentAddressedImageField(db_index=True, hash_field='content_hash', upload_to='store/images', validators=[store.validators.validate_file_size]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-16 22:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales', serialize=False, to='store.product')),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('trending', models.FloatField(default=0)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.collection')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-units', 'product'], name='store_produ_units_bc5f53_idx'), models.Index(fields=['-trending', 'product'], name='store_produ_trendin_7f61aa_idx'), models.Index(fields=['collection', '-units', 'product'], name='store_produ_collect_5cfc8b_idx'), models.Index(fields=['collection', '-trending', 'product'], name='store_produ_collect_5d6a66_idx')],
+            },
+        ),
+    ]
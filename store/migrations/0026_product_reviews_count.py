@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-16 22:58
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_reviews(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Review = apps.get_model('store', 'Review')
+    reviews = Review.objects \
+        .filter(product=OuterRef('pk')) \
+        .order_by() \
+        .values('product')
+    Product.objects.update(
+        reviews_count=Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0),
+        last_review_at=Subquery(reviews.annotate(latest=Max('date')).values('latest')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0025_product_sales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='last_review_at',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reviews_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-date', '-id'], name='store_revie_product_8b166a_idx'),
+        ),
+        migrations.RunPython(count_reviews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:21
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def clamp_discounts(apps, schema_editor):
+    Promotion = apps.get_model('store', 'Promotion')
+    Promotion.objects.filter(discount__lt=0).update(discount=0)
+    Promotion.objects.filter(discount__gt=1).update(discount=1)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0027_cleanup_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='promotion',
+            name='discount',
+            field=models.FloatField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(1)]),
+        ),
+        migrations.RunPython(clamp_discounts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='promotion',
+            constraint=models.CheckConstraint(condition=models.Q(('discount__gte', 0), ('discount__lte', 1)), name='store_promotion_discount_range'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:22
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_completed_at(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    JobCheckpoint = apps.get_model('store', 'JobCheckpoint')
+    # Completion times were not kept, placed_at is the closest known
+    Order.objects.filter(payment_status='C').update(completed_at=F('placed_at'))
+    # Checkpoints held the last order id counted, move them to its keyset position
+    for checkpoint in JobCheckpoint.objects.filter(position__gt=0):
+        last = Order.objects \
+            .filter(payment_status='C', id__lte=checkpoint.position) \
+            .order_by('-id') \
+            .values_list('completed_at', 'id') \
+            .first()
+        if last is not None:
+            checkpoint.timestamp, checkpoint.position = last
+        else:
+            checkpoint.position = 0
+        checkpoint.save(update_fields=['timestamp', 'position'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0028_promotion_discount_range'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobcheckpoint',
+            name='timestamp',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['completed_at', 'id'], name='store_order_complet_210bd2_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0029_order_completed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64, unique=True)),
+            ],
+        ),
+    ]
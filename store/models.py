@@ -1,31 +1,112 @@
 
+from decimal import Decimal
 from uuid import uuid4
 
 from django.contrib import admin
-from django.core.validators import MinValueValidator
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
+from django.utils.text import slugify
 
 from MyShop import settings
+from store.uploads import ContentAddressedImageField
 from store.validators import validate_file_size
 
 
+TAX_RATE = Decimal('1.1')
+
+
 class Promotion(models.Model):
     description = models.CharField(max_length=255)
-    discount = models.FloatField()
+    # Fraction of the price taken off, 0.2 means 20% off
+    discount = models.FloatField(validators=[MinValueValidator(0), MaxValueValidator(1)])
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            # Effective prices would go negative or above the unit price
+            models.CheckConstraint(condition=models.Q(discount__gte=0, discount__lte=1),
+                                   name='store_promotion_discount_range'),
+        ]
+
+
+class CollectionQuerySet(models.QuerySet):
+    def recount(self):
+        """Set `products_count` to the actual number of products."""
+        counts = Product.objects \
+            .filter(collection=OuterRef('pk')) \
+            .order_by() \
+            .values('collection') \
+            .annotate(count=Count('id')) \
+            .values('count')
+        return self.update(products_count=Coalesce(Subquery(counts), 0))
 
 
 class Collection(models.Model):
     title = models.CharField(max_length=255)
     featured_product = models.ForeignKey(
         'Product', on_delete=models.SET_NULL, null=True, related_name='+')
+    # Maintained by the Product signals, see CollectionQuerySet.recount()
+    products_count = models.IntegerField(default=0, editable=False)
+
+    objects = CollectionQuerySet.as_manager()
+
     def __str__(self) -> str:
         return self.title
     class Meta:
         ordering = ['title']
 
+
+PRICE_FIELD = models.DecimalField(max_digits=8, decimal_places=2)
+
+
+def best_discount(product):
+    """Best active promotion discount of the product id in outer field `product`."""
+    return Promotion.objects \
+        .filter(product=OuterRef(product), active=True) \
+        .order_by('-discount') \
+        .values('discount')[:1]
+
+
+def discounted_price(unit_price, product):
+    """`unit_price` after the best active promotion, NULL without one."""
+    return Round(
+        F(unit_price) * (1 - Cast(Subquery(best_discount(product)),
+                                  models.DecimalField(max_digits=5, decimal_places=4))),
+        2, output_field=PRICE_FIELD)
+
+
+def effective_price(unit_price='product__unit_price', product='product_id'):
+    """What the customer pays before tax, as Product.objects.with_prices().
+
+    The defaults price the product of a row referencing it, such as a
+    CartItem.
+    """
+    return Coalesce(discounted_price(unit_price, product), F(unit_price), output_field=PRICE_FIELD)
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_prices(self):
+        """Annotate prices after the best active promotion, computed in SQL.
+
+        `discount` is 0 and `discounted_price` NULL without a promotion,
+        `effective_price` is what the customer pays before tax. Carts and
+        orders are priced with the same effective_price().
+        """
+        return self.annotate(
+            discount=Coalesce(Subquery(best_discount('pk')), Value(0.0)),
+            discounted_price=discounted_price('unit_price', 'pk'),
+            effective_price=Coalesce(F('discounted_price'), F('unit_price'), output_field=PRICE_FIELD),
+            price_with_tax=Round(F('effective_price') * Value(TAX_RATE), 2, output_field=PRICE_FIELD),
+        )
+
+
 class Product(models.Model):
     title = models.CharField(max_length=255)
-    slug = models.SlugField()
+    # Natural key of catalog imports
+    slug = models.SlugField(unique=True)
     description = models.TextField(null=True, blank=True)
     unit_price = models.DecimalField(
         max_digits=6,
@@ -36,17 +117,51 @@ class Product(models.Model):
     last_update = models.DateTimeField(auto_now=True)
     collection = models.ForeignKey(Collection, on_delete=models.PROTECT, related_name='products')
     promotions = models.ManyToManyField(Promotion, blank=True)
+    # Kept by the Review signals, so listings render them without a query
+    reviews_count = models.IntegerField(default=0, editable=False)
+    last_review_at = models.DateField(null=True, blank=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.title
+
+    def save(self, *args, **kwargs):
+        # The API does not take slugs, keep them unique
+        if not self.slug:
+            self.slug = f'{slugify(self.title)[:40]}-{uuid4().hex[:8]}'
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['title']
+        # (value, id) keysets used by cursor pagination
+        indexes = [
+            models.Index(fields=['title', 'id']),
+            models.Index(fields=['unit_price', 'id']),
+            models.Index(fields=['last_update', 'id']),
+        ]
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(
+    # Stored once per content and shared between rows, see store.uploads
+    image = ContentAddressedImageField(
         upload_to='store/images',
-    validators =[validate_file_size])
+        validators=[validate_file_size],
+        hash_field='content_hash',
+        db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
+    # Set by store.tasks.generate_image_variants, see store.images
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        # Keeps the lock on the image content (store.uploads) until the row commits
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class ContentLock(models.Model):
+    """Locked while files of this content are referenced or deleted, see store.uploads.lock_content()."""
+    content_hash = models.CharField(max_length=64, unique=True)
 
 class Customer(models.Model):
     MEMBERSHIP_BRONZE = 'B'
@@ -80,6 +195,20 @@ class Customer(models.Model):
             ('view_history', 'Can view history')
         ]
 
+class OrderQuerySet(models.QuerySet):
+    def completed_after(self, completed_at, id):
+        """Orders completed after the (completed_at, id) keyset position, in that order.
+
+        Ranking jobs checkpoint this position (JobCheckpoint), so orders
+        paid long after they were placed are still counted once.
+        """
+        orders = self.filter(completed_at__isnull=False)
+        if completed_at is not None:
+            orders = orders.filter(Q(completed_at__gte=completed_at) & (
+                Q(completed_at__gt=completed_at) | Q(id__gt=id)))
+        return orders.order_by('completed_at', 'id')
+
+
 class Order(models.Model):
     PAYMENT_STATUS_PENDING = 'P'
     PAYMENT_STATUS_COMPLETE = 'C'
@@ -97,6 +226,10 @@ class Order(models.Model):
         max_digits=10, decimal_places=2, validators=[MinValueValidator(0)], default=0
     )
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT, null=True, blank=True)
+    # Pending orders hold their items until then, see store.inventory
+    reserved_until = models.DateTimeField(null=True, blank=True, db_index=True, editable=False)
+    # Set by store.inventory.commit()
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)
     
     # Guest order fields
     guest_email = models.EmailField(null=True, blank=True)
@@ -104,6 +237,8 @@ class Order(models.Model):
     guest_last_name = models.CharField(max_length=255, null=True, blank=True)
     guest_phone = models.CharField(max_length=255, null=True, blank=True)
 
+    objects = OrderQuerySet.as_manager()
+
     def calculate_subtotal(self):
         """Wylicza sumę produktów bez dostawy"""
         return sum(item.unit_price * item.quantity for item in self.items.all())
@@ -122,6 +257,12 @@ class Order(models.Model):
         permissions = [
             ('cancel_order', 'Can cancel Order'),
         ]
+        indexes = [
+            # Stale pending orders (store.cleanup)
+            models.Index(fields=['payment_status', 'placed_at']),
+            # Completion keyset of the ranking jobs
+            models.Index(fields=['completed_at', 'id']),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.PROTECT, related_name='items')
@@ -130,6 +271,45 @@ class OrderItem(models.Model):
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
 
 
+class RelatedProduct(models.Model):
+    """Products bought together, counted by store.recommendations."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    # Completed orders containing both products
+    orders = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [['product', 'related']]
+        indexes = [models.Index(fields=['product', '-orders'])]
+
+
+class ProductSales(models.Model):
+    """Units sold per product, counted by store.bestsellers."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    # Copy of product.collection, so per-collection rankings read one index
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveIntegerField(default=0)
+    # Time-decayed units, only comparable with each other (see store.bestsellers)
+    trending = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-units', 'product']),
+            models.Index(fields=['-trending', 'product']),
+            models.Index(fields=['collection', '-units', 'product']),
+            models.Index(fields=['collection', '-trending', 'product']),
+        ]
+
+
+class JobCheckpoint(models.Model):
+    """Where an incremental batch job stopped, such as the last order id counted."""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    # Leads `position` in (timestamp, id) keysets, e.g. Order.completed_at
+    timestamp = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
 class Address(models.Model):
     street = models.CharField(max_length=255)
     house_number = models.PositiveIntegerField(default=1)
@@ -150,9 +330,28 @@ class Payment(models.Model):
 '''
 
 
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate `items_count` (units) and `total_price`, summed in SQL."""
+        items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        return self.annotate(
+            items_count=Coalesce(Subquery(items.annotate(units=Sum('quantity')).values('units')), 0),
+            total_price=Coalesce(
+                Subquery(items.annotate(total=Sum(F('quantity') * effective_price())).values('total')),
+                Value(Decimal(0)),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2)),
+        )
+
+    def touch(self):
+        """Record activity on the carts (their items changed), see store.cleanup."""
+        return self.update(updated_at=timezone.now())
+
+
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last activity, also set when the items change (CartQuerySet.touch())
+    updated_at = models.DateTimeField(auto_now=True)
     customer = models.OneToOneField(
         Customer,
         on_delete=models.CASCADE,
@@ -161,6 +360,22 @@ class Cart(models.Model):
         related_name='cart'
     )
 
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Abandoned carts (store.cleanup)
+            models.Index(fields=['updated_at']),
+        ]
+
+
+class CartItemQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate the product's `effective_price` and the line's `total_price`."""
+        return self.annotate(effective_price=effective_price()).annotate(total_price=models.ExpressionWrapper(
+            F('quantity') * F('effective_price'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+
 
 class CartItem(models.Model):
     cart = models.ForeignKey(
@@ -170,6 +385,8 @@ class CartItem(models.Model):
         validators=[MinValueValidator(1)], default=1
     )
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = [['cart', 'product']]
 
@@ -178,4 +395,8 @@ class Review(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
 
-    date = models.DateField(auto_now_add=True)
\ No newline at end of file
+    date = models.DateField(auto_now_add=True)
+
+    class Meta:
+        # Newest-first keyset of the review feed
+        indexes = [models.Index(fields=['product', '-date', '-id'])]
\ No newline at end of file
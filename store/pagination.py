@@ -1,6 +1,174 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from types import SimpleNamespace
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class DefaultPagination(PageNumberPagination):
 
-    page_size = 10
\ No newline at end of file
+    page_size = 10
+
+
+class KeysetPagination(BasePagination):
+    """Opt-in cursor pagination over a (value, id) keyset.
+
+    Enabled with `?pagination=cursor` (or any `?cursor=`), otherwise the
+    request is handled by `fallback_class`, or left unpaginated when it
+    is None. The ordering is taken from the filtered queryset, so it
+    follows `OrderingFilter`, with the primary key as tiebreak. No count
+    query is issued and every page is a single index range scan.
+    """
+    page_size = 10
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    invalid_cursor_message = 'Invalid cursor'
+    fallback_class = None
+
+    def __init__(self):
+        self.fallback = self.fallback_class() if self.fallback_class else None
+
+    def is_enabled(self, request):
+        return (self.cursor_query_param in request.query_params
+                or request.query_params.get(self.mode_query_param) == 'cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.enabled = self.is_enabled(request)
+        if not self.enabled:
+            if self.fallback is None:
+                return None
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.field, self.descending = self.get_ordering(queryset, view)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor['r']
+        descending = self.descending != reverse
+
+        queryset = queryset.order_by(*self.order_by(descending))
+        if queryset._fields:
+            # values() rows need the keyset columns to build cursors from
+            self.pk_name = queryset.model._meta.pk.attname
+            keys = [self.pk_name] + ([self.field_name] if self.field else [])
+            queryset = queryset.values(*queryset._fields, *keys)
+        elif self.field is not None and self.field_name not in queryset.query.annotations:
+            loaded, deferred = queryset.query.deferred_loading
+            if not deferred:
+                # Narrowed with only(), cursors are built from the keyset column
+                queryset = queryset.only(*loaded, self.field_name)
+        if cursor is not None:
+            queryset = queryset.filter(self.after(cursor['v'], cursor['id'], descending))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = cursor is not None, has_more
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.enabled:
+            return self.fallback.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_ordering(self, queryset, view):
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering) \
+            or [getattr(view, 'cursor_ordering', '-pk')]
+        name = ordering[0] if isinstance(ordering[0], str) else '-pk'
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        self.field_name = None
+        if name in ('pk', queryset.model._meta.pk.name):
+            return None, descending
+        if name in queryset.query.annotations:
+            # e.g. effective_price from Product.objects.with_prices()
+            self.field_name = name
+            return queryset.query.annotations[name].output_field, descending
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None, descending
+        if not field.concrete or field.is_relation and not field.many_to_one:
+            return None, descending
+        self.field_name = field.attname
+        return field, descending
+
+    def order_by(self, descending):
+        sign = '-' if descending else ''
+        if self.field is None:
+            return [f'{sign}pk']
+        return [f'{sign}{self.field_name}', f'{sign}pk']
+
+    def after(self, value, pk, descending):
+        lookup = 'lt' if descending else 'gt'
+        if self.field is None:
+            return Q(**{f'pk__{lookup}': pk})
+        # The leading inclusive bound keeps the condition an index range scan
+        name = self.field_name
+        return Q(**{f'{name}__{lookup}e': value}) & (
+            Q(**{f'{name}__{lookup}': value}) | Q(**{f'pk__{lookup}': pk}))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if self.field is not None:
+                cursor['v'] = self.field.to_python(cursor['v'])
+            cursor['r'] = bool(cursor.get('r'))
+            cursor['id']
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, instance, reverse=False):
+        if isinstance(instance, dict):
+            instance = SimpleNamespace(pk=instance[self.pk_name], **instance)
+        cursor = {'id': instance.pk, 'r': int(reverse)}
+        if self.field is not None:
+            value = getattr(instance, self.field_name)
+            if isinstance(value, float):
+                # JSON numbers round-trip exactly, so rows tied with it compare equal
+                cursor['v'] = value
+            else:
+                cursor['v'] = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+    def get_cursor_link(self, instance, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(instance, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_cursor_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_cursor_link(self.page[0], reverse=True)
+
+
+class DefaultKeysetPagination(KeysetPagination):
+    fallback_class = DefaultPagination
+
+
+class ReviewPagination(KeysetPagination):
+    """Always paginated, in the queryset's newest-first (date, id) order."""
+    def is_enabled(self, request):
+        return True
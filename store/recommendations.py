@@ -0,0 +1,154 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_ranking_version
+from .models import JobCheckpoint, Order, OrderItem, RelatedProduct
+
+try:
+    import numpy as np
+except ImportError:  # recommendations are optional, related lists stay empty
+    np = None
+
+# Frequently bought together: RelatedProduct counts the completed orders
+# containing both products, keeping the STORE_RELATED_PRODUCTS_KEEP best
+# neighbours per product. update_related_products() adds the orders
+# completed since its last run (JobCheckpoint 'related_products', by
+# Order.completed_at so late payments are counted too); counts of pairs
+# that fell out of a product's kept list restart from zero, so rarely
+# bought pairs are approximate while frequent ones stay exact.
+CHECKPOINT = 'related_products'
+# Bulk orders say little about what goes together and cost size² pairs
+MAX_ORDER_LINES = 50
+logger = logging.getLogger(__name__)
+
+
+def encode(products, related):
+    return (products.astype(np.int64) << 32) | related.astype(np.int64)
+
+
+def decode(keys):
+    return keys >> 32, keys & 0xFFFFFFFF
+
+
+def order_pairs(order_ids, product_ids):
+    """Keys of the (product, related) pairs of order lines, both ways."""
+    lines = np.unique(encode(order_ids, product_ids))
+    order_ids, product_ids = decode(lines)
+    _, starts, sizes = np.unique(order_ids, return_index=True, return_counts=True)
+    pairs = [np.empty(0, dtype=np.int64)]
+    for size in np.unique(sizes):
+        if size < 2 or size > MAX_ORDER_LINES:
+            continue
+        # One row per order of this size, every product against every other
+        products = product_ids[starts[sizes == size][:, None] + np.arange(size)]
+        left = np.repeat(products, size, axis=1)
+        right = np.tile(products, (1, size))
+        other = left != right
+        pairs.append(encode(left[other], right[other]))
+    return np.concatenate(pairs)
+
+
+def add_counts(keys, counts, new_keys):
+    """Merge pair keys into sorted (keys, counts)."""
+    keys = np.concatenate([keys, new_keys])
+    counts = np.concatenate([counts, np.ones(len(new_keys), dtype=np.int64)])
+    keys, positions = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(positions, weights=counts, minlength=len(keys)).astype(np.int64)
+
+
+def save_counts(keys, counts, keep, chunk_size=500):
+    """Add pair counts to RelatedProduct, keeping the top `keep` per product."""
+    products, related = decode(keys)
+    product_ids = np.unique(products)
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size].tolist()
+        totals = {}
+        for product_id, related_id, orders in RelatedProduct.objects \
+                .filter(product_id__in=chunk) \
+                .values_list('product_id', 'related_id', 'orders'):
+            totals.setdefault(product_id, {})[related_id] = orders
+        selected = (products >= chunk[0]) & (products <= chunk[-1])
+        for product_id, related_id, orders in zip(
+                products[selected].tolist(), related[selected].tolist(), counts[selected].tolist()):
+            neighbours = totals.setdefault(product_id, {})
+            neighbours[related_id] = neighbours.get(related_id, 0) + orders
+
+        rows = []
+        for product_id, neighbours in totals.items():
+            best = sorted(neighbours.items(), key=lambda item: (-item[1], item[0]))[:keep]
+            rows.extend(RelatedProduct(product_id=product_id, related_id=related_id, orders=orders)
+                        for related_id, orders in best)
+        RelatedProduct.objects.filter(product_id__in=chunk).delete()
+        RelatedProduct.objects.bulk_create(rows, batch_size=2000)
+
+
+def update_related_products(batch_size=10000, flush_pairs=2_000_000, keep=None):
+    """Count the product pairs of orders completed since the last run.
+
+    Orders are read `batch_size` at a time and their pair counts kept in
+    NumPy arrays, saved whenever they exceed `flush_pairs` distinct pairs,
+    so memory stays bounded however many orders are new. Orders completed
+    in the last STORE_RANKINGS_DELAY seconds wait for the next run.
+    Returns the number of orders counted.
+    """
+    if np is None:
+        raise ImproperlyConfigured('Related products need NumPy')
+    keep = keep or settings.STORE_RELATED_PRODUCTS_KEEP
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT)
+    until = timezone.now() - timedelta(seconds=settings.STORE_RANKINGS_DELAY)
+    orders = Order.objects.filter(completed_at__lt=until)
+
+    # (completed_at, id) of the last order counted, and saved
+    position = cursor = (checkpoint.timestamp, checkpoint.position)
+    counted = pending = 0
+    keys = counts = np.empty(0, dtype=np.int64)
+
+    def flush():
+        """Save the pending counts, or return the checkpoint position if it moved.
+
+        The checkpoint row is locked and re-read first: when an overlapping
+        run moved it past `position` the pending counts would count its
+        orders twice, so they are dropped for that run's position.
+        """
+        with transaction.atomic():
+            saved = JobCheckpoint.objects.select_for_update().get(name=CHECKPOINT)
+            if (saved.timestamp, saved.position) != position:
+                return saved.timestamp, saved.position
+            save_counts(keys, counts, keep)
+            saved.timestamp, saved.position = cursor
+            saved.save(update_fields=['timestamp', 'position', 'updated_at'])
+        return None
+
+    while True:
+        batch = list(orders.completed_after(*cursor).values_list('completed_at', 'id')[:batch_size])
+        if batch:
+            lines = OrderItem.objects \
+                .filter(order_id__in=[order_id for _, order_id in batch]) \
+                .values_list('order_id', 'product_id')
+            lines = np.array(list(lines), dtype=np.int64).reshape(-1, 2)
+            keys, counts = add_counts(keys, counts, order_pairs(lines[:, 0], lines[:, 1]))
+            cursor = batch[-1]
+            pending += len(batch)
+            logger.info('Counted %s orders, %s pairs pending', counted + pending, len(keys))
+        done = len(batch) < batch_size
+        if cursor != position and (done or len(keys) >= flush_pairs):
+            moved = flush()
+            if moved:
+                logger.info('Checkpoint moved by another run, resuming after it')
+                cursor, done = moved, False
+            else:
+                counted += pending
+            position = cursor
+            pending = 0
+            keys = counts = np.empty(0, dtype=np.int64)
+        if done:
+            break
+
+    if counted:
+        bump_ranking_version(CHECKPOINT)
+    return counted
@@ -0,0 +1,99 @@
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+# PostgreSQL keeps a weighted tsvector in store_product.search_vector (GIN
+# indexed), SQLite a copy of the searchable text in an FTS5 table whose
+# rowid is the product id. Titles weigh more than descriptions in both.
+# The index is created in migration 0017 and kept in sync from the
+# Product signals; other databases fall back to LIKE.
+SUPPORTED_VENDORS = ('postgresql', 'sqlite')
+FTS_TABLE = 'store_product_fts'
+VECTOR_SQL = ("setweight(to_tsvector(%s::regconfig, coalesce(title, '')), 'A') || "
+              "setweight(to_tsvector(%s::regconfig, coalesce(description, '')), 'B')")
+
+
+def is_supported(using='default'):
+    return connections[using].vendor in SUPPORTED_VENDORS
+
+
+def _reindex(condition, params, using):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            config = settings.STORE_SEARCH_CONFIG
+            cursor.execute(
+                f'UPDATE store_product SET search_vector = {VECTOR_SQL} WHERE {condition.format(id="id")}',
+                [config, config, *params])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE {condition.format(id="rowid")}', params)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+                f"SELECT id, title, coalesce(description, '') FROM store_product "
+                f'WHERE {condition.format(id="id")}', params)
+
+
+def index_products(ids, using='default'):
+    ids = list(ids)
+    if ids:
+        _reindex('{id} IN (%s)' % ', '.join(['%s'] * len(ids)), ids, using)
+
+
+def index_product_range(first_id, last_id, using='default'):
+    _reindex('{id} BETWEEN %s AND %s', [first_id, last_id], using)
+
+
+def remove_products(ids, using='default'):
+    ids = list(ids)
+    connection = connections[using]
+    if ids and connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN (%s)' % ', '.join(['%s'] * len(ids)), ids)
+
+
+def remove_orphans(using='default'):
+    """Delete FTS rows left behind by deleted products.
+
+    PostgreSQL keeps the vector on the product row, so it has none.
+    """
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid NOT IN (SELECT id FROM store_product)')
+
+
+def parse_terms(terms):
+    """Split search terms into plain word tokens, dropping query syntax."""
+    return [token.lower() for term in terms for token in re.findall(r'\w+', term)]
+
+
+def search_products(queryset, terms):
+    """Filter products matching every term as a word prefix.
+
+    Matches are annotated with `search_rank`, higher is more relevant.
+    """
+    tokens = parse_terms(terms)
+    if not tokens:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        config = settings.STORE_SEARCH_CONFIG
+        query = ' & '.join(f'{token}:*' for token in tokens)
+        tsquery = 'to_tsquery(%s::regconfig, %s)'
+        matches = RawSQL(f'SELECT id FROM store_product WHERE search_vector @@ {tsquery}', (config, query))
+        # float8 so the rank round-trips exactly through pagination cursors
+        rank = RawSQL(f'ts_rank(store_product.search_vector, {tsquery})::float8', (config, query),
+                      output_field=FloatField())
+    else:
+        query = ' '.join(f'"{token}"*' for token in tokens)
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (query,))
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = store_product.id', (query,),
+            output_field=FloatField())
+    return queryset.filter(id__in=matches).annotate(search_rank=rank)
@@ -1,10 +1,11 @@
-
-from decimal import Decimal
-
-from django.db import transaction
+from django.db import models, transaction
 from rest_framework import serializers, viewsets
 from store.models import Product, Collection, Review, Cart, CartItem, Customer, Order, OrderItem, ProductImage, Address
 from store.signals import order_created
+from store.fieldsets import SparseFieldsetMixin
+from store.images import variant_urls
+from store import carts, inventory
+from tags.models import TaggedItem
 
 
 class CollectionSerializer(serializers.ModelSerializer):
@@ -14,23 +15,67 @@ class CollectionSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'products_count']
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    # Derivative URLs by variant and format, empty until they are rendered
+    variants = serializers.SerializerMethodField(method_name='get_variants')
 
     def create(self, validated_data):
         product_id = self.context['product_id']
         return ProductImage.objects.create(product_id=product_id, **validated_data)
+
+    def get_variants(self, image: ProductImage):
+        return variant_urls(image.variants, self.context.get('request'))
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'variants']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        products = data.all() if isinstance(data, models.manager.BaseManager) else data
+        if 'tags' in self.child.fields:
+            # Tags of the whole page in one query
+            products = TaggedItem.objects.prefetch_tags(products)
+        return super().to_representation(products)
+
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
+    tags = serializers.SerializerMethodField()
     class Meta:
         model = Product
-        fields = ['id', 'title', 'unit_price', 'inventory', 'price_with_tax', 'collection', 'images']
+        fields = ['id', 'title', 'unit_price', 'effective_price', 'inventory', 'price_with_tax', 'collection',
+                  'reviews_count', 'last_review_at', 'tags', 'images']
+        list_serializer_class = ProductListSerializer
+    # Prices are annotations, always loaded
+    sparse_columns = {'effective_price': [], 'price_with_tax': [], 'collection': ['collection', 'collection__title']}
+    sparse_select_related = {'collection': ['collection']}
+    sparse_prefetch_related = {'images': ['images']}
+    effective_price = serializers.SerializerMethodField(method_name='get_effective_price')
     price_with_tax =serializers.SerializerMethodField(method_name='get_price_with_tax')
     collection = serializers.StringRelatedField()
+
+    def get_price(self, product: Product, name):
+        # Prices are annotated by Product.objects.with_prices(), products
+        # saved through this serializer are not and get them in one query
+        if not hasattr(product, name):
+            prices = Product.objects.with_prices() \
+                .values('effective_price', 'price_with_tax') \
+                .get(pk=product.pk)
+            for key, value in prices.items():
+                setattr(product, key, value)
+        return getattr(product, name)
+
+    def get_effective_price(self, product: Product):
+        return self.get_price(product, 'effective_price')
+
     def get_price_with_tax(self, product: Product):
-        return product.unit_price * Decimal(1.1)
+        return self.get_price(product, 'price_with_tax')
+
+    def get_tags(self, product: Product):
+        # Set for whole pages by ProductListSerializer
+        if not hasattr(product, 'tag_labels'):
+            TaggedItem.objects.prefetch_tags([product])
+        return product.tag_labels
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -51,7 +96,10 @@ class CartItemSerializer(serializers.ModelSerializer):
     total_price = serializers.SerializerMethodField(method_name='get_total_price')
 
     def get_total_price(self, cart_item: CartItem):
-        return cart_item.quantity * cart_item.product.unit_price
+        # Annotated by CartItem.objects.with_totals()
+        if hasattr(cart_item, 'total_price'):
+            return cart_item.total_price
+        return CartItem.objects.with_totals().values_list('total_price', flat=True).get(pk=cart_item.pk)
 
     class Meta:
         model = CartItem
@@ -93,17 +141,40 @@ class AddCartItemSearializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['id', 'product_id', 'quantity']
 
+class RedisCartItemSerializer(serializers.Serializer):
+    # Input of store.carts.RedisCart.add(), which checks the product and stock
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=32767, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] != 'remove' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': ['This field is required.']})
+        return attrs
+
+class CartBatchSerializer(serializers.Serializer):
+    # Applied in order by store.carts.apply_to_cart() / RedisCart.apply()
+    operations = serializers.ListField(child=CartOperationSerializer(), min_length=1, max_length=100)
+
 class UpdateCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['quantity']
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
     items = CartItemSerializer(many=True, read_only=True)
     total_price = serializers.SerializerMethodField(method_name='get_total_price')
+    sparse_prefetch_related = {
+        'items': [models.Prefetch('items', CartItem.objects.with_totals().select_related('product').order_by('id'))],
+    }
 
     def get_total_price(self, cart):
-        return  sum([item.quantity * item.product.unit_price for item in cart.items.all()])
+        # Annotated by Cart.objects.with_totals(), new carts have no items
+        return getattr(cart, 'total_price', 0)
 
     class Meta:
         model = Cart
@@ -128,9 +199,10 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['id', 'product', 'unit_price', 'quantity']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     #customer = CustomerSerializer(read_only=True)
     items = OrderItemSerializer(many=True)
+    sparse_prefetch_related = {'items': ['items__product']}
     class Meta:
         model = Order
         fields = ['id', 'customer', 'placed_at', 'payment_status', 'total_price', 'items']
@@ -140,10 +212,22 @@ class UpdateOrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['payment_status']
 
+    def update(self, instance, validated_data):
+        # Status changes also commit or release the reserved stock
+        payment_status = validated_data.get('payment_status')
+        if payment_status == Order.PAYMENT_STATUS_COMPLETE:
+            return inventory.commit(instance.pk)
+        if payment_status == Order.PAYMENT_STATUS_FAILED and inventory.release(instance.pk):
+            instance.refresh_from_db()
+            return instance
+        return super().update(instance, validated_data)
+
 class CreateOrderSerializer(serializers.Serializer):
     cart_id = serializers.UUIDField()
 
     def validate_cart_id(self, cart_id):
+        # Carts held in Redis become rows at checkout
+        carts.materialize(cart_id)
         if not Cart.objects.filter(pk=cart_id).exists():
             raise serializers.ValidationError('Cart does not exist')
         if CartItem.objects.filter(cart_id=cart_id).count() == 0:
@@ -157,18 +241,22 @@ class CreateOrderSerializer(serializers.Serializer):
             customer= Customer.objects.get(user_id=self.context['user_id'])
             order = Order.objects.create(customer=customer)
 
+            # Charged the promotion prices the catalog shows
             cart_items = CartItem.objects\
+                          .with_totals()\
                           .select_related('product')\
                           .filter(cart_id=cart_id)
             order_items=[
                 OrderItem(
                     order = order,
                     product = item.product,
-                    unit_price = item.product.unit_price,
+                    unit_price = item.effective_price,
                     quantity = item.quantity
                 ) for item in cart_items
             ]
             OrderItem.objects.bulk_create(order_items)
+            # Holds the items until payment, rolls the order back when out of stock
+            inventory.reserve(order)
 
             # Calculate and save total price after creating order items
             order.total_price = order.calculate_total()
@@ -201,6 +289,8 @@ class GuestOrderSerializer(serializers.Serializer):
     post_code = serializers.CharField(max_length=8)
 
     def validate_cart_id(self, cart_id):
+        # Carts held in Redis become rows at checkout
+        carts.materialize(cart_id)
         if not Cart.objects.filter(pk=cart_id).exists():
             raise serializers.ValidationError('Cart does not exist')
         if CartItem.objects.filter(cart_id=cart_id).count() == 0:
@@ -235,18 +325,22 @@ class GuestOrderSerializer(serializers.Serializer):
             )
 
             # Create order items from cart
+            # Charged the promotion prices the catalog shows
             cart_items = CartItem.objects\
+                          .with_totals()\
                           .select_related('product')\
                           .filter(cart_id=cart_id)
             order_items=[
                 OrderItem(
                     order = order,
                     product = item.product,
-                    unit_price = item.product.unit_price,
+                    unit_price = item.effective_price,
                     quantity = item.quantity
                 ) for item in cart_items
             ]
             OrderItem.objects.bulk_create(order_items)
+            # Holds the items until payment, rolls the order back when out of stock
+            inventory.reserve(order)
 
             # Calculate and save total price after creating order items
             order.total_price = order.calculate_total()
@@ -1,8 +1,18 @@
-
-from django.db.models.signals import post_save
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
 from django.dispatch import receiver
-from store.models import Customer, Cart
+from django.utils import timezone
+from store import images, search, suggest
+from store import tasks
+from store.cache import bump_catalog_version, bump_cart_version, bump_cart_versions, bump_reviews_version, \
+    touch_products
+from store.models import Customer, Cart, CartItem, Product, ProductImage, ProductSales, Collection, Promotion, Review
+from store.uploads import lock_content
+from tags.models import Tag, TaggedItem
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -13,4 +23,229 @@ def create_customer_for_new_user(sender, **kwargs):
 @receiver(post_save, sender=Customer)
 def create_customer_cart(sender, instance, created, **kwargs):
     if created:
-        Cart.objects.create(customer=instance)
\ No newline at end of file
+        Cart.objects.create(customer=instance)
+
+
+# Catalog cache invalidation
+
+@receiver(pre_save, sender=Product)
+def remember_product_collection(sender, instance, **kwargs):
+    # Products moved to another collection invalidate both collections,
+    # price changes the carts holding them
+    instance._previous_collection_id = instance._previous_unit_price = None
+    if instance.pk:
+        instance._previous_collection_id, instance._previous_unit_price = Product.objects \
+            .filter(pk=instance.pk) \
+            .values_list('collection_id', 'unit_price') \
+            .first() or (None, None)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    bump_catalog_version(
+        instance.collection_id,
+        getattr(instance, '_previous_collection_id', None))
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def count_collection_products(sender, instance, created=False, **kwargs):
+    # F() updates, so concurrent saves never lose a change
+    previous_id = getattr(instance, '_previous_collection_id', None)
+    if kwargs['signal'] is post_delete:
+        changes = {instance.collection_id: -1}
+    elif created:
+        changes = {instance.collection_id: 1}
+    elif previous_id is not None and previous_id != instance.collection_id:
+        changes = {previous_id: -1, instance.collection_id: 1}
+    else:
+        return
+    for collection_id, change in changes.items():
+        Collection.objects.filter(pk=collection_id).update(products_count=F('products_count') + change)
+
+@receiver(post_save, sender=Product)
+def move_product_sales(sender, instance, created, **kwargs):
+    # Keep the per-collection best seller rankings in step
+    previous_id = getattr(instance, '_previous_collection_id', None)
+    if not created and previous_id is not None and previous_id != instance.collection_id:
+        ProductSales.objects.filter(product=instance).update(collection_id=instance.collection_id)
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_image(sender, instance, **kwargs):
+    # Images are part of the product, so it counts as updated (Last-Modified)
+    touch_products(Product.objects.filter(pk=instance.product_id))
+
+# Image files are shared by content (store.uploads), the last row
+# referencing one deletes it, once the transaction has committed
+
+def release_image_files(name, digest, variants):
+    with transaction.atomic():
+        if digest:
+            # Uploads of the same content wait until the files are gone
+            lock_content(digest)
+        if name and not ProductImage.objects.filter(image=name).exists():
+            ProductImage.image.field.storage.delete(name)
+        if digest and not ProductImage.objects.filter(content_hash=digest).exists():
+            for path in images.variant_paths(variants):
+                ProductImage.image.field.storage.delete(path)
+
+@receiver(pre_save, sender=ProductImage)
+def remember_image_file(sender, instance, **kwargs):
+    instance._previous_file = None
+    if instance.pk:
+        instance._previous_file = ProductImage.objects \
+            .filter(pk=instance.pk) \
+            .values_list('image', 'content_hash', 'variants') \
+            .first()
+
+@receiver(post_save, sender=ProductImage)
+def release_replaced_image(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_file', None)
+    if previous is not None and previous[0] != instance.image.name:
+        transaction.on_commit(lambda: release_image_files(*previous))
+
+@receiver(post_delete, sender=ProductImage)
+def release_deleted_image(sender, instance, **kwargs):
+    file = (instance.image.name, instance.content_hash, instance.variants)
+    transaction.on_commit(lambda: release_image_files(*file))
+
+@receiver(post_save, sender=ProductImage)
+def schedule_image_variants(sender, instance, **kwargs):
+    if not instance.image:
+        return
+    if settings.STORE_IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(lambda: tasks.generate_image_variants.delay(instance.pk))
+    else:
+        tasks.generate_image_variants(instance.pk)
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_collection(sender, instance, created=False, **kwargs):
+    bump_catalog_version(instance.pk)
+    if kwargs['signal'] is post_save and not created:
+        # Products show the collection title
+        Product.objects.filter(collection=instance).update(last_update=timezone.now())
+
+def reprice_products(products):
+    # Promotions change effective prices, so the products count as updated
+    # and the carts holding them have new totals
+    touch_products(products)
+    bump_cart_versions(CartItem.objects
+                       .filter(product__in=products)
+                       .values_list('cart_id', flat=True)
+                       .distinct())
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def invalidate_product_promotions(sender, instance, action, reverse, pk_set, **kwargs):
+    # instance is a Product, or a Promotion when changed from the reverse side;
+    # on clear the affected products are only known before the rows go away
+    if not reverse:
+        if action.startswith('post_'):
+            reprice_products(Product.objects.filter(pk=instance.pk))
+    elif action == 'pre_clear':
+        reprice_products(Product.objects.filter(promotions=instance))
+    elif action in ('post_add', 'post_remove'):
+        reprice_products(Product.objects.filter(pk__in=pk_set))
+
+@receiver(post_save, sender=Promotion)
+@receiver(pre_delete, sender=Promotion)
+def invalidate_promotion(sender, instance, **kwargs):
+    reprice_products(Product.objects.filter(promotions=instance))
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def invalidate_product_tags(sender, instance, **kwargs):
+    # Tags are part of the product payload
+    if instance.content_type_id == ContentType.objects.get_for_model(Product).id:
+        touch_products(Product.objects.filter(pk=instance.object_id))
+
+def tagged_product_ids(tag):
+    return TaggedItem.objects \
+        .filter(tag=tag, content_type=ContentType.objects.get_for_model(Product)) \
+        .values_list('object_id', flat=True)
+
+@receiver(post_save, sender=Tag)
+def invalidate_tag(sender, instance, created, **kwargs):
+    # Renamed labels show in every tagged product
+    if not created:
+        touch_products(Product.objects.filter(pk__in=tagged_product_ids(instance)))
+
+@receiver(pre_delete, sender=Tag)
+def remember_tagged_products(sender, instance, **kwargs):
+    # The tagged items are deleted (cascade) before post_delete
+    instance._tagged_product_ids = list(tagged_product_ids(instance))
+
+@receiver(post_delete, sender=Tag)
+def invalidate_deleted_tag(sender, instance, **kwargs):
+    touch_products(Product.objects.filter(pk__in=getattr(instance, '_tagged_product_ids', [])))
+
+
+# Full-text search index
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using, **kwargs):
+    search.index_products([instance.pk], using=using)
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using, **kwargs):
+    search.remove_products([instance.pk], using=using)
+
+
+# Title suggestions (in-process trie of this process; others poll)
+
+@receiver(post_save, sender=Product)
+def update_suggestions(sender, instance, **kwargs):
+    pk, title, slug = instance.pk, instance.title, instance.slug
+    transaction.on_commit(lambda: suggest.get_index().update(pk, title, slug))
+
+@receiver(post_delete, sender=Product)
+def remove_suggestions(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: suggest.get_index().delete(pk))
+
+
+# Cart and review versions (conditional GET)
+
+@receiver(post_save, sender=Product)
+def invalidate_product_carts(sender, instance, created, **kwargs):
+    # Cart totals and summaries are cached per cart version
+    previous = getattr(instance, '_previous_unit_price', None)
+    if not created and previous is not None and previous != instance.unit_price:
+        bump_cart_versions(CartItem.objects.filter(product=instance).values_list('cart_id', flat=True))
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def invalidate_cart_item(sender, instance, **kwargs):
+    bump_cart_version(instance.cart_id)
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def touch_cart(sender, instance, **kwargs):
+    # Carts in use are not collected as abandoned (store.cleanup)
+    Cart.objects.filter(pk=instance.cart_id).touch()
+
+@receiver(post_delete, sender=Cart)
+def invalidate_cart(sender, instance, **kwargs):
+    bump_cart_version(instance.pk)
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviews(sender, instance, **kwargs):
+    bump_reviews_version(instance.product_id)
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def count_product_reviews(sender, instance, created=False, **kwargs):
+    # F() updates like the collection product counts; the product payload
+    # shows the count, so the product is touched as well
+    if kwargs['signal'] is post_delete:
+        latest = Review.objects.filter(product_id=OuterRef('pk')).order_by('-date').values('date')[:1]
+        changes = {'reviews_count': F('reviews_count') - 1, 'last_review_at': Subquery(latest)}
+    elif created:
+        changes = {'reviews_count': F('reviews_count') + 1,
+                   'last_review_at': Greatest(Coalesce('last_review_at', Value(instance.date)), Value(instance.date))}
+    else:
+        return
+    products = Product.objects.filter(pk=instance.product_id)
+    products.update(**changes)
+    touch_products(products)
@@ -0,0 +1,164 @@
+import threading
+from time import monotonic
+
+from django.conf import settings
+from django.db.models import Count, Max
+from rest_framework.filters import OrderingFilter
+
+from .filters import ProductFilter
+from .models import Product
+
+try:
+    import numpy as np
+except ImportError:  # the snapshot is optional, list requests then go to the DB
+    np = None
+
+
+class CatalogSnapshot:
+    """Per-process columnar copy of the fields product listings filter and sort on.
+
+    Columns are NumPy arrays sorted by id, prices in cents. `refresh()` polls
+    `max(Product.last_update)` and the product count; changed rows are
+    merged in place, a count mismatch (deleted products) reloads everything.
+    Rows changed through `QuerySet.update()` keep their `last_update` and are
+    only picked up by the next full reload.
+    """
+    orderings = ['id', 'title', 'unit_price', 'effective_price', 'last_update']
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.columns = None
+        self.watermark = None
+        self.checked_at = None
+
+    def load(self, queryset):
+        rows = list(queryset.with_prices().values_list(
+            'id', 'collection_id', 'unit_price', 'effective_price', 'inventory', 'last_update', 'title'))
+        if not rows:
+            return {
+                'id': np.empty(0, dtype=np.int64),
+                'collection_id': np.empty(0, dtype=np.int64),
+                'unit_price': np.empty(0, dtype=np.int64),
+                'effective_price': np.empty(0, dtype=np.int64),
+                'inventory': np.empty(0, dtype=np.int32),
+                'last_update': np.empty(0, dtype=np.int64),
+                'title': np.empty(0, dtype=object),
+            }
+        ids, collection_ids, prices, effective_prices, inventory, updated, titles = zip(*rows)
+        return {
+            'id': np.array(ids, dtype=np.int64),
+            'collection_id': np.array(collection_ids, dtype=np.int64),
+            'unit_price': np.array([int(price * 100) for price in prices], dtype=np.int64),
+            'effective_price': np.array([int(price * 100) for price in effective_prices], dtype=np.int64),
+            'inventory': np.array(inventory, dtype=np.int32),
+            'last_update': np.array([int(value.timestamp() * 1_000_000) for value in updated], dtype=np.int64),
+            'title': np.array(titles, dtype=object),
+        }
+
+    def refresh(self):
+        interval = settings.STORE_CATALOG_SNAPSHOT_INTERVAL
+        if self.checked_at is not None and monotonic() - self.checked_at < interval:
+            return
+        with self.lock:
+            if self.checked_at is not None and monotonic() - self.checked_at < interval:
+                return
+            state = Product.objects.aggregate(watermark=Max('last_update'), count=Count('id'))
+            if self.columns is None or self.watermark is None:
+                self.replace(self.load(Product.objects.order_by('id')), state['watermark'])
+            elif state['watermark'] != self.watermark:
+                changed = self.load(Product.objects.filter(last_update__gte=self.watermark).order_by('id'))
+                self.replace(self.merge(changed), state['watermark'])
+            if len(self.columns['id']) != state['count']:
+                self.replace(self.load(Product.objects.order_by('id')), state['watermark'])
+            self.checked_at = monotonic()
+
+    def merge(self, changed):
+        ids = self.columns['id']
+        if not len(ids):
+            return changed
+        positions = np.searchsorted(ids, changed['id'])
+        existing = ids[np.minimum(positions, len(ids) - 1)] == changed['id']
+        columns = {}
+        for name in changed:
+            column = self.columns[name].copy()
+            column[positions[existing]] = changed[name][existing]
+            columns[name] = np.concatenate([column, changed[name][~existing]])
+        order = np.argsort(columns['id'], kind='stable')
+        return {name: column[order] for name, column in columns.items()}
+
+    def replace(self, columns, watermark):
+        # Ranks let titles sort with the numeric columns (in code point order)
+        _, columns['title_rank'] = np.unique(columns['title'], return_inverse=True)
+        # Readers hold on to the previous dict, so swap rather than mutate
+        self.columns = columns
+        self.watermark = watermark
+
+    def query(self, view):
+        """Ordered ids matching the list request, or None when unsupported."""
+        request = view.request
+        params = request.query_params
+        if params.get('search') or view.paginator.is_enabled(request):
+            return None
+        filterset = ProductFilter(params, queryset=Product.objects.none())
+        if not filterset.is_valid() or filterset.form.cleaned_data.get('tag'):
+            # Tags are not part of the snapshot
+            return None
+        ordering = OrderingFilter().get_ordering(request, Product.objects.none(), view) \
+            or Product._meta.ordering
+        if any(field.lstrip('-') not in self.orderings for field in ordering):
+            return None
+
+        self.refresh()
+        columns = self.columns
+        mask = np.ones(len(columns['id']), dtype=bool)
+        filters = filterset.form.cleaned_data
+        if filters.get('collection_id') is not None:
+            mask &= columns['collection_id'] == filters['collection_id'].pk
+        if filters.get('unit_price__lt') is not None:
+            mask &= columns['effective_price'] < float(filters['unit_price__lt'] * 100)
+        if filters.get('unit_price__gt') is not None:
+            mask &= columns['effective_price'] > float(filters['unit_price__gt'] * 100)
+
+        # lexsort sorts by the last key first, id breaks ties
+        keys = [columns['id'][mask]]
+        for field in reversed(ordering):
+            name = field.lstrip('-')
+            key = columns['title_rank' if name == 'title' else name][mask]
+            keys.append(-key if field.startswith('-') else key)
+        return columns['id'][mask][np.lexsort(keys)]
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    global _snapshot
+    if np is None or not settings.STORE_CATALOG_SNAPSHOT:
+        return None
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = CatalogSnapshot()
+    return _snapshot
+
+
+class CatalogSnapshotMixin:
+    """Answer product list requests from the catalog snapshot when enabled.
+
+    Only the current page is loaded from the database.
+    """
+    def list(self, request, *args, **kwargs):
+        snapshot = get_snapshot()
+        ids = snapshot.query(self) if snapshot is not None else None
+        if ids is None:
+            return super().list(request, *args, **kwargs)
+
+        page = [int(id) for id in self.paginate_queryset(ids)]
+        products = {
+            product['id'] if isinstance(product, dict) else product.pk: product
+            for product in self.get_queryset().filter(pk__in=page)
+        }
+        # Products deleted since the last refresh are skipped
+        serializer = self.get_serializer([products[id] for id in page if id in products], many=True)
+        return self.get_paginated_response(serializer.data)
@@ -0,0 +1,212 @@
+import heapq
+import re
+import threading
+import unicodedata
+from time import monotonic
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+from .models import Product
+
+# Most suggestions a request can ask for, and the size of the ranked list
+# each trie node keeps
+MAX_LIMIT = 20
+
+
+def parse_limit(value, default=10):
+    if not value:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValidationError({'limit': f'Expected a number from 1 to {MAX_LIMIT}.'})
+    return limit
+
+
+def tokenize(text):
+    """Lowercase word tokens without diacritics ("Żółta Łódź" -> zolta, lodz)."""
+    text = unicodedata.normalize('NFKD', text.lower().replace('ł', 'l'))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r'\w+', text)
+
+
+class Node:
+    __slots__ = ('children', 'ids', 'size', 'top')
+
+    def __init__(self):
+        self.children = {}
+        # Products with a token ending here
+        self.ids = set()
+        # Tokens in the subtree
+        self.size = 0
+        # Best MAX_LIMIT product ids of the subtree, None when stale
+        self.top = None
+
+
+class SuggestIndex:
+    """Per-process prefix trie over the tokens of product titles.
+
+    Every node caches the most popular products of its subtree, so a
+    single-word prefix is one walk down the trie. Popularity is the number
+    of units ordered. Like the catalog snapshot, `refresh()` polls
+    `max(Product.last_update)` and the product count and merges changed
+    products; saves in this process are applied right away from the
+    Product signals. Popularity is reloaded every
+    STORE_SUGGEST_REBUILD_INTERVAL seconds.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.root = Node()
+        # id -> (rank key, title, slug, tokens)
+        self.products = {}
+        self.watermark = None
+        self.checked_at = None
+        self.built_at = None
+
+    def rank(self, id):
+        return self.products[id][0]
+
+    def add(self, id, title, slug, popularity):
+        self.remove(id)
+        tokens = set(tokenize(title))
+        self.products[id] = ((-popularity, title.lower(), id), title, slug, tokens)
+        for token in tokens:
+            node = self.root
+            path = [node]
+            for char in token:
+                node = node.children.setdefault(char, Node())
+                path.append(node)
+            node.ids.add(id)
+            for node in path:
+                node.size += 1
+                if node.top is not None:
+                    node.top = heapq.nsmallest(MAX_LIMIT, {*node.top, id}, key=self.rank)
+
+    def remove(self, id):
+        product = self.products.get(id)
+        if product is None:
+            return
+        for token in product[3]:
+            path = [self.root]
+            for char in token:
+                path.append(path[-1].children[char])
+            path[-1].ids.discard(id)
+            for depth, node in enumerate(path):
+                node.size -= 1
+                if node.top is not None and id in node.top:
+                    node.top = None
+                if depth and not node.size:
+                    # Prune the emptied branch
+                    del path[depth - 1].children[token[depth - 1]]
+                    break
+        del self.products[id]
+
+    def popularity(self, id):
+        product = self.products.get(id)
+        return -product[0][0] if product else 0
+
+    def top(self, node):
+        if node.top is None:
+            candidates = set(node.ids)
+            for child in node.children.values():
+                candidates.update(self.top(child))
+            node.top = heapq.nsmallest(MAX_LIMIT, candidates, key=self.rank)
+        return node.top
+
+    def find(self, token):
+        node = self.root
+        for char in token:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def subtree_ids(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield from node.ids
+            stack.extend(node.children.values())
+
+    def suggest(self, query, limit=10):
+        """(id, title, slug) of the most popular products with a token
+        starting with every word of `query`."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            nodes = [self.find(token) for token in tokens]
+            if None in nodes:
+                return []
+            if len(nodes) == 1:
+                ids = self.top(nodes[0])[:limit]
+            else:
+                # Walk the smallest subtree, check the other words per product
+                ids = heapq.nsmallest(limit, {
+                    id for id in self.subtree_ids(min(nodes, key=lambda node: node.size))
+                    if all(any(word.startswith(token) for word in self.products[id][3]) for token in tokens)
+                }, key=self.rank)
+            return [{'id': id, 'title': self.products[id][1], 'slug': self.products[id][2]} for id in ids]
+
+    def load(self, queryset):
+        return queryset \
+            .annotate(popularity=Coalesce(Sum('orderitems__quantity'), 0)) \
+            .values_list('id', 'title', 'slug', 'popularity')
+
+    def refresh(self):
+        if self.checked_at is not None and monotonic() - self.checked_at < settings.STORE_SUGGEST_INTERVAL:
+            return
+        with self.lock:
+            if self.checked_at is not None and monotonic() - self.checked_at < settings.STORE_SUGGEST_INTERVAL:
+                return
+            state = Product.objects.aggregate(watermark=Max('last_update'), count=Count('id'))
+            if self.built_at is not None \
+                    and monotonic() - self.built_at < settings.STORE_SUGGEST_REBUILD_INTERVAL \
+                    and self.watermark is not None:
+                if state['watermark'] != self.watermark:
+                    for row in self.load(Product.objects.filter(last_update__gte=self.watermark)):
+                        self.add(*row)
+                    self.watermark = state['watermark']
+                if len(self.products) == state['count']:
+                    self.checked_at = monotonic()
+                    return
+            # First use, deleted products or stale popularity
+            self.root, self.products = Node(), {}
+            for row in self.load(Product.objects.all()):
+                self.add(*row)
+            self.watermark = state['watermark']
+            self.built_at = self.checked_at = monotonic()
+
+    def update(self, id, title, slug):
+        # Applied from the Product signals, only once the index is built
+        with self.lock:
+            if self.built_at is not None:
+                self.add(id, title, slug, self.popularity(id))
+
+    def delete(self, id):
+        with self.lock:
+            self.remove(id)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SuggestIndex()
+    return _index
+
+
+def suggest(query, limit=10):
+    index = get_index()
+    index.refresh()
+    return index.suggest(query, limit)
@@ -0,0 +1,46 @@
+from celery import shared_task
+
+from store import bestsellers, cleanup, images, inventory, recommendations
+from store.cache import touch_products
+from store.models import Product, ProductImage
+
+
+@shared_task
+def generate_image_variants(image_id):
+    image = ProductImage.objects.filter(pk=image_id).values('image', 'content_hash', 'product_id').first()
+    if image is None or not image['image']:
+        return
+    # Identical uploads share their derivatives
+    rendered = ProductImage.objects \
+        .filter(content_hash=image['content_hash'], image=image['image']) \
+        .exclude(content_hash='') \
+        .exclude(variants={}) \
+        .values_list('content_hash', 'variants') \
+        .first()
+    digest, variants = rendered or images.render_variants(image['image'])
+    # update() sends no signals, so this does not schedule itself again; an
+    # image replaced meanwhile keeps waiting for its own task
+    if ProductImage.objects \
+            .filter(pk=image_id, image=image['image']) \
+            .update(content_hash=digest, variants=variants):
+        touch_products(Product.objects.filter(pk=image['product_id']))
+
+
+@shared_task
+def release_expired_reservations():
+    return inventory.release_expired()
+
+
+@shared_task
+def update_related_products():
+    return recommendations.update_related_products()
+
+
+@shared_task
+def update_bestsellers():
+    return bestsellers.update_sales()
+
+
+@shared_task
+def collect_garbage():
+    return cleanup.collect_garbage()
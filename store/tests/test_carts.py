@@ -0,0 +1,196 @@
+from decimal import Decimal
+from uuid import uuid4
+
+from store import carts
+from store.models import Cart, CartItem, Product, Promotion
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+@pytest.mark.django_db
+class TestRetrieveCart:
+    def test_values_serialization_is_byte_identical(self, api_client, settings):
+        cart = baker.make(Cart)
+        for price in ['10.50', '3.33']:
+            baker.make(CartItem, cart=cart, quantity=3, product=baker.make(Product, unit_price=price))
+
+        fast = api_client.get(f'/store/carts/{cart.id}/')
+        settings.STORE_VALUES_SERIALIZATION = False
+        slow = api_client.get(f'/store/carts/{cart.id}/')
+
+        assert fast.status_code == status.HTTP_200_OK
+        assert fast.content == slow.content
+
+    def test_empty_cart_total_is_zero(self, api_client):
+        cart = baker.make(Cart)
+
+        response = api_client.get(f'/store/carts/{cart.id}/')
+
+        assert response.data == {'id': str(cart.id), 'items': [], 'total_price': 0}
+
+    def test_unchanged_cart_returns_304_until_items_change(self, api_client):
+        cart = baker.make(Cart)
+        first = api_client.get(f'/store/carts/{cart.id}/')
+
+        unchanged = api_client.get(f'/store/carts/{cart.id}/', HTTP_IF_NONE_MATCH=first['ETag'])
+        baker.make(CartItem, cart=cart, quantity=1, product=baker.make(Product, unit_price=1))
+        changed = api_client.get(f'/store/carts/{cart.id}/', HTTP_IF_NONE_MATCH=first['ETag'])
+
+        assert unchanged.status_code == status.HTTP_304_NOT_MODIFIED
+        assert changed.status_code == status.HTTP_200_OK
+        assert len(changed.data['items']) == 1
+
+    def test_fields_id_skips_items_query(self, api_client, django_assert_num_queries):
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, quantity=1, product=baker.make(Product, unit_price=1))
+
+        with django_assert_num_queries(1):
+            response = api_client.get(f'/store/carts/{cart.id}/', {'fields': 'id'})
+
+        assert response.data == {'id': str(cart.id)}
+
+
+@pytest.mark.django_db
+class TestCartSummary:
+    def test_summary_is_cached_until_items_change(self, api_client, django_assert_num_queries):
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, quantity=3, product=baker.make(Product, unit_price='10.50'))
+        url = f'/store/carts/{cart.id}/summary/'
+
+        first = api_client.get(url)
+        with django_assert_num_queries(0):
+            cached = api_client.get(url)
+        baker.make(CartItem, cart=cart, quantity=1, product=baker.make(Product, unit_price='3.33'))
+        changed = api_client.get(url)
+
+        assert first.data == cached.data == {'items_count': 3, 'total_price': Decimal('31.50')}
+        assert changed.data == {'items_count': 4, 'total_price': Decimal('34.83')}
+
+    def test_price_change_invalidates_carts_holding_the_product(self, api_client):
+        cart, other = baker.make(Cart, _quantity=2)
+        product = baker.make(Product, unit_price='10.00')
+        baker.make(CartItem, cart=cart, quantity=2, product=product)
+        baker.make(CartItem, cart=other, quantity=1, product=product)
+        api_client.get(f'/store/carts/{cart.id}/summary/')
+        api_client.get(f'/store/carts/{other.id}/summary/')
+
+        product.unit_price = Decimal('12.00')
+        product.save()
+        response = api_client.get(f'/store/carts/{cart.id}/summary/')
+
+        assert response.data['total_price'] == Decimal('24.00')
+        assert api_client.get(f'/store/carts/{other.id}/summary/').data['total_price'] == Decimal('12.00')
+        assert api_client.get(f'/store/carts/{cart.id}/').data['items'][0]['total_price'] == Decimal('24.00')
+
+    def test_totals_follow_promotions(self, api_client):
+        cart = baker.make(Cart)
+        product = baker.make(Product, unit_price='10.00')
+        baker.make(CartItem, cart=cart, quantity=2, product=product)
+        api_client.get(f'/store/carts/{cart.id}/summary/')
+
+        promotion = baker.make(Promotion, discount=0.25)
+        product.promotions.add(promotion)
+        summary = api_client.get(f'/store/carts/{cart.id}/summary/')
+        detail = api_client.get(f'/store/carts/{cart.id}/')
+        promotion.active = False
+        promotion.save()
+
+        assert summary.data['total_price'] == Decimal('15.00')
+        assert (detail.data['total_price'], detail.data['items'][0]['total_price']) == (15, 15)
+        assert api_client.get(f'/store/carts/{cart.id}/summary/').data['total_price'] == Decimal('20.00')
+
+    def test_unknown_cart_is_404(self, api_client):
+        assert api_client.get('/store/carts/not-a-uuid/summary/').status_code == status.HTTP_404_NOT_FOUND
+        assert api_client.get('/store/carts/00000000-0000-0000-0000-000000000000/summary/').status_code \
+            == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestCartBatch:
+    def test_operations_apply_in_order(self, api_client):
+        cart = baker.make(Cart)
+        kept, removed, added = baker.make(Product, unit_price=2, inventory=10, _quantity=3)
+        baker.make(CartItem, cart=cart, product=kept, quantity=1)
+        baker.make(CartItem, cart=cart, product=removed, quantity=1)
+
+        response = api_client.post(f'/store/carts/{cart.id}/items/batch/', {'operations': [
+            {'op': 'add', 'product_id': kept.id, 'quantity': 2},
+            {'op': 'remove', 'product_id': removed.id},
+            {'op': 'add', 'product_id': added.id, 'quantity': 1},
+            {'op': 'set', 'product_id': added.id, 'quantity': 4},
+        ]}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [(item['product']['id'], item['quantity']) for item in response.data['items']] \
+            == [(kept.id, 3), (added.id, 4)]
+        assert response.data['total_price'] == 14
+
+    def test_invalid_operations_change_nothing(self, api_client):
+        cart = baker.make(Cart)
+        product = baker.make(Product, unit_price=2, inventory=3)
+        baker.make(CartItem, cart=cart, product=product, quantity=2)
+
+        response = api_client.post(f'/store/carts/{cart.id}/items/batch/', {'operations': [
+            {'op': 'remove', 'product_id': 0},
+            {'op': 'add', 'product_id': product.id, 'quantity': 2},
+        ]}, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.data['operations']) == {0, 1}
+        assert CartItem.objects.get(cart=cart).quantity == 2
+        assert api_client.post(f'/store/carts/{uuid4()}/items/batch/', {'operations': [
+            {'op': 'remove', 'product_id': product.id}]}, format='json').status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestRedisCarts:
+    @pytest.fixture(autouse=True)
+    def redis_backend(self, settings):
+        # In-process Redis, no server needed
+        fakeredis = pytest.importorskip('fakeredis')
+        settings.CACHES = {
+            'default': {
+                'BACKEND': 'django_redis.cache.RedisCache',
+                'LOCATION': 'redis://127.0.0.1:6379/15',
+                'OPTIONS': {'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection}},
+            }
+        }
+        settings.STORE_CART_BACKEND = 'redis'
+        yield
+        carts.get_client().flushdb()
+
+    def test_cart_api_without_database_rows(self, api_client):
+        product = baker.make(Product, unit_price='2.50', inventory=5)
+        cart_id = api_client.post('/store/carts/').data['id']
+        items_url = f'/store/carts/{cart_id}/items/'
+
+        added = api_client.post(items_url, {'product_id': product.id, 'quantity': 2})
+        too_many = api_client.post(items_url, {'product_id': product.id, 'quantity': 4})
+        api_client.patch(f'{items_url}{product.id}/', {'quantity': 3})
+        cart = api_client.get(f'/store/carts/{cart_id}/')
+
+        assert added.status_code == status.HTTP_201_CREATED
+        assert added.data == {'id': product.id, 'product_id': product.id, 'quantity': 2}
+        assert too_many.status_code == status.HTTP_400_BAD_REQUEST
+        assert cart.data['items'][0]['quantity'] == 3
+        assert cart.data['total_price'] == Decimal('7.50')
+        assert api_client.get(f'/store/carts/{cart_id}/summary/').data \
+            == {'items_count': 3, 'total_price': Decimal('7.50')}
+        assert api_client.delete(f'{items_url}{product.id}/').status_code == status.HTTP_204_NO_CONTENT
+        batch = api_client.post(f'{items_url}batch/', {'operations': [
+            {'op': 'set', 'product_id': product.id, 'quantity': 5}]}, format='json')
+        assert batch.data['items'][0]['quantity'] == 5
+        assert not Cart.objects.exists() and not CartItem.objects.exists()
+
+    def test_materialize_moves_cart_to_rows(self, django_capture_on_commit_callbacks):
+        product = baker.make(Product, unit_price=1, inventory=5)
+        cart = carts.RedisCart.create(uuid4())
+        cart.add(product.id, 2)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            assert carts.materialize(cart.id)
+
+        assert list(CartItem.objects.filter(cart_id=cart.id).values_list('product_id', 'quantity')) \
+            == [(product.id, 2)]
+        assert carts.get_redis_cart(cart.id) is None
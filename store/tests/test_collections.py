@@ -1,4 +1,11 @@
-from store.models import Collection, Product
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+from store import inventory
+from store.bestsellers import update_sales
+from store.models import Collection, Order, OrderItem, Product, ProductSales
 from rest_framework import status
 import pytest
 from model_bakery import baker
@@ -55,3 +62,96 @@ class TestRetrieveCollection:
             'title': collection.title,
             'products_count': 0
         }
+
+
+@pytest.mark.django_db
+class TestCollectionProductsCount:
+    def test_follows_product_create_move_and_delete(self, api_client):
+        collection, other = baker.make(Collection, _quantity=2)
+        products = baker.make(Product, collection=collection, unit_price=1, _quantity=3)
+
+        products[0].collection = other
+        products[0].save()
+        products[1].delete()
+
+        collection.refresh_from_db()
+        other.refresh_from_db()
+        assert (collection.products_count, other.products_count) == (1, 1)
+        response = api_client.get(f'/store/collections/{other.id}/')
+        assert response.data['products_count'] == 1
+
+    def test_recount_command_fixes_drift(self):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, unit_price=1, _quantity=2)
+        Collection.objects.update(products_count=7)
+
+        call_command('recount_collections', stdout=StringIO())
+
+        collection.refresh_from_db()
+        assert collection.products_count == 2
+
+
+@pytest.mark.django_db
+class TestCollectionBestsellers:
+    @pytest.fixture(autouse=True)
+    def settled_orders(self, settings):
+        settings.STORE_RANKINGS_DELAY = -60
+
+    def sell(self, product, quantity, days_ago=0, payment_status=Order.PAYMENT_STATUS_COMPLETE):
+        order = baker.make(Order, payment_status=payment_status)
+        placed_at = timezone.now() - timedelta(days=days_ago)
+        completed_at = placed_at if payment_status == Order.PAYMENT_STATUS_COMPLETE else None
+        Order.objects.filter(pk=order.pk).update(placed_at=placed_at, completed_at=completed_at)
+        baker.make(OrderItem, order=order, product=product, quantity=quantity, unit_price=10)
+        return order
+
+    def ids(self, response):
+        return [product['id'] for product in response.data]
+
+    def test_ranks_units_and_recent_sales(self, api_client):
+        collection, other = baker.make(Collection, _quantity=2)
+        classic, new, unpaid = baker.make(Product, collection=collection, unit_price=10, _quantity=3)
+        elsewhere = baker.make(Product, collection=other, unit_price=10)
+        self.sell(classic, 10, days_ago=60)
+        self.sell(new, 3)
+        self.sell(unpaid, 50, payment_status=Order.PAYMENT_STATUS_FAILED)
+        self.sell(elsewhere, 100)
+
+        counted = update_sales()
+        units = api_client.get(f'/store/collections/{collection.id}/bestsellers/')
+        trending = api_client.get(f'/store/collections/{collection.id}/bestsellers/', {'ranking': 'trending'})
+
+        assert counted == 3
+        assert units.status_code == status.HTTP_200_OK
+        assert self.ids(units) == [classic.id, new.id]
+        assert self.ids(trending) == [new.id, classic.id]
+        assert self.ids(api_client.get('/store/products/bestsellers/', {'limit': 1})) == [elsewhere.id]
+
+    def test_adds_new_orders_and_follows_moved_products(self, api_client):
+        collection, other = baker.make(Collection, _quantity=2)
+        first, second = baker.make(Product, collection=collection, unit_price=10, _quantity=2)
+        self.sell(first, 2)
+        update_sales(batch_size=1)
+
+        self.sell(second, 1)
+        self.sell(second, 2)
+        update_sales(batch_size=1)
+        second.collection = other
+        second.save()
+
+        assert ProductSales.objects.get(product=second).units == 3
+        assert self.ids(api_client.get(f'/store/collections/{collection.id}/bestsellers/')) == [first.id]
+        assert self.ids(api_client.get(f'/store/collections/{other.id}/bestsellers/')) == [second.id]
+
+    def test_counts_orders_paid_after_the_last_run(self, api_client):
+        product = baker.make(Product, unit_price=10, inventory=10)
+        order = self.sell(product, 2, payment_status=Order.PAYMENT_STATUS_PENDING)
+        update_sales()
+        cached = api_client.get('/store/products/bestsellers/')
+
+        inventory.commit(order.pk)
+        counted = update_sales()
+
+        assert counted == 1
+        assert self.ids(cached) == []
+        assert self.ids(api_client.get('/store/products/bestsellers/')) == [product.id]
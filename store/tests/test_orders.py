@@ -0,0 +1,143 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+from core.models import User
+from store import cleanup, inventory
+from store.cache import get_cart_version
+from store.models import Cart, CartItem, Order, OrderItem, Product, Promotion
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+GUEST = {
+    'guest_email': 'guest@example.com', 'guest_first_name': 'a', 'guest_last_name': 'b', 'guest_phone': '1',
+    'street': 'Main', 'house_number': 1, 'city': 'Town', 'post_code': '00-001',
+}
+
+
+def make_order(product, quantity, **kwargs):
+    order = baker.make(Order, **kwargs)
+    baker.make(OrderItem, order=order, product=product, quantity=quantity, unit_price=product.unit_price)
+    return order
+
+
+@pytest.mark.django_db
+class TestInventoryReservation:
+    def test_guest_order_reserves_inventory(self, api_client):
+        product = baker.make(Product, inventory=5, unit_price=10)
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, product=product, quantity=3)
+
+        response = api_client.post('/store/guest-order/', {'cart_id': str(cart.id), **GUEST}, format='json')
+
+        product.refresh_from_db()
+        assert response.status_code == status.HTTP_201_CREATED
+        assert product.inventory == 2
+        assert Order.objects.get(pk=response.data['id']).reserved_until > timezone.now()
+
+    def test_order_items_are_charged_promotion_prices(self, api_client):
+        product = baker.make(Product, inventory=5, unit_price='10.00')
+        product.promotions.add(baker.make(Promotion, discount=0.25))
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, product=product, quantity=2)
+
+        response = api_client.post('/store/guest-order/', {'cart_id': str(cart.id), **GUEST}, format='json')
+
+        assert OrderItem.objects.get(order_id=response.data['id']).unit_price == Decimal('7.50')
+
+    def test_order_beyond_inventory_is_rolled_back(self, api_client):
+        available = baker.make(Product, inventory=5, unit_price=10)
+        scarce = baker.make(Product, inventory=1, unit_price=10)
+        cart = baker.make(Cart)
+        baker.make(CartItem, cart=cart, product=available, quantity=2)
+        baker.make(CartItem, cart=cart, product=scarce, quantity=2)
+
+        response = api_client.post('/store/guest-order/', {'cart_id': str(cart.id), **GUEST}, format='json')
+
+        available.refresh_from_db()
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert available.inventory == 5
+        assert not Order.objects.exists()
+
+    def test_expired_reservations_return_to_stock(self):
+        product = baker.make(Product, inventory=5, unit_price=10)
+        expired = make_order(product, 2)
+        active = make_order(product, 1)
+        inventory.reserve(expired)
+        inventory.reserve(active)
+        Order.objects.filter(pk=expired.pk).update(reserved_until=timezone.now() - timedelta(seconds=1))
+
+        assert inventory.release_expired() == 1
+
+        product.refresh_from_db()
+        expired.refresh_from_db()
+        assert product.inventory == 4
+        assert expired.payment_status == Order.PAYMENT_STATUS_FAILED
+        assert expired.reserved_until is None
+
+    def test_commit_keeps_stock_taken_once(self):
+        product = baker.make(Product, inventory=5, unit_price=10)
+        order = make_order(product, 2)
+        inventory.reserve(order)
+
+        inventory.commit(order.pk)
+        inventory.commit(order.pk)
+        released = inventory.release(order.pk)
+
+        product.refresh_from_db()
+        order.refresh_from_db()
+        assert not released
+        assert product.inventory == 3
+        assert order.payment_status == Order.PAYMENT_STATUS_COMPLETE
+
+    def test_commit_after_expiry_takes_stock_again(self):
+        product = baker.make(Product, inventory=5, unit_price=10)
+        order = make_order(product, 2)
+        inventory.reserve(order)
+        inventory.release(order.pk, status=Order.PAYMENT_STATUS_PENDING)
+
+        inventory.commit(order.pk)
+
+        product.refresh_from_db()
+        assert product.inventory == 3
+
+
+@pytest.mark.django_db
+class TestGarbageCollection:
+    def test_deletes_unused_anonymous_carts_in_chunks(self):
+        old = timezone.now() - timedelta(days=31)
+        product = baker.make(Product, unit_price=1)
+        abandoned = baker.make(Cart, _quantity=3)
+        baker.make(CartItem, cart=abandoned[0], product=product)
+        Cart.objects.filter(pk__in=[cart.pk for cart in abandoned]).update(created_at=old, updated_at=old)
+        recent = baker.make(Cart)
+        # New users get a customer and a cart
+        owned = Cart.objects.get(customer__user=baker.make(User))
+        Cart.objects.filter(pk=owned.pk).update(created_at=old, updated_at=old)
+        # Created long ago, but its items changed since
+        active = baker.make(Cart)
+        Cart.objects.filter(pk=active.pk).update(created_at=old, updated_at=old)
+        baker.make(CartItem, cart=active, product=product)
+        version = get_cart_version(abandoned[0].pk)
+
+        assert cleanup.delete_abandoned_carts(chunk_size=2) == 3
+        assert set(Cart.objects.values_list('id', flat=True)) == {recent.id, owned.id, active.id}
+        assert list(CartItem.objects.values_list('cart_id', flat=True)) == [active.id]
+        assert get_cart_version(abandoned[0].pk) != version
+
+    def test_fails_stale_pending_orders_without_holds(self):
+        product = baker.make(Product, unit_price=1, inventory=10)
+        stale, held, paid = [make_order(product, 1, payment_status=status)
+                             for status in [Order.PAYMENT_STATUS_PENDING, Order.PAYMENT_STATUS_PENDING,
+                                            Order.PAYMENT_STATUS_COMPLETE]]
+        fresh = make_order(product, 1)
+        Order.objects.filter(pk__in=[stale.pk, held.pk, paid.pk]).update(placed_at=timezone.now() - timedelta(days=2))
+        Order.objects.filter(pk=held.pk).update(reserved_until=timezone.now())
+
+        assert cleanup.expire_stale_orders(chunk_size=1) == 1
+        assert dict(Order.objects.values_list('id', 'payment_status')) == {
+            stale.id: Order.PAYMENT_STATUS_FAILED, held.id: Order.PAYMENT_STATUS_PENDING,
+            paid.id: Order.PAYMENT_STATUS_COMPLETE, fresh.id: Order.PAYMENT_STATUS_PENDING,
+        }
@@ -0,0 +1,805 @@
+import csv
+import json
+from datetime import date
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.utils import timezone
+from PIL import Image
+
+from store import inventory, search
+from store.cache import get_cache_stats
+from store.models import Collection, Order, OrderItem, Product, ProductImage, ProductSales, Promotion, RelatedProduct, \
+    Review
+from tags.models import Tag, TaggedItem
+from rest_framework import status
+import pytest
+from model_bakery import baker
+
+
+@pytest.mark.django_db
+class TestProductResponseCache:
+    def test_repeated_list_is_served_from_cache(self, api_client):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, unit_price=10)
+
+        first = api_client.get('/store/products/', {'collection_id': collection.id})
+        second = api_client.get('/store/products/', {'collection_id': collection.id})
+
+        assert first.status_code == status.HTTP_200_OK
+        assert second.data == first.data
+        assert get_cache_stats()['hits'] == 1
+        assert get_cache_stats()['misses'] == 1
+
+    def test_product_change_invalidates_collection_list(self, api_client):
+        collection = baker.make(Collection)
+        product = baker.make(Product, collection=collection, unit_price=10)
+        api_client.get('/store/products/', {'collection_id': collection.id})
+
+        product.title = 'changed'
+        product.save()
+        response = api_client.get('/store/products/', {'collection_id': collection.id})
+
+        assert response.data['results'][0]['title'] == 'changed'
+
+    def test_other_collection_list_stays_cached(self, api_client):
+        collection, other = baker.make(Collection, _quantity=2)
+        baker.make(Product, collection=other, unit_price=10)
+        api_client.get('/store/products/', {'collection_id': other.id})
+
+        baker.make(Product, collection=collection, unit_price=10)
+        api_client.get('/store/products/', {'collection_id': other.id})
+
+        assert get_cache_stats()['hits'] == 1
+
+    def test_detail_is_invalidated_by_image_delete(self, api_client):
+        product = baker.make(Product, unit_price=10)
+        image = baker.make('store.ProductImage', product=product, image='a.jpg')
+        api_client.get(f'/store/products/{product.id}/')
+
+        image.delete()
+        response = api_client.get(f'/store/products/{product.id}/')
+
+        assert response.data['images'] == []
+
+
+@pytest.mark.django_db
+class TestProductCursorPagination:
+    def test_cursor_pages_cover_every_product_once(self, api_client):
+        collection = baker.make(Collection)
+        products = baker.make(Product, collection=collection, unit_price=5, _quantity=25)
+
+        ids = []
+        response = api_client.get('/store/products/', {'ordering': 'unit_price', 'pagination': 'cursor'})
+        while True:
+            assert 'count' not in response.data
+            ids += [product['id'] for product in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = api_client.get(response.data['next'])
+
+        assert ids == sorted(product.id for product in products)
+
+    def test_previous_link_returns_previous_page(self, api_client):
+        baker.make(Product, unit_price=5, _quantity=15)
+        first = api_client.get('/store/products/', {'ordering': '-last_update', 'pagination': 'cursor'})
+        second = api_client.get(first.data['next'])
+
+        response = api_client.get(second.data['previous'])
+
+        assert response.data['results'] == first.data['results']
+        assert response.data['previous'] is None
+
+    def test_invalid_cursor_returns_404(self, api_client):
+        response = api_client.get('/store/products/', {'cursor': 'invalid'})
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestProductSearch:
+    def test_search_matches_word_prefixes_in_title_and_description(self, api_client):
+        coffee = baker.make(Product, title='Arabica Coffee', unit_price=5)
+        beans = baker.make(Product, title='Beans', description='Roasted coffee beans', unit_price=5)
+        baker.make(Product, title='Tea', description='Green tea', unit_price=5)
+
+        response = api_client.get('/store/products/', {'search': 'coff'})
+
+        assert [product['id'] for product in response.data['results']] == [coffee.id, beans.id]
+
+    def test_search_ignores_query_syntax(self, api_client):
+        baker.make(Product, title='Coffee mug', unit_price=5)
+
+        response = api_client.get('/store/products/', {'search': '"mug* OR'})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 0
+
+    def test_updated_and_deleted_products_are_reindexed(self, api_client):
+        product = baker.make(Product, title='Coffee', unit_price=5)
+        product.title = 'Tea'
+        product.save()
+
+        assert api_client.get('/store/products/', {'search': 'coffee'}).data['count'] == 0
+        assert api_client.get('/store/products/', {'search': 'tea'}).data['count'] == 1
+
+        product.delete()
+
+        assert api_client.get('/store/products/', {'search': 'tea'}).data['count'] == 0
+
+    def test_search_cursor_pages_cover_every_match_once(self, api_client):
+        titles = baker.make(Product, title='Coffee', unit_price=5, _quantity=12)
+        descriptions = baker.make(Product, title='Beans', description='Coffee beans', unit_price=5, _quantity=12)
+
+        ids = []
+        response = api_client.get('/store/products/', {'search': 'coffee', 'pagination': 'cursor'})
+        for _ in range(5):
+            ids += [product['id'] for product in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = api_client.get(response.data['next'])
+
+        assert sorted(ids) == sorted(product.id for product in titles + descriptions)
+
+    def test_rebuild_reindexes_in_place_and_drops_orphans(self, api_client):
+        product = baker.make(Product, title='Coffee', unit_price=5)
+        Product.objects.filter(pk=product.pk).update(title='Tea')
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {search.FTS_TABLE} (rowid, title, description) VALUES (%s, 'Tea', '')",
+                           [product.pk + 1000])
+
+        call_command('rebuild_search_index', batch_size=1, stdout=StringIO())
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {search.FTS_TABLE}')
+            assert cursor.fetchall() == [(product.pk,)]
+        assert api_client.get('/store/products/', {'search': 'coffee'}).data['count'] == 0
+        assert api_client.get('/store/products/', {'search': 'tea'}).data['count'] == 1
+
+
+@pytest.mark.django_db
+class TestProductCatalogSnapshot:
+    @pytest.fixture(autouse=True)
+    def enable_snapshot(self, settings, monkeypatch):
+        pytest.importorskip('numpy')
+        from store import snapshot
+        settings.STORE_CATALOG_SNAPSHOT = True
+        settings.STORE_CATALOG_SNAPSHOT_INTERVAL = 0
+        settings.STORE_CATALOG_CACHE_TIMEOUT = 0
+        monkeypatch.setattr(snapshot, '_snapshot', None)
+
+    def list_both_ways(self, api_client, settings, params):
+        from_snapshot = api_client.get('/store/products/', params)
+        settings.STORE_CATALOG_SNAPSHOT = False
+        from_database = api_client.get('/store/products/', params)
+        settings.STORE_CATALOG_SNAPSHOT = True
+        return from_snapshot, from_database
+
+    @pytest.mark.parametrize('params', [
+        {},
+        {'ordering': '-unit_price'},
+        {'ordering': 'last_update', 'page': 2},
+        {'unit_price__gt': '20', 'unit_price__lt': '70.5'},
+    ])
+    def test_matches_database_listing(self, api_client, settings, params):
+        collection = baker.make(Collection)
+        for price in range(10, 100, 4):
+            baker.make(Product, title=f'Product {price % 7}', unit_price=price, collection=collection)
+
+        from_snapshot, from_database = self.list_both_ways(api_client, settings, params)
+
+        assert from_snapshot.status_code == status.HTTP_200_OK
+        assert from_snapshot.data == from_database.data
+
+    def test_picks_up_changed_and_deleted_products(self, api_client, settings):
+        collection, other = baker.make(Collection, _quantity=2)
+        first, second = baker.make(Product, unit_price=10, collection=collection, _quantity=2)
+        api_client.get('/store/products/', {'collection_id': collection.id})
+
+        first.collection = other
+        first.save()
+        second.delete()
+        response = api_client.get('/store/products/', {'collection_id': other.id})
+
+        assert [product['id'] for product in response.data['results']] == [first.id]
+
+
+@pytest.mark.django_db
+class TestValuesSerialization:
+    def get_both_ways(self, api_client, settings, url, params=None):
+        fast = api_client.get(url, params)
+        settings.STORE_VALUES_SERIALIZATION = False
+        slow = api_client.get(url, params)
+        settings.STORE_VALUES_SERIALIZATION = True
+        return fast, slow
+
+    @pytest.fixture(autouse=True)
+    def disable_response_cache(self, settings):
+        settings.STORE_CATALOG_CACHE_TIMEOUT = 0
+
+    def test_product_list_is_byte_identical(self, api_client, settings):
+        collection = baker.make(Collection)
+        product = baker.make(Product, collection=collection, unit_price='12.34')
+        baker.make(Product, collection=collection, unit_price='7.00')
+        baker.make('store.ProductImage', product=product, image='store/images/a b.jpg', _quantity=2)
+
+        fast, slow = self.get_both_ways(api_client, settings, '/store/products/')
+
+        assert fast.status_code == status.HTTP_200_OK
+        assert fast.content == slow.content
+
+    def test_product_detail_is_byte_identical(self, api_client, settings):
+        product = baker.make(Product, unit_price='99.99')
+
+        fast, slow = self.get_both_ways(api_client, settings, f'/store/products/{product.id}/')
+
+        assert fast.content == slow.content
+
+    def test_collection_list_is_byte_identical(self, api_client, settings):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, unit_price=5, _quantity=3)
+
+        fast, slow = self.get_both_ways(api_client, settings, '/store/collections/')
+
+        assert fast.content == slow.content
+
+
+@pytest.mark.django_db
+class TestProductPromotionPricing:
+    @pytest.fixture
+    def discounted_product(self):
+        product = baker.make(Product, unit_price='50.00')
+        product.promotions.add(
+            baker.make(Promotion, discount=0.2),
+            baker.make(Promotion, discount=0.1),
+            baker.make(Promotion, discount=0.5, active=False))
+        return product
+
+    def test_best_active_promotion_sets_prices(self, api_client, discounted_product):
+        response = api_client.get(f'/store/products/{discounted_product.id}/')
+
+        assert response.data['unit_price'] == Decimal('50.00')
+        assert response.data['effective_price'] == Decimal('40.00')
+        assert response.data['price_with_tax'] == Decimal('44.00')
+
+    def test_price_filter_uses_effective_price(self, api_client, discounted_product):
+        baker.make(Product, unit_price='45.00')
+
+        response = api_client.get('/store/products/', {'unit_price__lt': '42'})
+
+        assert [product['id'] for product in response.data['results']] == [discounted_product.id]
+
+    def test_list_prices_take_one_query(self, api_client, discounted_product, django_assert_num_queries):
+        baker.make(Product, unit_price='45.00', _quantity=5)
+
+        # count, page, images and tags
+        with django_assert_num_queries(4):
+            api_client.get('/store/products/', {'ordering': 'effective_price'})
+
+    def test_deactivating_promotion_invalidates_cached_price(self, api_client, discounted_product):
+        api_client.get(f'/store/products/{discounted_product.id}/')
+
+        promotion = Promotion.objects.get(discount=0.2)
+        promotion.active = False
+        promotion.save()
+        response = api_client.get(f'/store/products/{discounted_product.id}/')
+
+        assert response.data['effective_price'] == Decimal('45.00')
+
+    @pytest.mark.parametrize('discount', [-0.1, 1.5])
+    def test_discount_out_of_range_is_rejected(self, discount):
+        with pytest.raises(ValidationError):
+            Promotion(description='Sale', discount=discount).full_clean()
+        with pytest.raises(IntegrityError):
+            Promotion.objects.create(description='Sale', discount=discount)
+
+
+@pytest.mark.django_db
+class TestProductConditionalGet:
+    def test_unchanged_detail_returns_304(self, api_client):
+        product = baker.make(Product, unit_price=10)
+        first = api_client.get(f'/store/products/{product.id}/')
+
+        second = api_client.get(f'/store/products/{product.id}/', HTTP_IF_NONE_MATCH=first['ETag'])
+        since = api_client.get(f'/store/products/{product.id}/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+
+        assert second.status_code == status.HTTP_304_NOT_MODIFIED
+        assert second['ETag'] == first['ETag']
+        assert since.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_changed_product_returns_200(self, api_client):
+        product = baker.make(Product, unit_price=10)
+        first = api_client.get(f'/store/products/{product.id}/')
+
+        product.title = 'changed'
+        product.save()
+        second = api_client.get(f'/store/products/{product.id}/', HTTP_IF_NONE_MATCH=first['ETag'])
+
+        assert second.status_code == status.HTTP_200_OK
+        assert second.data['title'] == 'changed'
+
+    def test_list_etag_depends_on_query_params(self, api_client):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, unit_price=10)
+        first = api_client.get('/store/products/')
+
+        same = api_client.get('/store/products/', HTTP_IF_NONE_MATCH=first['ETag'])
+        filtered = api_client.get('/store/products/', {'collection_id': collection.id},
+                                  HTTP_IF_NONE_MATCH=first['ETag'])
+
+        assert same.status_code == status.HTTP_304_NOT_MODIFIED
+        assert filtered.status_code == status.HTTP_200_OK
+
+    def test_new_review_changes_review_list_etag(self, api_client):
+        product = baker.make(Product, unit_price=10)
+        url = f'/store/products/{product.id}/reviews/'
+        first = api_client.get(url)
+
+        unchanged = api_client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        baker.make('store.Review', product=product)
+        changed = api_client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        assert unchanged.status_code == status.HTTP_304_NOT_MODIFIED
+        assert changed.status_code == status.HTTP_200_OK
+        assert len(changed.data['results']) == 1
+
+
+@pytest.mark.django_db
+class TestProductSparseFieldsets:
+    @pytest.fixture(autouse=True)
+    def products(self):
+        product = baker.make(Product, unit_price='12.34')
+        baker.make('store.ProductImage', product=product, image='a.jpg')
+        baker.make(Product, unit_price='5.00', _quantity=2)
+
+    @pytest.mark.parametrize('values', [True, False])
+    def test_fields_limits_output(self, api_client, settings, values):
+        settings.STORE_VALUES_SERIALIZATION = values
+
+        response = api_client.get('/store/products/', {'fields': 'title,id,unit_price'})
+
+        assert [list(product) for product in response.data['results']] == [['id', 'title', 'unit_price']] * 3
+
+    @pytest.mark.parametrize('values', [True, False])
+    def test_omit_images_skips_their_query(self, api_client, settings, values, django_assert_num_queries):
+        settings.STORE_VALUES_SERIALIZATION = values
+
+        # count and page
+        with django_assert_num_queries(2):
+            response = api_client.get('/store/products/', {'omit': 'images,collection,tags'})
+
+        assert 'images' not in response.data['results'][0]
+        assert 'price_with_tax' in response.data['results'][0]
+
+    def test_sparse_cursor_pages_cover_every_product(self, api_client, settings, django_assert_num_queries):
+        settings.STORE_VALUES_SERIALIZATION = False
+        baker.make(Product, unit_price='7.00', _quantity=10)
+
+        first = api_client.get('/store/products/', {'fields': 'id', 'ordering': 'unit_price', 'pagination': 'cursor'})
+        # No extra query for the deferred keyset column
+        with django_assert_num_queries(1):
+            second = api_client.get(first.data['next'])
+
+        ids = [product['id'] for product in first.data['results'] + second.data['results']]
+        assert sorted(ids) == sorted(Product.objects.values_list('id', flat=True))
+        assert list(second.data['results'][0]) == ['id']
+
+    @pytest.mark.parametrize('values', [True, False])
+    def test_unknown_fields_return_400(self, api_client, settings, values):
+        settings.STORE_VALUES_SERIALIZATION = values
+
+        response = api_client.get('/store/products/', {'fields': 'id,prize,colour', 'omit': 'title'})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data == {'fields': 'Unknown fields: colour, prize.'}
+        assert api_client.get('/store/products/', {'omit': 'imgs'}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestProductImport:
+    def post_feed(self, api_client, name, content):
+        return api_client.post('/store/products/import/',
+                               {'file': SimpleUploadedFile(name, content.encode())}, format='multipart')
+
+    def test_csv_feed_upserts_by_slug(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        collection = baker.make(Collection, title='Toys')
+        existing = baker.make(Product, slug='ball', title='Old ball', unit_price=5, collection=collection)
+
+        response = self.post_feed(api_client, 'feed.csv', (
+            'slug,title,description,unit_price,inventory,collection\n'
+            'ball,Red ball,,7.50,3,Toys\n'
+            'kite,Kite,Flies,20,1,Outdoor\n'
+            'broken,,,1,1,Toys\n'))
+
+        existing.refresh_from_db()
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['imported'] == 2
+        assert response.data['errors'] == ['line 4: slug, title and collection are required']
+        assert (existing.title, existing.unit_price, existing.inventory) == ('Red ball', Decimal('7.50'), 3)
+        assert Product.objects.get(slug='kite').collection.title == 'Outdoor'
+        assert dict(Collection.objects.values_list('title', 'products_count')) == {'Toys': 1, 'Outdoor': 1}
+
+    def test_jsonl_feed_is_searchable_and_listed(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        api_client.get('/store/products/')
+
+        self.post_feed(api_client, 'feed.jsonl',
+                       '{"slug": "kite", "title": "Kite", "unit_price": "20", "inventory": 1, "collection": "Toys"}\n')
+
+        assert api_client.get('/store/products/').data['count'] == 1
+        assert api_client.get('/store/products/', {'search': 'kit'}).data['count'] == 1
+
+    def test_moves_sales_and_rejects_long_slugs(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        toys, outdoor = baker.make(Collection, title='Toys'), baker.make(Collection, title='Outdoor')
+        kite = baker.make(Product, slug='kite', unit_price=5, collection=toys)
+        baker.make(ProductSales, product=kite, collection=toys, units=3)
+
+        response = self.post_feed(api_client, 'feed.csv', (
+            'slug,title,description,unit_price,inventory,collection\n'
+            'kite,Kite,,20,1,Outdoor\n'
+            f'{"k" * 51},Kite,,20,1,Outdoor\n'))
+
+        assert response.data['errors'] == ['line 3: slug longer than 50 characters']
+        assert ProductSales.objects.get(product=kite).collection_id == outdoor.id
+        assert Product.objects.count() == 1
+
+    def test_requires_admin(self, api_client, authenticate):
+        authenticate()
+
+        response = self.post_feed(api_client, 'feed.csv', 'slug\n')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class TestProductExport:
+    def test_ndjson_streams_every_product(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        collection = baker.make(Collection, title='Toys')
+        products = baker.make(Product, collection=collection, unit_price='2.50', _quantity=3)
+
+        response = api_client.get('/store/products/export/')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        assert response['Content-Type'] == 'application/x-ndjson'
+        assert [line['id'] for line in lines] == [product.id for product in products]
+        assert lines[0]['collection'] == 'Toys'
+        assert lines[0]['unit_price'] == '2.50'
+
+    def test_csv_has_header(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        product = baker.make(Product, unit_price=1)
+
+        response = api_client.get('/store/products/export/', {'format': 'csv'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+        assert rows[0][:3] == ['id', 'slug', 'title']
+        assert rows[1][:3] == [str(product.id), product.slug, product.title]
+
+    def test_requires_admin(self, api_client, authenticate):
+        authenticate()
+
+        response = api_client.get('/store/products/export/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class TestProductFacets:
+    @pytest.fixture(autouse=True)
+    def products(self):
+        toys, books = baker.make(Collection, title='Toys'), baker.make(Collection, title='Books')
+        baker.make(Product, collection=toys, title='Red ball', unit_price='5.00', inventory=0)
+        baker.make(Product, collection=toys, title='Blue ball', unit_price='30.00', inventory=2)
+        baker.make(Product, collection=books, title='Ball games', unit_price='12.00', inventory=1)
+        return toys, books
+
+    def test_counts_come_from_one_query(self, api_client, products, django_assert_num_queries):
+        toys, books = products
+
+        with django_assert_num_queries(1):
+            response = api_client.get('/store/products/facets/', {'price_buckets': '10,20'})
+
+        assert response.data['count'] == 3
+        assert response.data['collections'] == [
+            {'id': toys.id, 'title': 'Toys', 'count': 2},
+            {'id': books.id, 'title': 'Books', 'count': 1},
+        ]
+        assert [bucket['count'] for bucket in response.data['price']] == [1, 1, 1]
+        assert response.data['in_stock'] == 2
+
+    def test_applies_filters_and_search(self, api_client):
+        response = api_client.get('/store/products/facets/', {'search': 'red', 'unit_price__lt': 20})
+
+        assert response.data['count'] == 1
+        assert response.data['collections'][0]['title'] == 'Toys'
+
+    def test_is_cached_until_the_catalog_changes(self, api_client, products):
+        api_client.get('/store/products/facets/')
+        cached = api_client.get('/store/products/facets/')
+        baker.make(Product, collection=products[0], unit_price='1.00')
+        changed = api_client.get('/store/products/facets/')
+
+        assert get_cache_stats()['hits'] == 1
+        assert (cached.data['count'], changed.data['count']) == (3, 4)
+
+    @pytest.mark.parametrize('edges', ['ten', '10,NaN', 'Infinity', '-inf,10', 'sNaN'])
+    def test_invalid_buckets_return_400(self, api_client, edges):
+        response = api_client.get('/store/products/facets/', {'price_buckets': edges})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestProductImageVariants:
+    @pytest.fixture(autouse=True)
+    def media(self, settings, tmp_path):
+        settings.MEDIA_ROOT = tmp_path
+        settings.STORE_IMAGE_VARIANTS_ASYNC = False
+        settings.STORE_CATALOG_CACHE_TIMEOUT = 0
+
+    def make_image(self, product, color='red'):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), color).save(buffer, 'PNG')
+        return ProductImage.objects.create(
+            product=product, image=SimpleUploadedFile('photo.png', buffer.getvalue()))
+
+    def test_saving_renders_fixed_size_derivatives(self, settings):
+        image = self.make_image(baker.make(Product, unit_price=1))
+
+        image.refresh_from_db()
+        assert set(image.variants) == {'thumb', 'card', 'detail'}
+        assert all(set(paths) == {'webp', 'jpeg'} for paths in image.variants.values())
+        assert image.content_hash in image.variants['thumb']['webp']
+        assert Image.open(settings.MEDIA_ROOT / image.variants['thumb']['jpeg']).size == (150, 150)
+        assert Image.open(settings.MEDIA_ROOT / image.variants['card']['webp']).size == (400, 300)
+
+    def test_identical_uploads_share_files(self, api_client, settings, django_capture_on_commit_callbacks):
+        product = baker.make(Product, unit_price=1)
+        buffer = BytesIO()
+        Image.new('RGB', (80, 60), 'blue').save(buffer, 'PNG')
+        url = f'/store/products/{product.id}/images/'
+
+        first, second = [
+            api_client.post(url, {'image': SimpleUploadedFile(f'{name}.png', buffer.getvalue())},
+                            format='multipart').data
+            for name in ('front', 'copy')]
+        images = ProductImage.objects.order_by('id')
+        path = settings.MEDIA_ROOT / images[0].image.name
+
+        assert first['image'] == second['image']
+        assert images[0].variants == images[1].variants
+        assert len(list((settings.MEDIA_ROOT / 'store/images').glob('*/*.png'))) == 1
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.delete(f"{url}{first['id']}/")
+        assert path.exists()
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.delete(f"{url}{second['id']}/")
+        assert not path.exists()
+        assert not list((settings.MEDIA_ROOT / 'store/images/variants').glob('*/*'))
+
+    def test_product_lists_variant_urls(self, api_client, settings):
+        product = baker.make(Product, unit_price=1)
+        image = self.make_image(product)
+        image.refresh_from_db()
+
+        fast = api_client.get('/store/products/')
+        settings.STORE_VALUES_SERIALIZATION = False
+        slow = api_client.get('/store/products/')
+
+        variants = fast.data['results'][0]['images'][0]['variants']
+        assert variants['card']['webp'] == f"http://testserver/media/{image.variants['card']['webp']}"
+        assert fast.content == slow.content
+
+
+@pytest.mark.django_db
+class TestProductSuggest:
+    @pytest.fixture(autouse=True)
+    def fresh_index(self, settings, monkeypatch):
+        from store import suggest
+        settings.STORE_SUGGEST_INTERVAL = 0
+        monkeypatch.setattr(suggest, '_index', None)
+
+    def test_ranks_prefix_matches_by_units_ordered(self, api_client):
+        shirt, shoes, scarf = [baker.make(Product, title=title, unit_price=10)
+                               for title in ['Red Shirt', 'Running Shoes', 'Wool Scarf']]
+        baker.make(OrderItem, product=shoes, quantity=5, unit_price=10)
+        baker.make(OrderItem, product=shirt, quantity=1, unit_price=10)
+
+        response = api_client.get('/store/products/suggest/', {'q': 'Sh'})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [
+            {'id': shoes.id, 'title': 'Running Shoes', 'slug': shoes.slug},
+            {'id': shirt.id, 'title': 'Red Shirt', 'slug': shirt.slug},
+        ]
+
+    def test_every_word_must_match_ignoring_diacritics(self, api_client):
+        baker.make(Product, title='Żółta koszula', unit_price=10)
+        wanted = baker.make(Product, title='Zielona koszula', unit_price=10)
+
+        response = api_client.get('/store/products/suggest/', {'q': 'kosz ziel'})
+
+        assert [product['id'] for product in response.data] == [wanted.id]
+        assert len(api_client.get('/store/products/suggest/', {'q': 'zolt'}).data) == 1
+
+    def test_picks_up_changed_and_deleted_products(self, api_client):
+        first, second = baker.make(Product, title='Lamp', unit_price=10, _quantity=2)
+        api_client.get('/store/products/suggest/', {'q': 'lamp'})
+
+        first.title = 'Desk lamp'
+        first.save()
+        second.delete()
+        response = api_client.get('/store/products/suggest/', {'q': 'desk la'})
+
+        assert [product['id'] for product in response.data] == [first.id]
+        assert api_client.get('/store/products/suggest/', {'q': 'lamp', 'limit': 50}).status_code \
+            == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestRelatedProducts:
+    @pytest.fixture(autouse=True)
+    def settled_orders(self, settings):
+        pytest.importorskip('numpy')
+        settings.STORE_RANKINGS_DELAY = -60
+
+    def order(self, *products, payment_status=Order.PAYMENT_STATUS_COMPLETE):
+        completed_at = timezone.now() if payment_status == Order.PAYMENT_STATUS_COMPLETE else None
+        order = baker.make(Order, payment_status=payment_status, completed_at=completed_at)
+        for product in products:
+            baker.make(OrderItem, order=order, product=product, quantity=1, unit_price=10)
+        return order
+
+    def test_ranks_products_by_orders_in_common(self, api_client):
+        from store.recommendations import update_related_products
+        tent, bag, mat, stove = baker.make(Product, unit_price=10, _quantity=4)
+        self.order(tent, bag, mat)
+        self.order(tent, mat)
+        self.order(tent, mat, mat)
+        self.order(tent, stove, payment_status=Order.PAYMENT_STATUS_FAILED)
+
+        counted = update_related_products()
+        response = api_client.get(f'/store/products/{tent.id}/related/')
+
+        assert counted == 3
+        assert response.status_code == status.HTTP_200_OK
+        assert [product['id'] for product in response.data] == [mat.id, bag.id]
+        assert RelatedProduct.objects.get(product=mat, related=tent).orders == 3
+
+    def test_counts_only_new_orders(self, api_client):
+        from store.recommendations import update_related_products
+        tent, bag, mat = baker.make(Product, unit_price=10, _quantity=3)
+        self.order(tent, bag)
+        update_related_products(batch_size=1)
+        first = api_client.get(f'/store/products/{tent.id}/related/')
+
+        self.order(tent, mat)
+        self.order(tent, mat)
+        counted = update_related_products(batch_size=1, flush_pairs=1, keep=2)
+        second = api_client.get(f'/store/products/{tent.id}/related/')
+
+        assert [product['id'] for product in first.data] == [bag.id]
+        assert counted == 2
+        assert [product['id'] for product in second.data] == [mat.id, bag.id]
+        assert api_client.get('/store/products/0/related/').status_code == status.HTTP_404_NOT_FOUND
+
+    def test_counts_orders_paid_after_the_last_run(self, api_client):
+        from store.recommendations import update_related_products
+        tent, bag = baker.make(Product, unit_price=10, inventory=10, _quantity=2)
+        order = self.order(tent, bag, payment_status=Order.PAYMENT_STATUS_PENDING)
+        update_related_products()
+        cached = api_client.get(f'/store/products/{tent.id}/related/')
+
+        inventory.commit(order.pk)
+        counted = update_related_products()
+
+        assert counted == 1
+        assert cached.data == []
+        assert [product['id'] for product in api_client.get(f'/store/products/{tent.id}/related/').data] \
+            == [bag.id]
+
+    def test_overlapping_runs_count_orders_once(self, monkeypatch):
+        from store import recommendations
+        tent, bag, mat = baker.make(Product, unit_price=10, _quantity=3)
+        self.order(tent, bag)
+        self.order(tent, mat)
+        order_pairs = recommendations.order_pairs
+        overlapping = []
+
+        def order_pairs_racing(*args):
+            # Another run counts everything while this one is mid-batch
+            if not overlapping:
+                monkeypatch.setattr(recommendations, 'order_pairs', order_pairs)
+                overlapping.append(recommendations.update_related_products())
+            return order_pairs(*args)
+
+        monkeypatch.setattr(recommendations, 'order_pairs', order_pairs_racing)
+        counted = recommendations.update_related_products(batch_size=1)
+
+        assert (overlapping, counted) == ([2], 0)
+        assert sorted(RelatedProduct.objects.values_list('orders', flat=True)) == [1, 1, 1, 1]
+
+
+@pytest.mark.django_db
+class TestProductReviews:
+    def test_feed_pages_newest_first(self, api_client):
+        product = baker.make(Product, unit_price=10)
+        reviews = baker.make(Review, product=product, _quantity=12)
+        Review.objects.filter(pk=reviews[0].pk).update(date=date(2020, 1, 1))
+        url = f'/store/products/{product.id}/reviews/'
+
+        first = api_client.get(url)
+        second = api_client.get(first.data['next'])
+
+        ids = [review['id'] for review in first.data['results'] + second.data['results']]
+        assert ids == [review.id for review in reversed(reviews[1:])] + [reviews[0].id]
+        assert second.data['next'] is None
+
+    def test_count_and_latest_date_follow_reviews(self, api_client):
+        product = baker.make(Product, unit_price=10)
+        old, new = baker.make(Review, product=product, _quantity=2)
+        Review.objects.filter(pk=old.pk).update(date=date(2020, 1, 1))
+        listed = api_client.get('/store/products/', {'fields': 'id,reviews_count,last_review_at'})
+
+        new.delete()
+        detail = api_client.get(f'/store/products/{product.id}/')
+
+        assert listed.data['results'] == [{'id': product.id, 'reviews_count': 2, 'last_review_at': str(new.date)}]
+        assert (detail.data['reviews_count'], detail.data['last_review_at']) == (1, '2020-01-01')
+
+
+@pytest.mark.django_db
+class TestProductTags:
+    @pytest.fixture
+    def tagged(self):
+        summer, sale = baker.make(Tag, label='summer'), baker.make(Tag, label='sale')
+        products = baker.make(Product, unit_price=10, _quantity=3)
+        for product, tags in zip(products, [[summer, sale], [summer], []]):
+            for tag in tags:
+                TaggedItem.objects.create(tag=tag, content_object=product)
+        return products
+
+    @pytest.mark.parametrize('values', [True, False])
+    def test_list_loads_page_tags_in_one_query(self, api_client, settings, tagged, values,
+                                               django_assert_num_queries):
+        settings.STORE_VALUES_SERIALIZATION = values
+
+        # count, page and tags
+        with django_assert_num_queries(3):
+            response = api_client.get('/store/products/', {'fields': 'id,tags'})
+
+        tags = {product['id']: product['tags'] for product in response.data['results']}
+        assert [tags[product.id] for product in tagged] == [['sale', 'summer'], ['summer'], []]
+
+    def test_filter_by_tag(self, api_client, tagged):
+        response = api_client.get('/store/products/', {'tag': 'summer'})
+
+        assert sorted(product['id'] for product in response.data['results']) == [tagged[0].id, tagged[1].id]
+
+    def test_tagging_invalidates_cached_product(self, api_client, tagged):
+        api_client.get(f'/store/products/{tagged[2].id}/')
+
+        TaggedItem.objects.create(tag=Tag.objects.get(label='sale'), content_object=tagged[2])
+        response = api_client.get(f'/store/products/{tagged[2].id}/')
+
+        assert response.data['tags'] == ['sale']
+
+    def test_renaming_and_deleting_tags_invalidates_cached_products(self, api_client, tagged):
+        api_client.get(f'/store/products/{tagged[1].id}/')
+        summer = Tag.objects.get(label='summer')
+
+        summer.label = 'winter'
+        summer.save()
+        renamed = api_client.get(f'/store/products/{tagged[1].id}/')
+        summer.delete()
+        deleted = api_client.get(f'/store/products/{tagged[1].id}/')
+
+        assert renamed.data['tags'] == ['winter']
+        assert deleted.data['tags'] == []
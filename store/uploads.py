@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+from django.apps import apps
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import models, transaction
+from django.db.models.fields.files import ImageFieldFile
+
+# Content-addressed uploads: files are stored under the SHA-256 of their
+# content, so identical uploads are written once and shared by every row
+# referencing them. The upload handlers hash files while they stream in,
+# other files are hashed when saved.
+#
+# Referencing a stored file and deleting an unreferenced one both happen
+# under lock_content(), so an upload never shares a file whose last row
+# is being deleted (see store.signals.handlers.release_image_files).
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def lock_content(digest):
+    """Lock the files stored for `digest` until the transaction ends.
+
+    Lock rows are created on first use and kept, so a waiting lock never
+    finds its row gone.
+    """
+    ContentLock = apps.get_model('store', 'ContentLock')
+    ContentLock.objects.bulk_create([ContentLock(content_hash=digest)], ignore_conflicts=True)
+    ContentLock.objects.select_for_update().get(content_hash=digest)
+
+
+class HashingUploadMixin:
+    """Set `content_hash` on the uploaded files of a FileUploadHandler."""
+    def new_file(self, *args, **kwargs):
+        # Set first, the memory handler raises StopFutureHandlers
+        self.hash = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            # This handler kept the chunk
+            self.hash.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hash.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+class ContentAddressedFieldFile(ImageFieldFile):
+    def save(self, name, content, save=True):
+        digest = getattr(content, 'content_hash', None) or content_hash(content)
+        extension = os.path.splitext(name)[1].lower()
+        name = f'{digest[:2]}/{digest}{extension}'
+        if self.field.hash_field:
+            setattr(self.instance, self.field.hash_field, digest)
+        path = self.field.generate_filename(self.instance, name)
+        with transaction.atomic():
+            # Held until the row referencing the file is saved, or until
+            # it commits when saved in the model's transaction
+            lock_content(digest)
+            if not self.storage.exists(path):
+                return super().save(name, content, save)
+            # Already stored, only reference it
+            self.name = path
+            setattr(self.instance, self.field.attname, self.name)
+            self._committed = True
+            if save:
+                self.instance.save()
+
+    save.alters_data = True
+
+
+class ContentAddressedImageField(models.ImageField):
+    """ImageField storing files once per content, named `<upload_to>/ab/abcd...`.
+
+    `hash_field` names a model field to store the content hash in.
+    Files are shared between rows, so they are never deleted with a row;
+    see store.signals.handlers.release_image_files.
+    """
+    attr_class = ContentAddressedFieldFile
+
+    def __init__(self, *args, hash_field=None, **kwargs):
+        self.hash_field = hash_field
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.hash_field:
+            kwargs['hash_field'] = self.hash_field
+        return name, path, args, kwargs
@@ -4,5 +4,9 @@
 def validate_file_size(file):
     max_size_kb = 500
 
+    # Stored files were checked on upload, their size would be a storage call
+    if getattr(file, '_committed', False):
+        return
+    # Uploads know their size, nothing is read
     if file.size > max_size_kb * 1024:
         raise ValidationError('File size must be less than {} kB'.format(max_size_kb))
\ No newline at end of file
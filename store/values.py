@@ -0,0 +1,181 @@
+from collections import defaultdict
+
+from django.conf import settings
+from rest_framework import permissions
+
+from store.images import variant_urls
+from store.models import CartItem, Product, ProductImage
+from store.serializers import CartSerializer, ProductSerializer
+from tags.models import TaggedItem
+
+# Read-only serializers building the exact output of their ModelSerializer
+# counterparts from QuerySet.values() rows, without per-row field objects
+# or model instances. Keep them in sync with store.serializers.
+
+
+class ValuesSerializer:
+    serializer_class = None
+    # Output fields, in order, and the values() columns each one reads
+    values_fields = {}
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        self.fields = self.get_fields(self.context.get('request'))
+
+    @classmethod
+    def get_fields(cls, request):
+        """Output fields selected with ?fields= / ?omit=, as in `serializer_class`."""
+        selected = None
+        if cls.serializer_class is not None:
+            selected = cls.serializer_class.get_sparse_fields(request)
+        return list(cls.values_fields) if selected is None else selected
+
+    @classmethod
+    def values(cls, queryset, request=None):
+        # Rows are always keyed by id
+        columns = ['id']
+        for name in cls.get_fields(request):
+            columns += [column for column in cls.values_fields[name] if column not in columns]
+        return queryset.prefetch_related(None).values(*columns)
+
+    def to_representation(self, rows):
+        raise NotImplementedError
+
+    @property
+    def data(self):
+        rows = list(self.instance) if self.many else [self.instance]
+        data = self.to_representation(rows)
+        if list(self.values_fields) != self.fields:
+            data = [{name: item[name] for name in self.fields} for item in data]
+        return data if self.many else data[0]
+
+
+class CollectionValuesSerializer(ValuesSerializer):
+    values_fields = {'id': ['id'], 'title': ['title'], 'products_count': ['products_count']}
+
+    def to_representation(self, rows):
+        return [{'id': row['id'], 'title': row['title'], 'products_count': row['products_count']}
+                for row in rows]
+
+
+def isoformat(value):
+    # As serializers.DateField renders dates
+    return value.isoformat() if value is not None else None
+
+
+class ProductValuesSerializer(ValuesSerializer):
+    serializer_class = ProductSerializer
+    values_fields = {
+        'id': ['id'],
+        'title': ['title'],
+        'unit_price': ['unit_price'],
+        'effective_price': ['effective_price'],
+        'inventory': ['inventory'],
+        'price_with_tax': ['price_with_tax'],
+        'collection': ['collection__title'],
+        'reviews_count': ['reviews_count'],
+        'last_review_at': ['last_review_at'],
+        'tags': [],
+        'images': [],
+    }
+
+    def get_images(self, product_ids):
+        storage = ProductImage._meta.get_field('image').storage
+        request = self.context.get('request')
+        images = defaultdict(list)
+        for product_id, id, name, variants in ProductImage.objects \
+                .filter(product_id__in=product_ids) \
+                .order_by('id') \
+                .values_list('product_id', 'id', 'image', 'variants'):
+            url = None
+            if name:
+                url = storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+            images[product_id].append({'id': id, 'image': url, 'variants': variant_urls(variants, request)})
+        return images
+
+    def to_representation(self, rows):
+        images = tags = {}
+        if 'images' in self.fields:
+            images = self.get_images([row['id'] for row in rows])
+        if 'tags' in self.fields:
+            tags = TaggedItem.objects.get_tags_for_many(Product, [row['id'] for row in rows])
+        # Omitted columns are missing from the rows and dropped again in data
+        return [{
+            'id': row['id'],
+            'title': row.get('title'),
+            'unit_price': row.get('unit_price'),
+            'effective_price': row.get('effective_price'),
+            'inventory': row.get('inventory'),
+            'price_with_tax': row.get('price_with_tax'),
+            'collection': row.get('collection__title'),
+            'reviews_count': row.get('reviews_count'),
+            'last_review_at': isoformat(row.get('last_review_at')),
+            'tags': tags.get(row['id'], []),
+            'images': images.get(row['id'], []),
+        } for row in rows]
+
+
+class CartValuesSerializer(ValuesSerializer):
+    serializer_class = CartSerializer
+    values_fields = {'id': ['id'], 'items': [], 'total_price': ['total_price']}
+
+    def to_representation(self, rows):
+        items = defaultdict(list)
+        if 'items' in self.fields:
+            items = self.get_items([row['id'] for row in rows])
+        return [{
+            'id': str(row['id']),
+            'items': items[row['id']],
+            'total_price': row.get('total_price'),
+        } for row in rows]
+
+    def get_items(self, cart_ids):
+        items = defaultdict(list)
+        for item in CartItem.objects \
+                .with_totals() \
+                .filter(cart_id__in=cart_ids) \
+                .order_by('id') \
+                .values('id', 'cart_id', 'quantity', 'product_id', 'product__title',
+                        'product__unit_price', 'product__inventory', 'total_price'):
+            items[item['cart_id']].append({
+                'id': item['id'],
+                'product': {
+                    'id': item['product_id'],
+                    'title': item['product__title'],
+                    'unit_price': item['product__unit_price'],
+                    'inventory': item['product__inventory'],
+                },
+                'quantity': item['quantity'],
+                'total_price': item['total_price'],
+            })
+        return items
+
+
+class ValuesReadMixin:
+    """Use `values_serializer_class` for list and retrieve GET requests.
+
+    The queryset is narrowed to the serializer's values() columns, down
+    to the fields selected with ?fields= / ?omit=.
+    """
+    values_serializer_class = None
+
+    def use_values_serializer(self):
+        return (settings.STORE_VALUES_SERIALIZATION
+                and self.request is not None
+                and self.request.method in permissions.SAFE_METHODS
+                and self.action in ('list', 'retrieve'))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.use_values_serializer():
+            return self.values_serializer_class.values(queryset, self.request)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.use_values_serializer():
+            return self.values_serializer_class
+        return super().get_serializer_class()
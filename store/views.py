@@ -1,25 +1,37 @@
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
 from django.db.models.aggregates import Count
 from django.shortcuts import get_object_or_404
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, UpdateModelMixin
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser, DjangoModelPermissionsOrAnonReadOnly
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
 import stripe
+from uuid import UUID, uuid4
 from django.conf import settings
 from rest_framework.decorators import api_view, action, permission_classes
 
-from store.models import Product, Collection, OrderItem, Review, Cart, CartItem, Customer, Order, ProductImage, Address
-from django.http import HttpResponse
+from store.models import Product, Collection, OrderItem, Review, Cart, CartItem, Customer, Order, ProductImage, Address, \
+    RelatedProduct
+from django.http import Http404, HttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-
-from .filters import ProductFilter
-from .pagination import DefaultPagination
+from likes import counters
+
+from .cache import CatalogCacheMixin, ConditionalGetMixin, get_cache_stats, get_catalog_version, \
+    get_collection_version, get_cart_summary, get_cart_version, get_ranking_version, get_reviews_version
+from .fieldsets import SparseFieldsetViewMixin
+from . import bestsellers, carts, exports, facets, imports, inventory, recommendations, suggest
+from .filters import ProductFilter, ProductSearchFilter
+from .pagination import DefaultPagination, DefaultKeysetPagination, KeysetPagination, ReviewPagination
 from .permissions import IsAdminOrReadOnly, FullDjangoModelPermissions, ViewCustomerHistoryPermissions
+from .snapshot import CatalogSnapshotMixin
+from .values import ValuesReadMixin, ProductValuesSerializer, CollectionValuesSerializer, CartValuesSerializer
 from .serializers import ProductSerializer, CollectionSerializer, ReviewSerializer, CartSerializer, CartItemSerializer, \
     AddCartItemSearializer, UpdateCartItemSerializer, CustomerSerializer, OrderSerializer, CreateOrderSerializer, \
-    UpdateOrderSerializer, ProductImageSerializer, AddressSerializer, GuestOrderSerializer
+    UpdateOrderSerializer, ProductImageSerializer, AddressSerializer, GuestOrderSerializer, RedisCartItemSerializer, \
+    CartBatchSerializer
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, action
 from rest_framework import status
@@ -30,18 +42,46 @@ from rest_framework.filters import SearchFilter, OrderingFilter
 # ViewSet can create, update, delete ...
 # If u dont want do this operations ^
 # Use ReadOnlyModelViewSet - can't update, delete ...
-class ProductViewSet(ModelViewSet):
-    queryset = Product.objects.prefetch_related('images').all()
+class ProductViewSet(ConditionalGetMixin, CatalogCacheMixin, CatalogSnapshotMixin, ValuesReadMixin,
+                     SparseFieldsetViewMixin, ModelViewSet):
+    # Images and the collection are loaded by ProductSerializer.narrow_queryset()
+    queryset = Product.objects.with_prices().all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    values_serializer_class = ProductValuesSerializer
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
     filterset_class = ProductFilter
-    pagination_class = DefaultPagination
+    pagination_class = DefaultKeysetPagination
     permission_classes = [IsAdminOrReadOnly]
     search_fields = ['title', 'description']
-    ordering_fields = ['unit_price', 'last_update']
+    ordering_fields = ['unit_price', 'effective_price', 'last_update']
+    conditional_actions = ('list', 'retrieve', 'facets', 'related', 'bestsellers')
+    # Recounted by their own jobs, independently of the catalog
+    ranking_actions = {'related': recommendations.CHECKPOINT, 'bestsellers': bestsellers.CHECKPOINT}
 
     def get_serializer_context(self):
         return {'request': self.request}
+
+    def get_cache_version(self):
+        version = super().get_cache_version()
+        if self.action in self.ranking_actions:
+            version += f':r{get_ranking_version(self.ranking_actions[self.action])}'
+        return version
+
+    def get_conditional_state(self):
+        if self.action != 'retrieve':
+            return self.get_cache_version(), None
+        try:
+            product = Product.objects \
+                .filter(pk=self.kwargs['pk']) \
+                .values('last_update', 'collection_id') \
+                .first()
+        except (ValueError, TypeError, ValidationError):
+            product = None
+        if product is None:
+            return None, None
+        version = get_collection_version(product['collection_id'])
+        return f"{product['last_update'].isoformat()}:{version}", product['last_update']
+
     # Delete using def destroy
     # We dont need Delete in 'products/'
     # Overwrite func
@@ -50,6 +90,92 @@ class ProductViewSet(ModelViewSet):
             return Response({'error':'Product assosiated with oredr item'})
         return super().destroy(request, *args, **kwargs)
 
+    @action(detail=False)
+    def facets(self, request):
+        return self.cached_response(self.get_facets, request)
+
+    def get_facets(self, request):
+        edges = facets.parse_price_edges(request.query_params.get('price_buckets'))
+        queryset = self.filter_queryset(Product.objects.with_prices())
+        return Response(facets.product_facets(queryset, edges))
+
+    @action(detail=True)
+    def related(self, request, pk=None):
+        return self.cached_response(self.get_related, request, pk)
+
+    def get_related(self, request, pk):
+        # Frequently bought together, counted by store.tasks.update_related_products
+        if not pk.isdigit() or not Product.objects.filter(pk=pk).exists():
+            raise Http404
+        ids = list(RelatedProduct.objects
+                   .filter(product_id=pk)
+                   .order_by('-orders', 'related_id')
+                   .values_list('related_id', flat=True)[:settings.STORE_RELATED_PRODUCTS_LIMIT])
+        return self.ordered_response(ids)
+
+    def ordered_response(self, ids):
+        products = {product.pk: product for product in self.get_queryset().filter(pk__in=ids)}
+        serializer = self.get_serializer([products[id] for id in ids if id in products], many=True)
+        return Response(serializer.data)
+
+    @action(detail=False)
+    def bestsellers(self, request):
+        return self.cached_response(self.get_bestsellers, request)
+
+    def get_bestsellers(self, request):
+        ordering, limit = bestsellers.parse_params(request.query_params)
+        return self.ordered_response(bestsellers.top_product_ids(ordering, limit))
+
+    @action(detail=True, methods=['POST', 'DELETE'], permission_classes=[IsAuthenticated])
+    def like(self, request, pk=None):
+        if not pk.isdigit() or not Product.objects.filter(pk=pk).exists():
+            raise Http404
+        product = Product(pk=int(pk))
+        if request.method == 'POST':
+            counters.like(request.user, product)
+        else:
+            counters.unlike(request.user, product)
+        # Counted once the like commits, so read the count afterwards
+        return Response({'liked': request.method == 'POST',
+                         'likes_count': counters.get_counts(Product, [product.pk])[product.pk]})
+
+    @action(detail=False)
+    def likes(self, request):
+        # Like counts and the user's "liked" flags for a page of products, kept
+        # out of the shared cached product payloads; two queries per request
+        ids = counters.parse_ids(request.query_params.get('ids'))
+        counts = counters.get_counts(Product, ids)
+        liked = counters.get_liked(request.user, Product, ids)
+        return Response([{'id': id, 'likes_count': counts[id], 'liked': id in liked} for id in ids])
+
+    @action(detail=False)
+    def suggest(self, request):
+        # Served from the in-process title index, no database query once it is loaded
+        limit = suggest.parse_limit(request.query_params.get('limit'))
+        return Response(suggest.suggest(request.query_params.get('q', ''), limit))
+
+    @action(detail=False, url_path='cache-stats', permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        return Response(get_cache_stats())
+
+    @action(detail=False, methods=['POST'], url_path='import', permission_classes=[IsAdminUser],
+            parser_classes=[MultiPartParser])
+    def import_products(self, request):
+        feed = request.FILES.get('file')
+        if feed is None:
+            return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        format = request.data.get('format') or imports.get_format(feed.name)
+        try:
+            report = imports.import_products(imports.open_text(feed.file), format)
+        except imports.FeedError as error:
+            return Response({'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+
+    @action(detail=False, url_path='export', permission_classes=[IsAdminUser],
+            renderer_classes=[exports.NDJSONRenderer, exports.CSVRenderer])
+    def export(self, request):
+        return exports.export_response('products', request.accepted_renderer.format)
+
 class ProductImageViewSet(ModelViewSet):
     serializer_class = ProductImageSerializer
 
@@ -60,12 +186,31 @@ class ProductImageViewSet(ModelViewSet):
     def get_queryset(self):
         return ProductImage.objects.filter(product_id=self.kwargs['product_pk'])
 
-class CollectionViewSet(ModelViewSet):
-    queryset = Collection.objects.annotate(
-        products_count=Count('products')).all()
+class CollectionViewSet(ConditionalGetMixin, ValuesReadMixin, ModelViewSet):
+    queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
+    values_serializer_class = CollectionValuesSerializer
     permission_classes = [IsAdminOrReadOnly]
 
+    conditional_actions = ('list', 'retrieve', 'bestsellers')
+
+    def get_conditional_state(self):
+        # Titles and product counts change with the catalog version
+        if self.action == 'bestsellers':
+            return f'{get_catalog_version()}:{get_ranking_version(bestsellers.CHECKPOINT)}', None
+        return get_catalog_version(), None
+
+    @action(detail=True)
+    def bestsellers(self, request, pk=None):
+        collection = self.get_object()
+        ordering, limit = bestsellers.parse_params(request.query_params)
+        ids = bestsellers.top_product_ids(ordering, limit, collection_id=collection.pk)
+        queryset = ProductSerializer.narrow_queryset(Product.objects.with_prices(), request)
+        products = {product.pk: product for product in queryset.filter(pk__in=ids)}
+        serializer = ProductSerializer([products[id] for id in ids if id in products], many=True,
+                                       context={'request': request})
+        return Response(serializer.data)
+
     # Delete using def destroy
     # We dont need Delete in 'collections/'
     # Overwrite func
@@ -75,22 +220,79 @@ class CollectionViewSet(ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(ConditionalGetMixin, ModelViewSet):
     serializer_class = ReviewSerializer
+    pagination_class = ReviewPagination
+
+    def get_conditional_state(self):
+        return get_reviews_version(self.kwargs['product_pk']), None
 
     def get_queryset(self):
-        return Review.objects.filter(product_id = self.kwargs['product_pk'])
+        return Review.objects.filter(product_id = self.kwargs['product_pk']).order_by('-date', '-id')
 
     def get_serializer_context(self):
         return {'product_id': self.kwargs['product_pk']}
 
 # custom VieSet bcs we dont need everything
-class CartViewSet(CreateModelMixin,
+class CartViewSet(ConditionalGetMixin,
+                  ValuesReadMixin,
+                  SparseFieldsetViewMixin,
+                  CreateModelMixin,
                   RetrieveModelMixin,
                   DestroyModelMixin,
                   GenericViewSet):
-    queryset = Cart.objects.prefetch_related('items__product').all()
+    # Items are prefetched by CartSerializer.narrow_queryset(), totals summed in SQL
+    queryset = Cart.objects.with_totals()
     serializer_class = CartSerializer
+    values_serializer_class = CartValuesSerializer
+    conditional_actions = ('retrieve', 'summary')
+
+    def get_conditional_state(self):
+        if self.action == 'summary' and not carts.redis_enabled():
+            return get_cart_version(self.kwargs['pk']), None
+        # Items embed product titles and prices, so the catalog counts too
+        # (price changes only find the carts stored in the database)
+        return f"{get_cart_version(self.kwargs['pk'])}:{get_catalog_version()}", None
+
+    # Carts held in Redis (STORE_CART_BACKEND = 'redis') are served by store.carts
+
+    def create(self, request, *args, **kwargs):
+        if not carts.redis_enabled():
+            return super().create(request, *args, **kwargs)
+        cart = carts.RedisCart.create(uuid4())
+        return Response(cart.render(), status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        cart = carts.get_redis_cart(kwargs['pk'])
+        if cart is None:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(cart.render())
+
+    def destroy(self, request, *args, **kwargs):
+        cart = carts.get_redis_cart(kwargs['pk'])
+        if cart is None:
+            return super().destroy(request, *args, **kwargs)
+        cart.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True)
+    def summary(self, request, pk=None):
+        cart = carts.get_redis_cart(pk)
+        if cart is not None:
+            return Response(cart.summary())
+        # Polled by the cart badge, a cache read per request until the cart changes
+        try:
+            UUID(pk)
+        except ValueError:
+            raise Http404
+        summary = get_cart_summary(pk, lambda: Cart.objects
+                                   .with_totals()
+                                   .filter(pk=pk)
+                                   .values('items_count', 'total_price')
+                                   .first())
+        if summary is None:
+            raise Http404
+        return Response(summary)
 
 class CartItemViewSet(ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
@@ -107,9 +309,77 @@ class CartItemViewSet(ModelViewSet):
 
     def get_queryset(self):
         return (CartItem.objects\
+                .with_totals()\
                 .filter(cart_id = self.kwargs['cart_pk']))\
                 .select_related('product')
 
+    # Items of carts held in Redis are identified by their product id
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.redis_cart = carts.get_redis_cart(kwargs['cart_pk'])
+
+    def get_redis_item(self, pk):
+        items = self.redis_cart.get_items(int(pk)) if pk.isdigit() else []
+        if not items:
+            raise Http404
+        return items[0]
+
+    def list(self, request, *args, **kwargs):
+        if self.redis_cart is None:
+            return super().list(request, *args, **kwargs)
+        return Response(self.redis_cart.get_items())
+
+    def retrieve(self, request, *args, **kwargs):
+        if self.redis_cart is None:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(self.get_redis_item(kwargs['pk']))
+
+    def create(self, request, *args, **kwargs):
+        if self.redis_cart is None:
+            return super().create(request, *args, **kwargs)
+        serializer = RedisCartItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        product_id = serializer.validated_data['product_id']
+        quantity = self.redis_cart.add(product_id, serializer.validated_data['quantity'])
+        return Response({'id': product_id, 'product_id': product_id, 'quantity': quantity},
+                        status=status.HTTP_201_CREATED)
+
+    def partial_update(self, request, *args, **kwargs):
+        if self.redis_cart is None:
+            return super().partial_update(request, *args, **kwargs)
+        serializer = UpdateCartItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if not kwargs['pk'].isdigit() \
+                or not self.redis_cart.set(int(kwargs['pk']), serializer.validated_data['quantity']):
+            raise Http404
+        return Response(serializer.data)
+
+    def destroy(self, request, *args, **kwargs):
+        if self.redis_cart is None:
+            return super().destroy(request, *args, **kwargs)
+        if not kwargs['pk'].isdigit() or not self.redis_cart.remove(int(kwargs['pk'])):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['POST'])
+    def batch(self, request, cart_pk=None):
+        # Several add/set/remove operations in one request, returns the cart
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+        if self.redis_cart is not None:
+            self.redis_cart.apply(operations)
+            return Response(self.redis_cart.render())
+        try:
+            UUID(cart_pk)
+        except ValueError:
+            raise Http404
+        if not carts.apply_to_cart(cart_pk, operations):
+            raise Http404
+        cart = CartSerializer.narrow_queryset(Cart.objects.with_totals(), request).get(pk=cart_pk)
+        return Response(CartSerializer(cart, context={'request': request}).data)
+
 class CustomerViewSet(ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
@@ -134,6 +404,8 @@ class CustomerViewSet(ModelViewSet):
             cart = None
 
             if cart_id_from_session:
+                # Carts held in Redis become rows when their owner logs in
+                carts.materialize(cart_id_from_session)
                 try:
                     # Spróbuj pobrać anonimowy koszyk
                     temp_cart = Cart.objects.get(pk=cart_id_from_session, customer__isnull=True)
@@ -179,13 +451,21 @@ class CustomerViewSet(ModelViewSet):
 
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(SparseFieldsetViewMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+    pagination_class = KeysetPagination
+    cursor_ordering = '-placed_at'
+
     def get_permissions(self):
-        if self.request.method in ['PATCH', 'PUT', 'DELETE']:
+        if self.request.method in ['PATCH', 'PUT', 'DELETE'] or self.action == 'export':
             return [IsAdminUser()]
         return [IsAuthenticated()]
 
+    @action(detail=False, url_path='export',
+            renderer_classes=[exports.NDJSONRenderer, exports.CSVRenderer])
+    def export(self, request):
+        return exports.export_response('orders', request.accepted_renderer.format)
+
     def create(self, request, *args, **kwargs):
         serializer = CreateOrderSerializer(
             data=request.data,
@@ -446,8 +726,11 @@ def cancel_order(request):
         if order.payment_status != Order.PAYMENT_STATUS_PENDING:
             return Response({'error': 'Cannot cancel completed order'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Delete the pending order
-        order.delete()
+        # Return the held items to stock and delete the pending order
+        with transaction.atomic():
+            inventory.release(order.pk)
+            order.items.all().delete()
+            order.delete()
         
         return Response({'message': 'Order cancelled successfully'})
         
@@ -506,8 +789,7 @@ def payment_success(request):
             # This is a fallback for when webhook might have already processed it
             if order.payment_status == Order.PAYMENT_STATUS_PENDING:
                 print("Stripe verification failed, but order is pending. Completing order anyway.")
-                order.payment_status = Order.PAYMENT_STATUS_COMPLETE
-                order.save()
+                order = inventory.commit(order.pk)
                 print(f'Order {order_id} status updated to: {order.payment_status}')
                 
                 # Clear cart
@@ -532,8 +814,7 @@ def payment_success(request):
             print(f'Payment verified for order {order_id}')
             
             # Update order status to COMPLETE
-            order.payment_status = Order.PAYMENT_STATUS_COMPLETE
-            order.save()
+            order = inventory.commit(order.pk)
             print(f'Order {order_id} status updated to: {order.payment_status}')
             
             # Clear the cart now that payment is successful
@@ -592,8 +873,7 @@ def complete_order(request):
             return Response({'error': 'Order is not pending'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Complete the order
-        order.payment_status = Order.PAYMENT_STATUS_COMPLETE
-        order.save()
+        order = inventory.commit(order.pk)
         print(f'Order {order_id} manually completed')
         
         # Clear cart
@@ -791,8 +1071,7 @@ def guest_payment_success(request):
             # Fallback for guest orders
             if order.payment_status == Order.PAYMENT_STATUS_PENDING:
                 print("Stripe verification failed for guest, but order is pending. Completing order anyway.")
-                order.payment_status = Order.PAYMENT_STATUS_COMPLETE
-                order.save()
+                order = inventory.commit(order.pk)
                 print(f'Guest order {order_id} status updated to: {order.payment_status}')
                 
                 # Clear the anonymous cart if it exists
@@ -818,8 +1097,7 @@ def guest_payment_success(request):
             print(f'Payment verified for guest order {order_id}')
             
             # Update order status to COMPLETE
-            order.payment_status = Order.PAYMENT_STATUS_COMPLETE
-            order.save()
+            order = inventory.commit(order.pk)
             print(f'Guest order {order_id} status updated to: {order.payment_status}')
             
             # For guest orders, we don't have a permanent cart to clear
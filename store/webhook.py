@@ -3,6 +3,7 @@ import os
 import stripe
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from . import inventory
 from .models import Order  # Import the Order model
 
 endpoint_secret = os.getenv('STRIPE_WEBHOOK_SECRET_TEST')
@@ -78,8 +79,7 @@ def my_webhook_view(request):
                 order = Order.objects.get(id=order_id)
                 print(f'Found order {order_id}, current status: {order.payment_status}')
                 
-                order.payment_status = Order.PAYMENT_STATUS_COMPLETE
-                order.save()
+                order = inventory.commit(order.pk)
                 print(f'Order {order_id} status updated to: {order.payment_status}')
                 
                 # Clear the cart now that payment is successful
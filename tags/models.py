@@ -1,3 +1,4 @@
+from collections import defaultdict
 
 from django.db import models
 from django.contrib.contenttypes.models import ContentType
@@ -13,8 +14,33 @@ class TaggedItemMenager(models.Manager):
                 content_type=content_type,
                 object_id=object_id,
        )
+
+    def get_tags_for_many(self, object_type, object_ids):
+        """Tag labels by object id for many objects, in one query.
+
+        get_for_model() is served from the ContentType cache.
+        """
+        content_type = ContentType.objects.get_for_model(object_type)
+        tags = defaultdict(list)
+        for object_id, label in TaggedItem.objects \
+                .filter(content_type=content_type, object_id__in=list(object_ids)) \
+                .order_by('tag__label') \
+                .values_list('object_id', 'tag__label'):
+            tags[object_id].append(label)
+        return tags
+
+    def prefetch_tags(self, objects, attr='tag_labels'):
+        """Set `attr` on model instances (such as a page of results) to their tag labels."""
+        objects = list(objects)
+        if objects:
+            tags = self.get_tags_for_many(type(objects[0]), [obj.pk for obj in objects])
+            for obj in objects:
+                setattr(obj, attr, tags.get(obj.pk, []))
+        return objects
+
+
 class Tag(models.Model):
-    label = models.CharField(max_length=255)
+    label = models.CharField(max_length=255, db_index=True)
 
     def __str__(self)->str:
         return self.label
@@ -27,4 +53,12 @@ class TaggedItem(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
 
+    class Meta:
+        indexes = [
+            # Tags of a page of objects
+            models.Index(fields=['content_type', 'object_id']),
+            # Objects with a tag (filters)
+            models.Index(fields=['tag', 'content_type', 'object_id']),
+        ]
+
 